@@ -11,7 +11,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Validate required environment variables
-required_env_vars = ['GEMINI_API_KEY', 'OPENWEATHER_API_KEY']
+required_env_vars = ['OPENWEATHER_API_KEY']
+# The offline stub LLM backend needs no Gemini key
+if os.getenv('CHATBOT_LLM_BACKEND', 'gemini').lower() != 'stub':
+    required_env_vars.insert(0, 'GEMINI_API_KEY')
 missing_vars = [var for var in required_env_vars if not os.getenv(var)]
 
 if missing_vars:
@@ -35,6 +38,10 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 # Import and run the Flask app
 from backend.app import app
+from backend.asgi import build_asgi_app
+
+# ASGI entry point for uvicorn (see Procfile): /api/chatbot on the event loop, the rest through Flask
+asgi_app = build_asgi_app(app)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,139 @@
+"""
+End-to-end benchmark of POST /api/chatbot, async path against the blocking view, with a stubbed LLM.
+
+Starts the real app (app:asgi_app) under uvicorn twice with the same server configuration
+(--workers processes, each with --threads WSGI threads): once with /api/chatbot served on the
+event loop (CHATBOT_ASYNC=true) and once from the blocking Flask view on the WSGI threads
+(CHATBOT_ASYNC=false), the way every other route is served. Every LLM call is answered by
+StubLLMClient after --latency-ms, so the numbers measure how many waiting turns the server can
+hold, not Gemini. While the chatbot load runs, GET /api/health is probed to show whether the
+other endpoints still get a thread.
+
+Usage:
+    python scripts/bench_chatbot.py --turns 400 --concurrency 64 --latency-ms 200
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(async_chatbot, workers, threads, latency_ms):
+    port = _free_port()
+    env = {
+        **os.environ,
+        'CHATBOT_ASYNC': 'true' if async_chatbot else 'false',
+        'WEB_CONCURRENCY': str(workers),
+        'WSGI_THREADS': str(threads),
+        'CHATBOT_LLM_BACKEND': 'stub',
+        'CHATBOT_STUB_LATENCY_MS': str(latency_ms),
+        'CHATBOT_CACHE_TTL': '0',
+        'WEATHER_PREFETCH': 'false',
+        'OPENWEATHER_API_KEY': os.environ.get('OPENWEATHER_API_KEY', 'bench'),
+    }
+    cmd = [sys.executable, '-m', 'uvicorn', 'app:asgi_app', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(workers), '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        try:
+            if requests.get(f'{url}/api/health', timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not become ready within 120s")
+
+
+def drive(url, turns, concurrency):
+    """
+    Send `turns` chatbot requests from `concurrency` clients while probing /api/health;
+    returns (elapsed, turn latencies, errors, health latencies)
+    """
+    def turn(i):
+        start = time.perf_counter()
+        try:
+            response = requests.post(f'{url}/api/chatbot', timeout=120, json={
+                'message': f"bench question {i}: what would you tell a visitor about village life"
+            })
+            ok = response.ok and response.json().get('success', False)
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    health = []
+    stop = threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            requests.get(f'{url}/api/health', timeout=120)
+            health.append(time.perf_counter() - start)
+            stop.wait(0.05)
+
+    # One request per client first, so worker start-up is not part of the measurement
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(turn, range(concurrency)))
+        prober = threading.Thread(target=probe, daemon=True)
+        prober.start()
+        start = time.perf_counter()
+        results = list(pool.map(turn, range(turns)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+    return elapsed, [seconds for seconds, _ in results], sum(1 for _, ok in results if not ok), health
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+
+def _report(label, elapsed, latencies, errors, health):
+    print(f"{label:<22} {len(latencies) / elapsed:7.1f} turns/s   median {statistics.median(latencies) * 1000:6.0f} ms   "
+          f"p95 {_percentile(latencies, 0.95) * 1000:6.0f} ms   errors {errors}   "
+          f"/api/health median {statistics.median(health) * 1000:6.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark async against blocking /api/chatbot under the same uvicorn setup")
+    parser.add_argument('--turns', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64, help="concurrent clients, the same for both runs")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help="WSGI threads per worker")
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="stubbed latency of every LLM call")
+    parser.add_argument('--paths', default='async,sync', help="comma-separated /api/chatbot paths to run")
+    args = parser.parse_args()
+
+    print(f"{args.turns} turns, {args.concurrency} concurrent clients, {args.latency_ms:.0f} ms per LLM call, "
+          f"{args.workers} workers x {args.threads} WSGI threads")
+    for path in args.paths.split(','):
+        proc, url = start_server(path == 'async', args.workers, args.threads, args.latency_ms)
+        try:
+            _report(f"{path} /api/chatbot", *drive(url, args.turns, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,10 @@ import json
 from werkzeug.security import generate_password_hash, check_password_hash
 import logging
 from src.backend.chatbot.gemini_chatbot import integrate_chatbot_with_flask
-from src.backend.utils.weather_api import get_weather_data, get_weather_forecast, WeatherAPIWrapper
+from src.backend.utils.weather_api import get_weather_data, get_weather_forecast, get_weather_forecasts, get_forecast_by_coordinates, weather_cache_stats, weather_provider_stats, weather_breaker_states, weather_prefetch_stats, weather_prefetcher, WEATHER_PREFETCH_LOCK, WeatherAPIWrapper
+from src.backend.utils.fertilizer import FertilizerTable, BlendOptimizer
+from src.backend.utils.attribution import describe_contributions
+from src.backend.utils.model_registry import CropModelRegistry
 
 # Create Flask app
 app = Flask(__name__, 
@@ -41,6 +44,14 @@ DB_PATH = os.path.join(project_root, 'data', 'feedback.db')
 model_path = os.path.join(project_root, 'models', 'crop_model.joblib')
 crop_model = joblib.load(model_path)
 
+# Per-region crop model variants, loaded lazily from <CROP_MODEL_DIR>/<region>.joblib
+crop_models = CropModelRegistry(
+    default_model=crop_model,
+    model_dir=os.environ.get('CROP_MODEL_DIR', os.path.join(project_root, 'models', 'regions')),
+    capacity=int(os.environ.get('CROP_MODEL_CACHE_SIZE', 4))
+)
+crop_models.default.warm()  # Build the default explainer up front, off the request path
+
 # Load features
 features_path = os.path.join(project_root, 'models', 'features.json')
 with open(features_path, 'r') as f:
@@ -50,6 +61,16 @@ with open(features_path, 'r') as f:
 fertilizer_path = os.path.join(project_root, 'data', 'fertilizer.csv')
 fertilizer_df = pd.read_csv(fertilizer_path)
 
+# Fertilizer product catalogue (nutrient fractions and cost per kg) for blend optimization
+fertilizer_products_path = os.path.join(project_root, 'data', 'fertilizer_products.csv')
+blend_optimizer = BlendOptimizer(pd.read_csv(fertilizer_products_path))
+fertilizer_table = FertilizerTable(fertilizer_df, optimizer=blend_optimizer)
+
+# Upper bound on records accepted by the batch endpoints
+MAX_BATCH_RECORDS = 1000
+MAX_FORECAST_LOCATIONS = 50
+CROP_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
 # ----------------------------
 # Plant Disease Detection
 # ----------------------------
@@ -107,46 +128,28 @@ def init_db():
 
 def recommend_fertilizer(crop, N, P, K):
     """Recommend fertilizer based on crop and current NPK levels"""
-    row = fertilizer_df[fertilizer_df['Crop'] == crop]
-    if row.empty:
-        return {"error": "Crop not found in fertilizer database"}
-    
-    # Get recommended NPK values for the crop
-    rec_N = row['N'].values[0]
-    rec_P = row['P'].values[0] 
-    rec_K = row['K'].values[0]
-    
-    # Calculate deficiencies
-    n_def = max(0, float(rec_N) - float(N))
-    p_def = max(0, float(rec_P) - float(P))
-    k_def = max(0, float(rec_K) - float(K))
-    
-    # Determine which nutrient is most deficient
-    max_def = max(n_def, p_def, k_def)
-    
-    if max_def == 0:
-        return {"message": "Soil nutrients are adequate for this crop", "type": "balanced"}
-    elif max_def == n_def:
-        return {
-            "type": "Nitrogen",
-            "deficiency": round(n_def, 2),
-            "recommendation": f"Add {round(n_def, 2)} units of Nitrogen fertilizer",
-            "fertilizer_type": "Urea or Ammonium Nitrate"
-        }
-    elif max_def == p_def:
-        return {
-            "type": "Phosphorus", 
-            "deficiency": round(p_def, 2),
-            "recommendation": f"Add {round(p_def, 2)} units of Phosphorus fertilizer",
-            "fertilizer_type": "DAP or Superphosphate"
-        }
-    else:
-        return {
-            "type": "Potassium",
-            "deficiency": round(k_def, 2), 
-            "recommendation": f"Add {round(k_def, 2)} units of Potassium fertilizer",
-            "fertilizer_type": "Potash or MOP"
-        }
+    return fertilizer_table.recommend_batch([crop], [[float(N), float(P), float(K)]])[0]
+
+def parse_top_k(value, model, default=3):
+    """Clamp a requested top_k to the number of crop classes"""
+    try:
+        k = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        k = default
+    return max(1, min(k, len(model.classes_)))
+
+def top_crop_indices(probabilities, k):
+    """Class indices of the k most probable crops, best first"""
+    return np.argsort(-probabilities, kind='stable')[:k]
+
+def resolve_crop_model(data):
+    """Pick the crop model for the request's region code (body or query string)"""
+    return crop_models.resolve(data.get('region', request.args.get('region')))
+
+def wants_explanation(data):
+    """True when the request asks for per-feature contributions"""
+    flag = data.get('explain', request.args.get('explain', False))
+    return str(flag).lower() in ['true', '1', 't', 'yes']
 
 # ----------------------------
 # Routes
@@ -174,7 +177,8 @@ def health():
         'status': 'ok',
         'model_loaded': True,
         'features_count': len(features),
-        'crop_classes': len(crop_model.classes_)
+        'crop_classes': len(crop_model.classes_),
+        'region_models': crop_models.stats()
     })
 
 @app.route('/api/predict/crop', methods=['POST'])
@@ -194,18 +198,81 @@ def predict_crop():
         ]]
         
         # Predict crops
-        predictions = crop_model.predict_proba(input_data)[0]
-        crop_classes = crop_model.classes_
-        top_predictions = sorted(
-            [{'crop': crop_classes[i], 'probability': predictions[i]} for i in range(len(crop_classes))],
-            key=lambda x: x['probability'], reverse=True
-        )[:3]
+        resolved = resolve_crop_model(data)
+        predictions = resolved.model.predict_proba(input_data)[0]
+        crop_classes = resolved.model.classes_
+        top_indices = top_crop_indices(predictions, 3)
+        top_predictions = [{'crop': crop_classes[i], 'probability': predictions[i]} for i in top_indices]
+
+        explainer = resolved.explainer if wants_explanation(data) else None
+        if explainer is not None:
+            contributions = explainer.explain(np.asarray(input_data, dtype=float))[0]
+            explanations = describe_contributions(contributions, CROP_FEATURES, top_indices, explainer.bias)
+            for prediction, explanation in zip(top_predictions, explanations):
+                prediction.update(explanation)
         
-        return jsonify({'success': True, 'predictions': top_predictions})
+        return jsonify({'success': True, 'predictions': top_predictions, 'region': resolved.region})
     except Exception as e:
         app.logger.error(f"Error in /api/predict/crop: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'An internal error occurred while predicting the crop.'}), 500
 
+@app.route('/api/predict/crop/batch', methods=['POST'])
+def predict_crop_batch():
+    """Score many soil/climate records in one model call, optionally with attributions"""
+    try:
+        data = request.get_json(silent=True)
+        options = data if isinstance(data, dict) else {}
+        records = options.get('records') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not records:
+            return jsonify({'success': False, 'error': 'Expected a non-empty array of soil/climate records'}), 400
+        if len(records) > MAX_BATCH_RECORDS:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_RECORDS} records are allowed per request'}), 400
+        if not all(isinstance(record, dict) for record in records):
+            return jsonify({'success': False, 'error': f'Each record must be an object with {", ".join(CROP_FEATURES)}'}), 400
+
+        frame = pd.DataFrame.from_records(records).reindex(columns=CROP_FEATURES)
+        inputs = frame.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        valid = ~np.isnan(inputs).any(axis=1)
+        resolved = resolve_crop_model(options)
+        model = resolved.model
+        top_k = parse_top_k(options.get('top_k', request.args.get('top_k')), model)
+
+        probabilities = np.zeros((len(inputs), len(model.classes_)))
+        explainer = resolved.explainer if wants_explanation(options) else None
+        contributions = None
+        if valid.any():
+            probabilities[valid] = model.predict_proba(inputs[valid])
+            if explainer is not None:
+                contributions = np.zeros((len(inputs), len(CROP_FEATURES), len(model.classes_)))
+                contributions[valid] = explainer.explain(inputs[valid])
+
+        top = np.argsort(-probabilities, axis=1, kind='stable')[:, :top_k]
+        results = []
+        for i in range(len(inputs)):
+            if not valid[i]:
+                results.append({'index': i, 'error': f'All of {", ".join(CROP_FEATURES)} must be numeric'})
+                continue
+            predictions = [
+                {'crop': str(model.classes_[c]), 'probability': float(probabilities[i, c])}
+                for c in top[i]
+            ]
+            if contributions is not None:
+                explanations = describe_contributions(contributions[i], CROP_FEATURES, top[i], explainer.bias)
+                for prediction, explanation in zip(predictions, explanations):
+                    prediction.update(explanation)
+            results.append({'index': i, 'predictions': predictions})
+
+        return jsonify({
+            'success': True,
+            'data': results,
+            'count': len(results),
+            'errors': int((~valid).sum()),
+            'region': resolved.region
+        })
+    except Exception as e:
+        app.logger.error(f"Error in /api/predict/crop/batch: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': 'An internal error occurred while predicting crops.'}), 500
+
 @app.route('/api/predict/fertilizer', methods=['POST'])
 def predict_fertilizer():
     try:
@@ -221,6 +288,73 @@ def predict_fertilizer():
         app.logger.error(f"Error in /api/predict/fertilizer: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'An internal error occurred while recommending fertilizer.'}), 500
 
+@app.route('/api/predict/fertilizer/batch', methods=['POST'])
+def predict_fertilizer_batch():
+    """Recommend fertilizer for many plots in one request"""
+    try:
+        data = request.get_json(silent=True)
+        records = data.get('records') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not records:
+            return jsonify({'success': False, 'error': 'Expected a non-empty array of {crop, N, P, K} records'}), 400
+        if len(records) > MAX_BATCH_RECORDS:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_RECORDS} records are allowed per request'}), 400
+        if not all(isinstance(record, dict) for record in records):
+            return jsonify({'success': False, 'error': 'Each record must be an object with crop, N, P and K'}), 400
+
+        frame = pd.DataFrame.from_records(records).reindex(columns=['crop', 'N', 'P', 'K'])
+        crops = frame['crop'].fillna('').astype(str).str.strip()
+        npk = frame[['N', 'P', 'K']].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        valid_npk = ~np.isnan(npk).any(axis=1)
+
+        recommendations = fertilizer_table.recommend_batch(crops, np.nan_to_num(npk))
+        results = []
+        for i, (crop, recommendation) in enumerate(zip(crops, recommendations)):
+            if not valid_npk[i]:
+                recommendation = {'error': 'N, P and K must be numeric'}
+            results.append({'index': i, 'crop': crop, **recommendation})
+
+        return jsonify({
+            'success': True,
+            'data': results,
+            'count': len(results),
+            'errors': sum(1 for result in results if 'error' in result)
+        })
+    except Exception as e:
+        app.logger.error(f"Error in /api/predict/fertilizer/batch: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': 'An internal error occurred while recommending fertilizer.'}), 500
+
+@app.route('/api/plan', methods=['POST'])
+def field_plan():
+    """Top-k crops for the soil/climate inputs, each paired with its fertilizer analysis"""
+    try:
+        data = request.get_json(silent=True) or {}
+        for feature in CROP_FEATURES:
+            if feature not in data:
+                return jsonify({'success': False, 'error': f'Missing feature: {feature}'}), 400
+        try:
+            input_row = np.array([[float(data[feature]) for feature in CROP_FEATURES]])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'All features must be numeric'}), 400
+
+        resolved = resolve_crop_model(data)
+        top_k = parse_top_k(data.get('top_k', request.args.get('top_k')), resolved.model)
+        probabilities = resolved.model.predict_proba(input_row)[0]
+        top = top_crop_indices(probabilities, top_k)
+        top_crops = [str(crop) for crop in resolved.model.classes_[top]]
+
+        # One deficit computation for all top-k crops against the same soil reading
+        npk = np.repeat(input_row[:, :3], len(top_crops), axis=0)
+        fertilizer = fertilizer_table.recommend_batch(top_crops, npk)
+
+        plan = [
+            {'crop': crop, 'probability': float(probabilities[i]), 'fertilizer': advice}
+            for crop, i, advice in zip(top_crops, top, fertilizer)
+        ]
+        return jsonify({'success': True, 'predictions': plan, 'region': resolved.region})
+    except Exception as e:
+        app.logger.error(f"Error in /api/plan: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': 'An internal error occurred while building the field plan.'}), 500
+
 @app.route('/api/weather', methods=['POST'])
 def get_weather():
     try:
@@ -243,9 +377,19 @@ def weather_forecast():
     try:
         data = request.json
         city = data.get('city', '')
+        extended = bool(data.get('extended', False))
+        if data.get('lat') is not None and data.get('lon') is not None:
+            # GPS coordinates from the farm: served per grid cell
+            try:
+                forecast = get_forecast_by_coordinates(data['lat'], data['lon'], extended)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'Invalid coordinates'}), 400
+            if 'error' in forecast:
+                return jsonify({'success': False, 'error': forecast['error']}), 400
+            return jsonify({'success': True, 'data': forecast})
         if not city:
-            return jsonify({'success': False, 'error': 'City name is required'}), 400
-        forecast = get_weather_forecast(city)
+            return jsonify({'success': False, 'error': 'City name or coordinates are required'}), 400
+        forecast = get_weather_forecast(city, extended)
         if 'error' in forecast:
             return jsonify({'success': False, 'error': forecast['error']}), 400
         return jsonify({'success': True, 'data': forecast})
@@ -253,6 +397,52 @@ def weather_forecast():
         app.logger.error(f"Error in /api/weather/forecast: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'An internal error occurred while fetching the forecast.'}), 500
 
+@app.route('/api/weather/forecast/batch', methods=['POST'])
+def weather_forecast_batch():
+    """7-day forecasts for many locations at once, with per-location errors"""
+    try:
+        data = request.get_json(silent=True)
+        locations = data.get('locations') if isinstance(data, dict) else data
+        if not isinstance(locations, list) or not locations:
+            return jsonify({'success': False, 'error': 'Expected a non-empty list of locations'}), 400
+        if len(locations) > MAX_FORECAST_LOCATIONS:
+            return jsonify({'success': False, 'error': f'At most {MAX_FORECAST_LOCATIONS} locations are allowed per request'}), 400
+
+        parsed = []
+        for location in locations:
+            if isinstance(location, dict) and location.get('lat') is not None and location.get('lon') is not None:
+                parsed.append({'lat': location['lat'], 'lon': location['lon']})
+            else:
+                city = str(location.get('city', '') if isinstance(location, dict) else location).strip()
+                if not city:
+                    return jsonify({'success': False, 'error': 'Every location needs a city name or lat/lon'}), 400
+                parsed.append(city)
+
+        extended = bool(data.get('extended', False)) if isinstance(data, dict) else False
+        forecasts = get_weather_forecasts(parsed, extended)
+        return jsonify({
+            'success': True,
+            'data': forecasts,
+            'count': len(forecasts),
+            'errors': sum(1 for forecast in forecasts if 'error' in forecast)
+        })
+    except Exception as e:
+        app.logger.error(f"Error in /api/weather/forecast/batch: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': 'An internal error occurred while fetching forecasts.'}), 500
+
+@app.route('/api/weather/health', methods=['GET'])
+def weather_health():
+    """Weather cache statistics, upstream provider latency and circuit breaker states"""
+    breakers = weather_breaker_states()
+    return jsonify({
+        'success': True,
+        'status': 'degraded' if any(b['state'] != 'closed' for b in breakers.values()) else 'ok',
+        'cache': weather_cache_stats(),
+        'providers': weather_provider_stats(),
+        'circuit_breakers': breakers,
+        'prefetch': weather_prefetch_stats()
+    })
+
 @app.route('/api/signup', methods=['POST'])
 def signup():
     try:
@@ -485,6 +675,14 @@ def disease_health():
         'message': 'Disease detection is available' if disease_detector else 'Disease detection model not loaded'
     }), 200
 
+# ----------------------------
+# Weather prefetch
+# ----------------------------
+# Refreshes the most requested cities and farm grid cells before their cache entries expire
+if os.environ.get('WEATHER_PREFETCH', 'true').lower() in ('1', 'true', 'yes'):
+    if weather_prefetcher.start(lock_path=WEATHER_PREFETCH_LOCK):
+        logging.info("Weather prefetcher started")
+
 # ----------------------------
 # Integrate Gemini Chatbot
 # ----------------------------
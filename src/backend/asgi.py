@@ -0,0 +1,58 @@
+"""
+ASGI entry point for AgriVision.
+
+POST /api/chatbot is served on the event loop: the chatbot's async view runs inside the Flask
+app's request context (session, CORS and other request hooks included), and while it awaits
+Gemini the turn holds no thread. Every other request goes to the Flask app unchanged, on a pool
+of WSGI_THREADS threads. Set CHATBOT_ASYNC=false to serve /api/chatbot from the blocking Flask
+view as well, e.g. to compare the two under the same server (scripts/bench_chatbot.py).
+"""
+import io
+import os
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 8))
+CHATBOT_ASYNC = os.environ.get('CHATBOT_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def build_asgi_app(flask_app, threads=WSGI_THREADS, async_chatbot=CHATBOT_ASYNC):
+    """ASGI app serving flask_app, with /api/chatbot on the event loop when async_chatbot is set"""
+    wsgi = WSGIMiddleware(flask_app, workers=threads)
+
+    async def chatbot(scope, receive, send):
+        environ = build_environ(scope, io.BytesIO(await _read_body(receive)))
+        with flask_app.request_context(environ):
+            try:
+                response = flask_app.preprocess_request()
+                if response is None:
+                    response = await flask_app.achatbot_endpoint()
+                response = flask_app.process_response(flask_app.make_response(response))
+            except Exception as e:
+                response = flask_app.make_response(flask_app.handle_exception(e))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def app(scope, receive, send):
+        if async_chatbot and scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/chatbot':
+            await chatbot(scope, receive, send)
+        else:
+            await wsgi(scope, receive, send)
+
+    return app
@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class InMemoryContextStore:
+    """
+    Per-process chat contexts, bounded by count (least recently used evicted first) and by idle
+    time (contexts untouched for idle_ttl seconds expire).
+    """
+
+    def __init__(self, max_entries=10000, idle_ttl=6 * 3600):
+        self.max_entries = max(1, int(max_entries))
+        self.idle_ttl = float(idle_ttl)
+        self._entries = OrderedDict()  # session_id -> (context, last_used)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evicted_lru': 0, 'expired_idle': 0}
+
+    def _expire(self, now):
+        # Entries are kept in access order, so the idle ones are all at the front
+        while self._entries:
+            session_id, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._entries[session_id]
+            self._stats['expired_idle'] += 1
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._entries[session_id] = (entry[0], now)
+            self._entries.move_to_end(session_id)
+            return entry[0]
+
+    def save(self, session_id, context):
+        now = time.time()
+        with self._lock:
+            self._entries[session_id] = (context, now)
+            self._entries.move_to_end(session_id)
+            self._expire(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evicted_lru'] += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'idle_ttl': self.idle_ttl,
+                **self._stats
+            }
+
+
+class SQLiteContextStore:
+    """
+    Chat contexts serialized to a SQLite file shared by every uvicorn worker on the host, so a
+    conversation survives landing on a different worker. Same bounds as the in-memory store;
+    expired and excess rows are trimmed every `trim_every` saves.
+    """
+
+    def __init__(self, path, loads, max_entries=10000, idle_ttl=6 * 3600, trim_every=100):
+        self.path = path
+        self.loads = loads
+        self.max_entries = max(1, int(max_entries))
+        self.idle_ttl = float(idle_ttl)
+        self.trim_every = max(1, int(trim_every))
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evicted_lru': 0, 'expired_idle': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_contexts (
+                        session_id TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_contexts_age ON chat_contexts (updated_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def get(self, session_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT data FROM chat_contexts WHERE session_id = ? AND updated_at >= ?',
+                (session_id, time.time() - self.idle_ttl)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return self.loads(row[0])
+
+    def save(self, session_id, context):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO chat_contexts (session_id, data, updated_at) VALUES (?, ?, ?)',
+                    (session_id, context.to_json(), time.time())
+                )
+        finally:
+            conn.close()
+        with self._lock:
+            self._saves += 1
+            due = self._saves % self.trim_every == 0
+        if due:
+            self.trim()
+
+    def trim(self):
+        """Delete contexts idle past idle_ttl, then the least recently used beyond max_entries"""
+        conn = self._connect()
+        try:
+            with conn:
+                expired = conn.execute(
+                    'DELETE FROM chat_contexts WHERE updated_at < ?', (time.time() - self.idle_ttl,)
+                ).rowcount
+                evicted = conn.execute('''
+                    DELETE FROM chat_contexts WHERE session_id IN (
+                        SELECT session_id FROM chat_contexts ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,)).rowcount
+        finally:
+            conn.close()
+        self._count('expired_idle', max(expired, 0))
+        self._count('evicted_lru', max(evicted, 0))
+
+    def delete(self, session_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM chat_contexts WHERE session_id = ?', (session_id,))
+        finally:
+            conn.close()
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            size = conn.execute('SELECT COUNT(*) FROM chat_contexts').fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            'backend': 'sqlite',
+            'size': size,
+            'max_entries': self.max_entries,
+            'idle_ttl': self.idle_ttl,
+            **stats
+        }
+
+
+def build_context_store(loads):
+    """Context store selected by CHATBOT_CONTEXT_STORE ('memory' or 'sqlite')"""
+    max_entries = int(os.environ.get('CHATBOT_CONTEXT_MAX', 10000))
+    idle_ttl = float(os.environ.get('CHATBOT_CONTEXT_IDLE_TTL', 6 * 3600))
+    if os.environ.get('CHATBOT_CONTEXT_STORE', 'memory').lower() == 'sqlite':
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+        path = os.environ.get('CHATBOT_CONTEXT_DB', os.path.join(data_dir, 'chat_contexts.db'))
+        return SQLiteContextStore(path, loads, max_entries=max_entries, idle_ttl=idle_ttl)
+    return InMemoryContextStore(max_entries=max_entries, idle_ttl=idle_ttl)
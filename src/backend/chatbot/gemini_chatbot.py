@@ -1,115 +1,345 @@
-import warnings
-# Suppress FutureWarning for google.generativeai deprecation
-# TODO: Migrate to google.genai package in future updates
-# See: https://github.com/google-gemini/deprecated-generative-ai-python
-warnings.filterwarnings('ignore', category=FutureWarning, module='google.generativeai')
-
-import google.generativeai as genai
+import asyncio
 import json
 import re
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import Context, ContextVar
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+from dataclasses import dataclass, field
 from datetime import datetime
 import os
 import logging
-from flask import request, jsonify, session
+import unicodedata
+from flask import request, jsonify, session, Response, stream_with_context
+from src.backend.utils.cache import TTLCache
+from src.backend.chatbot.context_store import build_context_store
+from src.backend.chatbot.llm_client import LLMClient, LLMTimeoutError, build_llm_client
+
+INTENTS = ['CROP_RECOMMENDATION', 'FERTILIZER_ADVICE', 'WEATHER_INQUIRY', 'SOIL_MANAGEMENT',
+           'DISEASE_PEST', 'GENERAL_HELP', 'GREETING']
+NUMERIC_PARAMETERS = ['N', 'P', 'K', 'pH', 'temperature', 'humidity', 'rainfall']
+TEXT_PARAMETERS = ['location', 'crop']
+# Intents whose handlers use extracted parameters
+PARAMETER_INTENTS = ['CROP_RECOMMENDATION', 'FERTILIZER_ADVICE', 'WEATHER_INQUIRY']
+
+# Prompt budgets in estimated tokens; history only gets what the rest of the prompt leaves over
+PROMPT_BUDGETS = {
+    'classification': 350,
+    'parameter_extraction': 400,
+    'analysis': 450,
+    'crop_recommendation': 800,
+    'fertilizer_advice': 800,
+    'weather_inquiry': 800,
+    'general_query': 1000,
+}
+# Turns kept verbatim in a context; older turns are folded into its rolling summary
+HISTORY_TURNS = int(os.environ.get('CHATBOT_HISTORY_TURNS', 6))
+SUMMARY_ITEMS = 8
+
+# Seconds a whole turn may spend waiting on the LLM; each call gets at most what is left, and an
+# answer still missing at the deadline is replaced by the handler's local template. A streamed
+# answer only has to start before the deadline; once tokens flow it runs to the client's timeout
+TURN_DEADLINE = float(os.environ.get('CHATBOT_TURN_DEADLINE', 10))
+# What happens to a cacheable answer that misses the deadline: 'drop' it, or let it finish in the
+# background ('cache') so the next asker of the same question gets the full answer
+LATE_ANSWERS = os.environ.get('CHATBOT_LATE_ANSWERS', 'drop').lower()
+_late_answers = ThreadPoolExecutor(max_workers=4, thread_name_prefix='chatbot-late-answer')
+
+@dataclass
+class TurnState:
+    """LLM calls made so far in the current turn and when the turn's LLM budget runs out"""
+    deadline: float
+    llm_calls: int = 0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+# The state object is shared (not copied) by worker threads and child tasks, which run in copies
+# of the context, so their calls still count towards the turn
+_current_turn: ContextVar[Optional[TurnState]] = ContextVar('current_turn', default=None)
+
+# ----------------------------
+# General-question response cache
+# ----------------------------
+# Answers to context-independent questions ("how to control aphids on cotton?") are reused
+# across users with the same role. Set CHATBOT_CACHE_DB to share them across workers via SQLite.
+response_cache = TTLCache(
+    'chatbot_responses',
+    ttl=float(os.environ.get('CHATBOT_CACHE_TTL', 86400)),
+    max_entries=int(os.environ.get('CHATBOT_CACHE_SIZE', 2048)),
+    db_path=os.environ.get('CHATBOT_CACHE_DB') or None
+)
 
-# Configure Gemini API
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable not set. Please set it to your Gemini API key.")
-genai.configure(api_key=GEMINI_API_KEY)
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'be', 'do', 'does', 'did', 'i', 'me', 'my', 'we', 'our', 'you',
+    'your', 'to', 'of', 'in', 'on', 'at', 'for', 'with', 'and', 'or', 'can', 'could', 'should', 'would',
+    'will', 'please', 'tell', 'about', 'there', 'any', 'some', 'best', 'way', 'ways', 'kindly', 'pls',
+    'plz', 'hi', 'hello', 'sir', 'madam'
+}
+# Interrogatives (what, how, when, why, which) stay in the key: "when to sow wheat" and "how to sow
+# wheat" are different questions. 'one' is left as a word since it usually points back ("which one").
+NUMBER_WORDS = {'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6',
+                'seven': '7', 'eight': '8', 'nine': '9', 'ten': '10'}
+# Words that point back into the conversation; answers to such messages depend on history
+FOLLOW_UP_WORDS = {'it', 'its', 'this', 'that', 'these', 'those', 'they', 'them', 'their', 'above', 'same',
+                   'previous', 'earlier', 'again', 'more', 'else', 'also', 'instead', 'then', 'one'}
+
+def normalize_question(message: str) -> str:
+    """Case-, accent- and punctuation-insensitive form of a question with filler words dropped and numbers canonical"""
+    text = unicodedata.normalize('NFKD', message)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = re.sub(r'(?<=\d),(?=\d{3})', '', text)
+    words = []
+    for word in re.findall(r'\d+(?:\.\d+)?|[a-z]+', text):
+        if word[0].isdigit():
+            word = f"{float(word):g}"
+        word = NUMBER_WORDS.get(word, word)
+        if word not in STOPWORDS:
+            words.append(word)
+    return ' '.join(words)
+
+def depends_on_history(message: str, context: 'ChatContext') -> bool:
+    """Whether the answer to message could change with the conversation so far"""
+    if not context.conversation_history:
+        return False
+    words = re.findall(r"[a-z']+", message.casefold())
+    content = [w for w in words if w not in STOPWORDS]
+    return len(content) < 3 or any(w in FOLLOW_UP_WORDS for w in words) or message.casefold().lstrip().startswith(('and ', 'but ', 'so '))
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for prompt budgets"""
+    return len(text) // 4 + 1
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+def compact_fields(value: Any, limit: int = 60) -> str:
+    """Structured data as terse key=value text: dicts on one line, lists of dicts one per line"""
+    def scalar(v):
+        if isinstance(v, float):
+            return f"{v:g}"
+        return _clip(v, limit)
+
+    if isinstance(value, dict):
+        pairs = []
+        for key, v in value.items():
+            if isinstance(v, dict):
+                pairs += [f"{key}.{k}={scalar(x)}" for k, x in v.items() if not isinstance(x, (dict, list))]
+            elif v is not None and not isinstance(v, list):
+                pairs.append(f"{key}={scalar(v)}")
+        return " ".join(pairs) or "none"
+    if isinstance(value, list):
+        return "\n".join(compact_fields(item, limit) if isinstance(item, dict) else scalar(item) for item in value) or "none"
+    return "none" if value is None else scalar(value)
 
 class PromptFactory:
     """
     Manages the generation of prompts for the Gemini model, ensuring consistency and maintainability.
+
+    Each prompt has a token budget (PROMPT_BUDGETS). The instructions, message and compacted
+    structured data always go in; conversation history fills what is left of the budget, newest
+    turns first, followed by the rolling summary of older turns.
     """
     @staticmethod
-    def _format_history(history: List[Dict[str, str]], turns: int = 3) -> str:
-        """Formats the last few turns of conversation history for the prompt."""
-        if not history:
+    def _format_history(context: 'ChatContext', budget: int) -> str:
+        """Formats as much recent conversation history as fits in `budget` tokens."""
+        turns = []
+        remaining = budget
+        for turn in reversed(context.conversation_history):
+            line = f"User: {turn.get('user', '')}\nAgriBot: {_clip(turn.get('bot', ''), 400)}"
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            turns.append(line)
+            remaining -= cost
+        summary = context.history_summary
+        if summary and estimate_tokens(summary) > remaining:
+            summary = None
+        if not turns and not summary:
             return "No previous conversation."
-        
-        recent_history = history[-turns:]
-        formatted_history = "\n".join(
-            [f"User: {turn.get('user', '')}\nAgriBot: {turn.get('bot', '')}" for turn in recent_history]
-        )
-        return f"This is the recent conversation history:\n{formatted_history}"
+
+        formatted = ""
+        if summary:
+            formatted += f"Earlier in the conversation: {summary}\n"
+        if turns:
+            formatted += "This is the recent conversation history:\n" + "\n".join(reversed(turns))
+        return formatted.strip()
 
     @staticmethod
-    def classification(message: str, context: 'ChatContext') -> str:
-        history_str = PromptFactory._format_history(context.conversation_history)
+    def _build(purpose: str, context: 'ChatContext', head: str, body: str) -> str:
+        budget = PROMPT_BUDGETS.get(purpose, PROMPT_BUDGETS['general_query'])
+        history_str = PromptFactory._format_history(context, budget - estimate_tokens(head) - estimate_tokens(body))
         return f"""
-        Based on the conversation history and the latest message, classify the user's intent into ONE category.
+        {head}
 
         {history_str}
 
-        Latest Message: "{message}"
+        {body}
+        """
+
+    @staticmethod
+    def classification(message: str, context: 'ChatContext') -> str:
+        return PromptFactory._build('classification', context,
+            "Based on the conversation history and the latest message, classify the user's intent into ONE category.",
+            f"""Latest Message: "{message}"
         
         Categories: CROP_RECOMMENDATION, FERTILIZER_ADVICE, WEATHER_INQUIRY, SOIL_MANAGEMENT, DISEASE_PEST, GENERAL_HELP, GREETING.
-        Respond with only the category name.
-        """
+        Respond with only the category name.""")
 
     @staticmethod
     def parameter_extraction(message: str, context: 'ChatContext') -> str:
-        history_str = PromptFactory._format_history(context.conversation_history)
-        return f"""
-        Extract agricultural parameters from the latest message, using the conversation history for context.
-        
-        {history_str}
-        Latest Message: "{message}"
+        return PromptFactory._build('parameter_extraction', context,
+            "Extract agricultural parameters from the latest message, using the conversation history for context.",
+            f"""Latest Message: "{message}"
         
         Extract any of these parameters if present: N, P, K, pH, temperature, humidity, rainfall, location, crop.
         Return only valid JSON with found parameters, or an empty JSON object {{}} if none are found.
-        Example: {{"N": 90, "P": 40, "location": "Mumbai"}}
-        """
+        Example: {{"N": 90, "P": 40, "location": "Mumbai"}}""")
+
+    @staticmethod
+    def analysis(message: str, context: 'ChatContext') -> str:
+        return PromptFactory._build('analysis', context,
+            "Analyze the latest message of a farming conversation, using the conversation history for context.",
+            f"""Latest Message: "{message}"
+
+        Return one JSON object with exactly two fields:
+        "intent": ONE of {', '.join(INTENTS)}
+        "parameters": an object with any of {', '.join(NUMERIC_PARAMETERS)} (numbers) and {', '.join(TEXT_PARAMETERS)} (strings) found in the message, or {{}} if none are found
+        Example: {{"intent": "CROP_RECOMMENDATION", "parameters": {{"N": 90, "P": 40, "location": "Mumbai"}}}}""")
 
     @staticmethod
     def crop_recommendation(message: str, context: 'ChatContext', recommendations: List) -> str:
-        return f"""
-        Based on the conversation history, generate a friendly, detailed response about these crop recommendations.
-        {PromptFactory._format_history(context.conversation_history)}
-        Soil Data: {context.soil_data}
-        Recommendations: {recommendations}
+        return PromptFactory._build('crop_recommendation', context,
+            "Based on the conversation history, generate a friendly, detailed response about these crop recommendations.",
+            f"""Soil Data: {compact_fields(context.soil_data)}
+        Recommendations:
+        {compact_fields(recommendations)}
         Latest User Message: "{message}"
-        Explain why these crops are suitable and suggest next steps (e.g., fertilizer advice). Be conversational.
-        """
+        Explain why these crops are suitable and suggest next steps (e.g., fertilizer advice). Be conversational.""")
 
     @staticmethod
     def fertilizer_advice(message: str, context: 'ChatContext', crop: str, fertilizer_info: Dict) -> str:
-        return f"""
-        Based on the conversation history, create a helpful fertilizer recommendation.
-        {PromptFactory._format_history(context.conversation_history)}
-        Crop: {crop}
-        Current Soil NPK: {context.soil_data}
-        Fertilizer Analysis: {fertilizer_info}
+        soil_npk = {key: context.soil_data[key] for key in ('N', 'P', 'K', 'pH') if key in (context.soil_data or {})}
+        return PromptFactory._build('fertilizer_advice', context,
+            "Based on the conversation history, create a helpful fertilizer recommendation.",
+            f"""Crop: {crop}
+        Current Soil NPK: {compact_fields(soil_npk)}
+        Fertilizer Analysis: {compact_fields(fertilizer_info)}
         Latest User Message: "{message}"
-        Explain the nutrient status, deficiency, and specific fertilizer recommendations. Be practical and actionable.
-        """
+        Explain the nutrient status, deficiency, and specific fertilizer recommendations. Be practical and actionable.""")
 
     @staticmethod
     def weather_inquiry(message: str, context: 'ChatContext', location: str, weather_data: Dict) -> str:
-        return f"""
-        Based on the conversation history, provide weather-based farming advice.
-        {PromptFactory._format_history(context.conversation_history)}
-        Location: {location}
-        Weather Data: {weather_data}
+        return PromptFactory._build('weather_inquiry', context,
+            "Based on the conversation history, provide weather-based farming advice.",
+            f"""Location: {location}
+        Weather Data: {compact_fields(weather_data)}
         Latest User Message: "{message}"
         Include:
         1. Current weather summary
         2. Farming implications of these conditions
         3. Specific recommendations (irrigation, planting, harvesting)
-        Keep it practical and actionable for farmers.
-        """
+        Keep it practical and actionable for farmers.""")
 
     @staticmethod
     def general_query(message: str, context: 'ChatContext') -> str:
-        return f"""
-        You are an expert agricultural assistant. Based on the conversation history, answer this farming question.
-        {PromptFactory._format_history(context.conversation_history)}
-        Latest Question: "{message}"
-        Provide helpful, practical agricultural advice. Be conversational and specific.
-        """
+        return PromptFactory._build('general_query', context,
+            "You are an expert agricultural assistant. Based on the conversation history, answer this farming question.",
+            f"""Latest Question: "{message}"
+        Provide helpful, practical agricultural advice. Be conversational and specific.""")
+
+def _number(value: Any) -> str:
+    try:
+        return f"{float(value):g}"
+    except (TypeError, ValueError):
+        return str(value)
+
+class LocalTemplates:
+    """
+    Answers built from the handlers' structured results alone, used when Gemini fails or misses
+    the turn deadline. They carry the same numbers the Gemini prompt would have been given.
+    """
+    # Straight fertilizers for a single deficient nutrient, and a complex grade when several are short
+    STRAIGHT = {'N': 'Urea (46% N)', 'P': 'DAP (18-46-0) or Single Superphosphate', 'K': 'Muriate of Potash (60% K2O)'}
+    NUTRIENTS = {'N': 'Nitrogen', 'P': 'Phosphorus', 'K': 'Potassium'}
+
+    @staticmethod
+    def crop_recommendation(soil_data: Dict, recommendations: List) -> str:
+        soil = {k.lower(): v for k, v in (soil_data or {}).items()}
+        lines = [f"{i}. {str(rec['crop']).title()} — {rec['probability']}% match" for i, rec in enumerate(recommendations, 1)]
+        text = (
+            f"Based on your soil (N {_number(soil.get('n'))}, P {_number(soil.get('p'))}, K {_number(soil.get('k'))}, "
+            f"pH {_number(soil.get('ph'))}) and conditions ({_number(soil.get('temperature'))}°C, "
+            f"{_number(soil.get('humidity'))}% humidity, {_number(soil.get('rainfall'))} mm rainfall), "
+            f"these crops suit your field best:\n\n" + "\n".join(lines)
+        )
+        try:
+            ph = float(soil.get('ph'))
+        except (TypeError, ValueError):
+            ph = None
+        if ph is not None and ph < 5.5:
+            text += "\n\nYour soil is acidic; liming before sowing will widen your choice of crops."
+        elif ph is not None and ph > 7.5:
+            text += "\n\nYour soil is alkaline; gypsum and organic matter help bring the pH down."
+        if recommendations:
+            text += f"\n\nNext step: ask me for fertilizer advice for {str(recommendations[0]['crop']).title()}."
+        return text
+
+    @staticmethod
+    def fertilizer_advice(crop: str, fertilizer_info: Dict) -> str:
+        if fertilizer_info.get('error'):
+            return fertilizer_info['error']
+        if fertilizer_info.get('type') == 'balanced':
+            return f"{fertilizer_info.get('message', 'Your soil seems balanced for this crop.')} No extra fertilizer is needed for {crop} right now; a basal dose of compost or farmyard manure keeps it that way."
+        deficiencies = fertilizer_info.get('deficiencies')
+        if not deficiencies:
+            return f"For your {crop} crop, you have a {fertilizer_info.get('type')} deficiency of {fertilizer_info.get('deficiency')} units. It is recommended to use {fertilizer_info.get('fertilizer_type')}."
+        recommended = fertilizer_info.get('recommended', {})
+        short = [key for key in ('N', 'P', 'K') if deficiencies.get(key, 0) > 0]
+        lines = [
+            f"• {LocalTemplates.NUTRIENTS[key]}: short by {_number(deficiencies[key])} units "
+            f"(target {_number(recommended.get(key))}) → {LocalTemplates.STRAIGHT[key]}"
+            for key in short
+        ]
+        text = f"Fertilizer plan for {crop}:\n\n" + "\n".join(lines)
+        if len(short) > 1:
+            text += "\n\nSince more than one nutrient is short, a complex fertilizer such as 19-19-19 or 10-26-26 covers them in one application; top up the largest gap with the straight fertilizer above."
+        if 'N' in short:
+            text += "\n\nSplit nitrogen into 2-3 doses (at sowing, tillering and flowering) to reduce losses."
+        return text
+
+    @staticmethod
+    def weather(location: str, weather_data: Dict) -> str:
+        if weather_data.get('error'):
+            return weather_data['error']
+        temp, humidity = weather_data.get('temperature'), weather_data.get('humidity')
+        description = str(weather_data.get('description') or '')
+        place = ', '.join(str(p) for p in (weather_data.get('city') or location, weather_data.get('country')) if p)
+        text = f"Weather in {place}:\n• Temperature: {_number(temp)}°C\n• Humidity: {_number(humidity)}%"
+        if description:
+            text += f"\n• Conditions: {description}"
+        advice = []
+        try:
+            temp, humidity = float(temp), float(humidity)
+        except (TypeError, ValueError):
+            temp = humidity = None
+        if temp is not None:
+            if temp >= 35:
+                advice.append("Heat stress is likely: irrigate early in the morning or evening and mulch to keep soil moisture.")
+            elif temp <= 10:
+                advice.append("Cold conditions: protect seedlings and avoid irrigating late in the day to reduce frost damage.")
+            if humidity >= 80:
+                advice.append("High humidity favours fungal disease: scout for leaf spots and avoid overhead irrigation.")
+            elif humidity <= 40:
+                advice.append("Dry air increases water loss: check soil moisture and irrigate if the topsoil is dry.")
+        if 'rain' in description.lower() or 'storm' in description.lower():
+            advice.append("Rain expected: postpone spraying and fertilizer application until it clears.")
+        if not advice:
+            advice.append("Conditions are good for most field work, including sowing, spraying and harvesting.")
+        return text + "\n\n" + "\n".join(f"• {line}" for line in advice)
 
 @dataclass
 class ChatContext:
@@ -120,46 +350,524 @@ class ChatContext:
     last_crop_recommendations: Optional[List] = None
     last_fertilizer_advice: Optional[Dict] = None
     conversation_history: List[Dict[str, str]] = None
+    history_summary: Optional[str] = None
+    turn_count: int = 0
     
     def __post_init__(self):
         if self.conversation_history is None:
             self.conversation_history = []
 
+    def add_turn(self, user: str, bot: str, intent: str):
+        """Append a turn to the fixed-size history, folding the oldest turn into the rolling summary"""
+        self.conversation_history.append({
+            'user': user,
+            'bot': _clip(bot, 600),
+            'timestamp': datetime.now().isoformat(),
+            'intent': intent
+        })
+        self.turn_count += 1
+        while len(self.conversation_history) > HISTORY_TURNS:
+            oldest = self.conversation_history.pop(0)
+            items = self.history_summary.split(' | ') if self.history_summary else []
+            items.append(f"{oldest.get('intent', 'GENERAL_HELP').lower()}: {_clip(oldest.get('user', ''), 60)}")
+            self.history_summary = ' | '.join(items[-SUMMARY_ITEMS:])
+
+    def to_json(self) -> str:
+        """Compact JSON: unset fields are omitted"""
+        fields = {name: value for name, value in vars(self).items() if value not in (None, [], {})}
+        return json.dumps(fields, separators=(',', ':'), default=str)
+
+    @classmethod
+    def from_json(cls, text: str) -> 'ChatContext':
+        data = json.loads(text)
+        return cls(**{name: data[name] for name in cls.__dataclass_fields__ if name in data})
+
+@dataclass
+class PreparedReply:
+    """A handler's structured result: the prompt for Gemini (None if no LLM text is needed) and the local fallback text"""
+    fallback: str
+    prompt: Optional[str] = None
+    purpose: str = 'general_query'
+    actions: List[str] = field(default_factory=list)
+    data: Dict = field(default_factory=dict)
+    suggestions: List[str] = field(default_factory=list)
+    cache_key: Optional[str] = None
+    # Shown instead of fallback when Gemini was reachable but missed the turn deadline
+    deadline_fallback: Optional[str] = None
+
+    def reply(self, text: Optional[str] = None) -> Dict:
+        return {
+            'response': self.fallback if text is None else text,
+            'actions': self.actions,
+            'data': self.data,
+            'suggestions': self.suggestions
+        }
+
+class LocalIntentClassifier:
+    """
+    Microsecond intent classification for messages whose intent is obvious.
+
+    Keyword/regex rules run first. Every distinct term that matches adds evidence for its intent
+    according to how specific the term is, so one specific term ("aphids", "urea") is decisive but
+    one broad term ("rust", "forecast") is not; when exactly one intent matches with at least
+    min_confidence it is returned. Otherwise an optional TF-IDF + logistic regression model, trained
+    at startup from the turn log (CHATBOT_TURN_LOG, JSON lines), is consulted. `classify` returns
+    None when neither is confident, and the caller falls back to Gemini.
+    """
+
+    # Evidence per matched term: one SPECIFIC term clears the default 0.85 threshold on its own,
+    # a GENERIC term needs a second hit (generic or specific) alongside it
+    SPECIFIC = 0.95
+    GENERIC = 0.65
+    RULES = {
+        'GREETING': [
+            (SPECIFIC, r'^\W*(hi+|hello+|hey+|hii+|namaste|namaskar|good (morning|afternoon|evening)|greetings)\b[\w\s]{0,20}\W*$'),
+        ],
+        'WEATHER_INQUIRY': [
+            (SPECIFIC, r'\b(weather|will it rain|rain(fall)? (today|tomorrow|this week)|climate today)\b'),
+            (GENERIC, r'\b(forecast)\b'),
+        ],
+        'CROP_RECOMMENDATION': [
+            (SPECIFIC, r'\b(which|what|best|suitable|recommend\w*|suggest\w*)\b.{0,30}\bcrops?\b'),
+            (SPECIFIC, r'\bcrops?\b.{0,20}\b(to grow|should i (grow|plant|sow)|recommend\w*)\b'),
+        ],
+        'FERTILIZER_ADVICE': [
+            (SPECIFIC, r'\b(fertili[sz]er\w*|urea|dap|npk dose|nutrient deficien\w*)\b'),
+            (GENERIC, r'\b(potash|manure)\b'),
+        ],
+        'DISEASE_PEST': [
+            (SPECIFIC, r'\b(pests?|aphids?|blight|fung\w+|mildew|borers?|leaf spots?|mites?)\b'),
+            (GENERIC, r'\b(diseases?|insects?|wilt\w*|rust|worms?)\b'),
+        ],
+        'SOIL_MANAGEMENT': [
+            (SPECIFIC, r'\b(soil (health|fertility|erosion|structure|quality)|improve (my )?soil|organic matter)\b'),
+            (GENERIC, r'\b(compost\w*|mulch\w*)\b'),
+        ],
+    }
+    # Three or more soil readings ("N 90 P 40 K 50 pH 6.5") mean the user wants a crop recommendation
+    SOIL_READING = re.compile(r'\b(n|p|k|ph|nitrogen|phosphorus|potassium)\s*[-:=]?\s*\d+(\.\d+)?', re.IGNORECASE)
+    # Evidence never adds up to certainty; the LLM would only have been asked for one label anyway
+    MAX_RULE_CONFIDENCE = 0.98
+
+    def __init__(self, log_path=None, min_confidence=0.85, min_training_turns=50):
+        self.log_path = log_path
+        self.min_confidence = min_confidence
+        self.min_training_turns = min_training_turns
+        self._rules = {
+            intent: [(weight, re.compile(p, re.IGNORECASE)) for weight, p in patterns]
+            for intent, patterns in self.RULES.items()
+        }
+        self._log_lock = threading.Lock()
+        self.model = None
+        if log_path:
+            self.train_from_log(log_path)
+
+    def score_rules(self, message: str) -> Dict[str, float]:
+        """
+        Rule confidence for every intent that matches the message. Each distinct matched term is
+        independent evidence, so confidence is 1 - prod(1 - weight) over the terms.
+        """
+        scores = {}
+        for intent, patterns in self._rules.items():
+            weights = {}
+            for weight, pattern in patterns:
+                for match in pattern.finditer(message):
+                    term = match.group(0).lower()
+                    weights[term] = max(weight, weights.get(term, 0.0))
+            if weights:
+                doubt = 1.0
+                for weight in weights.values():
+                    doubt *= 1.0 - weight
+                scores[intent] = min(self.MAX_RULE_CONFIDENCE, 1.0 - doubt)
+        if len(self.SOIL_READING.findall(message)) >= 3 and 'CROP_RECOMMENDATION' not in scores and 'FERTILIZER_ADVICE' not in scores:
+            scores['CROP_RECOMMENDATION'] = self.SPECIFIC
+        return scores
+
+    def match_rules(self, message: str) -> List[str]:
+        """All intents whose rules match the message"""
+        return list(self.score_rules(message))
+
+    def classify(self, message: str) -> Optional[Tuple[str, float, str]]:
+        """(intent, confidence, 'rules' | 'model') when confident, else None"""
+        scores = self.score_rules(message)
+        matched = list(scores)
+        if len(matched) == 1 and scores[matched[0]] >= self.min_confidence:
+            return matched[0], round(scores[matched[0]], 3), 'rules'
+        if self.model is not None:
+            probabilities = self.model.predict_proba([message])[0]
+            best = probabilities.argmax()
+            intent = str(self.model.classes_[best])
+            # A model guess that contradicts every rule that did fire is not trusted
+            if probabilities[best] >= self.min_confidence and (not matched or intent in matched):
+                return intent, float(probabilities[best]), 'model'
+        return None
+
+    def log_turn(self, message: str, intent: str, source: str):
+        """Append a classified turn to the training log"""
+        if not self.log_path:
+            return
+        line = json.dumps({'timestamp': datetime.now().isoformat(), 'message': message, 'intent': intent, 'source': source})
+        try:
+            with self._log_lock, open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError:
+            logging.warning(f"Could not write chatbot turn log {self.log_path}", exc_info=True)
+
+    def train_from_log(self, path: str) -> bool:
+        """Fit the fallback model on turns Gemini classified; returns whether a model was trained"""
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+            from sklearn.pipeline import make_pipeline
+        except ImportError:
+            logging.warning("scikit-learn not available; local intent model disabled.")
+            return False
+
+        messages, intents = [], []
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        turn = json.loads(line)
+                    except ValueError:
+                        continue
+                    # Only Gemini's labels are learned from, so the model never trains on its own guesses
+                    if turn.get('source') == 'llm' and turn.get('intent') in INTENTS and turn.get('message'):
+                        messages.append(turn['message'])
+                        intents.append(turn['intent'])
+        except FileNotFoundError:
+            return False
+
+        if len(messages) < self.min_training_turns or len(set(intents)) < 2:
+            return False
+        model = make_pipeline(
+            TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True, min_df=2),
+            LogisticRegression(max_iter=1000, C=4.0)
+        )
+        model.fit(messages, intents)
+        self.model = model
+        logging.info(f"Local intent model trained on {len(messages)} logged turns")
+        return True
+
+
+class LocalParameterExtractor:
+    """
+    Deterministic parser for the soil and weather values farmers type.
+
+    Understands "N-90, P-40, K 50", "pH 6.5", "25°C", "80% humidity", "200mm", a place after
+    "in/at/near ..." and any crop known to the fertilizer table or the crop model. Numbers come
+    back as floats under the same keys the LLM extractor uses.
+    """
+
+    NUMBER = r'(\d+(?:\.\d+)?)'
+    LINK = r'\s*(?:[-:=]|\bis\b|\bof\b|\bat\b)?\s*'
+    PATTERNS = {
+        'N': [rf'(?<![\w.])(?:n|nitrogen){LINK}{NUMBER}(?![\d.]*\s*%)'],
+        # Oxide grades (P2O5, K2O) are a different quantity from soil P and K, so they are skipped
+        'P': [rf'(?<![\w.])(?:p(?!2o5)|phosphorus|phosphorous){LINK}{NUMBER}(?![\d.]*\s*%)'],
+        'K': [rf'(?<![\w.])(?:k(?!2o)|potassium|potash){LINK}{NUMBER}(?![\d.]*\s*%)'],
+        'pH': [rf'\bph{LINK}{NUMBER}'],
+        'temperature': [
+            rf'(-?\d+(?:\.\d+)?)\s*(?:°\s*c\b|℃|degrees?(?:\s*(?:c|celsius)\b)?|deg\s*c\b)',
+            rf'\btemp(?:erature)?{LINK}(-?\d+(?:\.\d+)?)'
+        ],
+        'humidity': [rf'{NUMBER}\s*%\s*(?:relative\s+)?humidity', rf'\bhumidity{LINK}{NUMBER}'],
+        'rainfall': [rf'{NUMBER}\s*mm\b', rf'\brain(?:fall)?{LINK}{NUMBER}'],
+    }
+    LOCATION = re.compile(
+        r"\b(?:in|at|near)\s+([a-z][a-z.'-]*(?:\s+[a-z][a-z.'-]*){0,2}?)"
+        r"(?=\s*(?:[,.?!;]|$|\b(?:today|tomorrow|tonight|this|next|now|please|district|region|area|for|with|and|in|at|near)\b))",
+        re.IGNORECASE
+    )
+    NOT_PLACES = {'my', 'the', 'this', 'that', 'our', 'a', 'an', 'soil', 'field', 'farm', 'summer', 'winter',
+                  'monsoon', 'kharif', 'rabi', 'general', 'detail', 'details', 'hindi', 'english', 'total', 'mm'}
+
+    def __init__(self, crop_names=()):
+        self._patterns = {key: [re.compile(p, re.IGNORECASE) for p in patterns] for key, patterns in self.PATTERNS.items()}
+        self.crops = {}
+        for name in crop_names:
+            if isinstance(name, str) and name.strip():
+                # The first spelling seen wins, so fertilizer table names (used for lookups) take priority
+                self.crops.setdefault(name.strip().lower(), name.strip())
+        names = sorted(self.crops, key=len, reverse=True)
+        self._crop_pattern = re.compile(r'\b(' + '|'.join(re.escape(n) for n in names) + r')s?\b', re.IGNORECASE) if names else None
+
+    def extract(self, message: str) -> Dict:
+        params = {}
+        for key, patterns in self._patterns.items():
+            for pattern in patterns:
+                match = pattern.search(message)
+                if match:
+                    params[key] = float(match.group(1))
+                    break
+
+        crop = None
+        if self._crop_pattern:
+            match = self._crop_pattern.search(message)
+            if match:
+                crop = self.crops[match.group(1).lower()]
+                params['crop'] = crop
+
+        for match in self.LOCATION.finditer(message):
+            place = match.group(1).strip(" .'-")
+            words = place.lower().split()
+            if words and words[0] not in self.NOT_PLACES and place.lower() != (crop or '').lower():
+                params['location'] = place.title()
+                break
+        return params
+
+
+class ChatbotMetrics:
+    """LLM call counts and latency per purpose, and LLM calls and latency per chatbot turn."""
+
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {'turns': 0, 'llm_calls': 0, 'analyze_fallbacks': 0, 'intent_fast_path': 0, 'intent_remote': 0,
+                          'params_local': 0, 'params_llm': 0,
+                          'response_cache_bypassed': 0}
+        self._turn_latencies = deque(maxlen=window)
+        self._turn_calls = deque(maxlen=window)
+        self._ttfts = deque(maxlen=window)
+        self.window = window
+
+    def record_call(self, purpose, seconds, ok, prompt_tokens=0):
+        with self._lock:
+            stats = self._calls.setdefault(purpose, {
+                'calls': 0, 'errors': 0, 'latencies': deque(maxlen=self.window), 'prompt_tokens': deque(maxlen=self.window)
+            })
+            stats['calls'] += 1
+            stats['latencies'].append(seconds)
+            stats['prompt_tokens'].append(prompt_tokens)
+            if not ok:
+                stats['errors'] += 1
+
+    def record_turn(self, llm_calls, seconds):
+        with self._lock:
+            self._counters['turns'] += 1
+            self._counters['llm_calls'] += llm_calls
+            self._turn_calls.append(llm_calls)
+            self._turn_latencies.append(seconds)
+
+    def record_ttft(self, seconds):
+        """Time from the start of a streamed turn to its first token"""
+        with self._lock:
+            self._ttfts.append(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @staticmethod
+    def _summary(latencies):
+        latencies = sorted(latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+        return {'p50_ms': percentile(0.50), 'p95_ms': percentile(0.95), 'max_ms': round(latencies[-1] * 1000, 1) if latencies else None}
+
+    def snapshot(self):
+        with self._lock:
+            calls = {
+                purpose: (stats['calls'], stats['errors'], list(stats['latencies']), list(stats['prompt_tokens']))
+                for purpose, stats in self._calls.items()
+            }
+            counters = dict(self._counters)
+            turn_calls = list(self._turn_calls)
+            turn_latencies = list(self._turn_latencies)
+            ttfts = list(self._ttfts)
+        classified = counters['intent_fast_path'] + counters['intent_remote']
+        return {
+            **counters,
+            'intent_fast_path_rate': round(counters['intent_fast_path'] / classified, 3) if classified else None,
+            'llm_calls_per_turn': round(sum(turn_calls) / len(turn_calls), 2) if turn_calls else None,
+            'turn_latency': self._summary(turn_latencies),
+            'stream_time_to_first_token': self._summary(ttfts),
+            'calls_by_purpose': {
+                purpose: {
+                    'calls': n,
+                    'errors': errors,
+                    **self._summary(latencies),
+                    'prompt_tokens_avg': round(sum(tokens) / len(tokens)) if tokens else None,
+                    'prompt_tokens_max': max(tokens) if tokens else None
+                }
+                for purpose, (n, errors, latencies, tokens) in calls.items()
+            }
+        }
+
+
 class AgriVisionChatbot:
-    def __init__(self, crop_model, features, fertilizer_db, weather_api):
+    def __init__(self, crop_model, features, fertilizer_db, weather_api, llm: Optional[LLMClient] = None):
         """Initialize chatbot with existing AgriVision components"""
-        self.model = genai.GenerativeModel('gemini-flash-latest')
+        self.llm = llm or build_llm_client()
         self.crop_model = crop_model
         self.fertilizer_db = fertilizer_db
         self.features = features
         self.weather_api = weather_api
         self.prompt_factory = PromptFactory()
+        self.response_cache = response_cache
+        self._late_tasks = set()  # late answers running on the event loop, kept until they land
+        self.metrics = ChatbotMetrics()
+        self.intent_classifier = LocalIntentClassifier(
+            log_path=os.environ.get('CHATBOT_TURN_LOG') or None,
+            min_confidence=float(os.environ.get('CHATBOT_LOCAL_INTENT_CONFIDENCE', 0.85))
+        )
+        crop_names = list(fertilizer_db['Crop']) if fertilizer_db is not None and 'Crop' in fertilizer_db else []
+        crop_names += [str(name) for name in getattr(crop_model, 'classes_', [])]
+        self.parameter_extractor = LocalParameterExtractor(crop_names)
+
+    @staticmethod
+    def _call_timeout() -> Optional[float]:
+        """What is left of the turn's deadline; None outside a turn (the client's own timeout applies)"""
+        turn = _current_turn.get()
+        return None if turn is None else turn.remaining()
+
+    def _generate(self, prompt: str, purpose: str, json_mode: bool = False) -> str:
+        """Every LLM call goes through here so latency and calls per turn are recorded"""
+        tokens = self._log_prompt_size(prompt, purpose)
+        start = time.perf_counter()
+        ok = False
+        try:
+            text = self.llm.generate(prompt, purpose, timeout=self._call_timeout(), json_mode=json_mode)
+            ok = True
+            return text
+        finally:
+            self._record_call(purpose, start, ok, tokens)
+
+    async def _agenerate(self, prompt: str, purpose: str, json_mode: bool = False) -> str:
+        """Async counterpart of _generate"""
+        tokens = self._log_prompt_size(prompt, purpose)
+        start = time.perf_counter()
+        ok = False
+        try:
+            text = await self.llm.agenerate(prompt, purpose, timeout=self._call_timeout(), json_mode=json_mode)
+            ok = True
+            return text
+        finally:
+            self._record_call(purpose, start, ok, tokens)
+
+    def _record_call(self, purpose: str, start: float, ok: bool, tokens: int):
+        self.metrics.record_call(purpose, time.perf_counter() - start, ok, tokens)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.llm_calls += 1
+
+    @staticmethod
+    def _log_prompt_size(prompt: str, purpose: str) -> int:
+        tokens = estimate_tokens(prompt)
+        logging.debug(f"Chatbot prompt for {purpose}: {len(prompt)} chars, ~{tokens} tokens")
+        return tokens
+
+    def _generate_stream(self, prompt: str, purpose: str) -> Iterator[str]:
+        """
+        Streaming counterpart of _generate, yielding text chunks as they arrive. The turn deadline
+        bounds the wait for the first chunk; the text the user is already reading is not cut off.
+        """
+        tokens = self._log_prompt_size(prompt, purpose)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield from self.llm.generate_stream(prompt, purpose, first_chunk_timeout=self._call_timeout())
+            ok = True
+        finally:
+            self._record_call(purpose, start, ok, tokens)
+
+    @staticmethod
+    def _strip_code_fences(text: str) -> str:
+        text = text.strip()
+        text = re.sub(r'```json\n?', '', text)
+        return re.sub(r'```\n?', '', text)
+
+    @staticmethod
+    def _clean_parameters(params: Any) -> Dict:
+        """Keep known parameters only, with numbers as floats and text trimmed"""
+        if not isinstance(params, dict):
+            raise ValueError("parameters must be a JSON object")
+        cleaned = {}
+        for key in NUMERIC_PARAMETERS:
+            value = params.get(key, params.get(key.lower()))
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                cleaned[key] = float(value)
+            except (TypeError, ValueError):
+                continue
+        for key in TEXT_PARAMETERS:
+            value = params.get(key)
+            if isinstance(value, str) and value.strip():
+                cleaned[key] = value.strip()
+        return cleaned
+
+    @classmethod
+    def _parse_analysis(cls, text: str) -> Tuple[str, Dict]:
+        """Validate the analyze reply against its schema; raises ValueError if it does not match"""
+        payload = json.loads(cls._strip_code_fences(text))
+        if not isinstance(payload, dict):
+            raise ValueError("analysis must be a JSON object")
+        intent = str(payload.get('intent', '')).strip().upper()
+        if intent not in INTENTS:
+            raise ValueError(f"unknown intent {intent!r}")
+        return intent, cls._clean_parameters(payload.get('parameters') or {})
+
+    def analyze(self, message: str, context: ChatContext) -> Tuple[str, Dict]:
+        """Intent and parameters from one JSON-mode Gemini call; two separate calls if that fails"""
+        try:
+            text = self._generate(self.prompt_factory.analysis(message, context), 'analyze', json_mode=True)
+            return self._parse_analysis(text)
+        except Exception:
+            self._analysis_failed()
+        return self.classify_intent(message, context), self.extract_parameters(message, context)
+
+    async def aanalyze(self, message: str, context: ChatContext) -> Tuple[str, Dict]:
+        """Async analyze; the fallback classification and extraction calls run concurrently"""
+        try:
+            text = await self._agenerate(self.prompt_factory.analysis(message, context), 'analyze', json_mode=True)
+            return self._parse_analysis(text)
+        except Exception:
+            self._analysis_failed()
+        intent, params = await asyncio.gather(self.aclassify_intent(message, context), self.aextract_parameters(message, context))
+        return intent, params
+
+    def _analysis_failed(self):
+        logging.warning("Combined intent/parameter analysis failed; using separate calls.", exc_info=True)
+        self.metrics.count('analyze_fallbacks')
 
     def classify_intent(self, message: str, context: ChatContext) -> str:
         """Classify user intent using Gemini"""
         classification_prompt = self.prompt_factory.classification(message, context)
         
         try:
-            response = self.model.generate_content(classification_prompt)
-            intent = response.text.strip().upper()
-            return intent if intent in ['CROP_RECOMMENDATION', 'FERTILIZER_ADVICE', 
-                                      'WEATHER_INQUIRY', 'SOIL_MANAGEMENT', 
-                                      'DISEASE_PEST', 'GENERAL_HELP', 'GREETING'] else 'GENERAL_HELP'
+            return self._parse_intent(self._generate(classification_prompt, 'classify_intent'))
         except Exception:
             logging.error("Gemini API call failed during intent classification.", exc_info=True)
             return 'GENERAL_HELP'
 
+    async def aclassify_intent(self, message: str, context: ChatContext) -> str:
+        try:
+            return self._parse_intent(await self._agenerate(self.prompt_factory.classification(message, context), 'classify_intent'))
+        except Exception:
+            logging.error("Gemini API call failed during intent classification.", exc_info=True)
+            return 'GENERAL_HELP'
+
+    @staticmethod
+    def _parse_intent(text: str) -> str:
+        intent = text.strip().upper()
+        return intent if intent in INTENTS else 'GENERAL_HELP'
+
     def extract_parameters(self, message: str, context: ChatContext) -> Dict:
         """Extract agricultural parameters from user message"""
         extraction_prompt = self.prompt_factory.parameter_extraction(message, context)
         
         try:
-            response = self.model.generate_content(extraction_prompt)
-            # Clean response and parse JSON
-            json_text = response.text.strip()
-            json_text = re.sub(r'```json\n?', '', json_text)
-            json_text = re.sub(r'```\n?', '', json_text)
-            return json.loads(json_text)
+            json_text = self._strip_code_fences(self._generate(extraction_prompt, 'extract_parameters'))
+            return self._clean_parameters(json.loads(json_text))
+        except Exception:
+            logging.error("Gemini API call failed during parameter extraction.", exc_info=True)
+            return {}
+
+    async def aextract_parameters(self, message: str, context: ChatContext) -> Dict:
+        try:
+            text = await self._agenerate(self.prompt_factory.parameter_extraction(message, context), 'extract_parameters')
+            return self._clean_parameters(json.loads(self._strip_code_fences(text)))
         except Exception:
             logging.error("Gemini API call failed during parameter extraction.", exc_info=True)
             return {}
@@ -173,9 +881,9 @@ class AgriVisionChatbot:
             soil_data_normalized = {k.lower(): v for k, v in soil_data.items()}
             
             # Check if we have all required features
-            if all(key in soil_data_normalized for key in required_features):
+            if all(key.lower() in soil_data_normalized for key in required_features):
                 # Prepare data in the correct order for the model
-                feature_values = [soil_data_normalized[key] for key in self.features]
+                feature_values = [float(soil_data_normalized[key.lower()]) for key in self.features]
                 
                 # Call existing crop prediction
                 predictions = self.crop_model.predict_proba([feature_values])[0]
@@ -218,23 +926,28 @@ class AgriVisionChatbot:
             if max_def == 0:
                 return {"message": "Soil nutrients are adequate for this crop.", "type": "balanced"}
 
+            # Every nutrient's gap, for the local template when Gemini does not answer in time
+            breakdown = {
+                "deficiencies": {"N": round(n_def, 2), "P": round(p_def, 2), "K": round(k_def, 2)},
+                "recommended": {"N": float(rec_N), "P": float(rec_P), "K": float(rec_K)}
+            }
             if max_def == n_def:
                 return {
                     "type": "Nitrogen", "deficiency": round(n_def, 2),
                     "recommendation": f"Add {round(n_def, 2)} units of Nitrogen fertilizer.",
-                    "fertilizer_type": "Urea or Ammonium Nitrate"
+                    "fertilizer_type": "Urea or Ammonium Nitrate", **breakdown
                 }
             elif max_def == p_def:
                 return {
                     "type": "Phosphorus", "deficiency": round(p_def, 2),
                     "recommendation": f"Add {round(p_def, 2)} units of Phosphorus fertilizer.",
-                    "fertilizer_type": "DAP or Superphosphate"
+                    "fertilizer_type": "DAP or Superphosphate", **breakdown
                 }
             else:
                 return {
                     "type": "Potassium", "deficiency": round(k_def, 2),
                     "recommendation": f"Add {round(k_def, 2)} units of Potassium fertilizer.",
-                    "fertilizer_type": "Potash or MOP"
+                    "fertilizer_type": "Potash or MOP", **breakdown
                 }
         except Exception:
             logging.error("Error in local fertilizer advice logic.", exc_info=True)
@@ -250,10 +963,52 @@ class AgriVisionChatbot:
             logging.error("Error fetching weather data.", exc_info=True)
             return None
 
-    def generate_response(self, message: str, context: ChatContext) -> Dict[str, Any]:
-        """Generate intelligent response using Gemini"""
-        intent = self.classify_intent(message, context)
-        extracted_params = self.extract_parameters(message, context)
+    def _classify_locally(self, message: str) -> Tuple[Optional[Tuple[str, float, str]], Dict, str]:
+        """
+        Local intent and parameters, plus which Gemini call the turn still needs: 'none',
+        'extract' (intent known, parameters missing) or 'analyze' (intent unknown).
+        """
+        local_params = self.parameter_extractor.extract(message)
+        local = self.intent_classifier.classify(message)
+        if not local:
+            self.metrics.count('intent_remote')
+            return None, local_params, 'analyze'
+        self.metrics.count('intent_fast_path')
+        # Gemini extraction only runs when the local parse found nothing an intent needs
+        if local_params or local[0] not in PARAMETER_INTENTS:
+            self.metrics.count('params_local')
+            return local, local_params, 'none'
+        self.metrics.count('params_llm')
+        return local, local_params, 'extract'
+
+    def _classify_turn(self, message: str, context: ChatContext) -> Tuple[str, Dict, str]:
+        """(intent, parameters, source) for a message, asking Gemini only what the local pass could not answer"""
+        local, local_params, needs = self._classify_locally(message)
+        if needs == 'none':
+            return local[0], local_params, local[2]
+        if needs == 'extract':
+            return local[0], self.extract_parameters(message, context), local[2]
+        intent, params = self.analyze(message, context)
+        # Locally parsed values are exact; they override the model's reading of the same field
+        return intent, {**params, **local_params}, 'llm'
+
+    async def _aclassify_turn(self, message: str, context: ChatContext) -> Tuple[str, Dict, str]:
+        local, local_params, needs = self._classify_locally(message)
+        if needs == 'none':
+            return local[0], local_params, local[2]
+        if needs == 'extract':
+            return local[0], await self.aextract_parameters(message, context), local[2]
+        intent, params = await self.aanalyze(message, context)
+        return intent, {**params, **local_params}, 'llm'
+
+    def _prepare_turn(self, message: str, context: ChatContext) -> Tuple[str, 'PreparedReply']:
+        """Classify the message, merge extracted parameters into the context and prepare the reply"""
+        intent, extracted_params, intent_source = self._classify_turn(message, context)
+        return intent, self._prepare_for_intent(message, context, intent, extracted_params, intent_source)
+
+    def _prepare_for_intent(self, message: str, context: ChatContext, intent: str, extracted_params: Dict,
+                            intent_source: str) -> 'PreparedReply':
+        self.intent_classifier.log_turn(message, intent, intent_source)
         
         # Update context with new parameters
         if context.soil_data:
@@ -265,40 +1020,194 @@ class AgriVisionChatbot:
         if 'location' in extracted_params:
             context.location = extracted_params['location']
 
-        response_data = {
-            'response': '',
-            'actions': [],
-            'data': {},
-            'suggestions': []
-        }
-
         # Handle different intents
         if intent == 'GREETING':
-            response_data = self._handle_greeting(context)
-            
+            prepared = self._prepare_greeting(context)
         elif intent == 'CROP_RECOMMENDATION':
-            response_data = self._handle_crop_recommendation(message, context)
-            
+            prepared = self._prepare_crop_recommendation(message, context)
         elif intent == 'FERTILIZER_ADVICE':
-            response_data = self._handle_fertilizer_advice(message, context)
-            
+            prepared = self._prepare_fertilizer_advice(message, context)
         elif intent == 'WEATHER_INQUIRY':
-            response_data = self._handle_weather_inquiry(message, context)
-            
+            prepared = self._prepare_weather_inquiry(message, context)
         else:
-            response_data = self._handle_general_query(message, context)
+            prepared = self._prepare_general_query(message, context)
+        return prepared
+
+    @staticmethod
+    def _begin_turn() -> TurnState:
+        turn = TurnState(deadline=time.monotonic() + TURN_DEADLINE)
+        _current_turn.set(turn)
+        return turn
 
+    def _finish_turn(self, message: str, context: ChatContext, intent: str, response_data: Dict, start: float,
+                     turn: TurnState):
         # Add conversation to history
-        context.conversation_history.append({
-            'user': message,
-            'bot': response_data['response'],
-            'timestamp': datetime.now().isoformat(),
-            'intent': intent
-        })
+        context.add_turn(message, response_data['response'], intent)
+        self.metrics.record_turn(turn.llm_calls, time.perf_counter() - start)
+
+    def generate_response(self, message: str, context: ChatContext) -> Dict[str, Any]:
+        """Generate intelligent response using Gemini"""
+        start = time.perf_counter()
+        turn = self._begin_turn()
+        intent, prepared = self._prepare_turn(message, context)
+        response_data = self._render(prepared)
+        self._finish_turn(message, context, intent, response_data, start, turn)
+        return response_data
 
+    async def agenerate_response(self, message: str, context: ChatContext) -> Dict[str, Any]:
+        """
+        Async generate_response with the same result. Gemini calls are awaited instead of holding a
+        thread, and the blocking local steps (crop model, fertilizer table, weather lookup) run in
+        a worker thread.
+        """
+        start = time.perf_counter()
+        turn = self._begin_turn()
+        intent, params, source = await self._aclassify_turn(message, context)
+        prepared = await asyncio.to_thread(self._prepare_for_intent, message, context, intent, params, source)
+        response_data = await self._arender(prepared)
+        self._finish_turn(message, context, intent, response_data, start, turn)
         return response_data
 
-    def _handle_greeting(self, context: ChatContext) -> Dict:
+    def stream_response(self, message: str, context: ChatContext) -> Iterator[Tuple[str, Any]]:
+        """
+        Same turn as generate_response, streamed: yields ('token', text) as Gemini produces the
+        answer, then ('done', response_data) with the full text, actions, data and suggestions.
+        If the stream breaks off, the tokens already sent are discarded: the 'done' reply is the
+        local fallback, which the client shows in place of the partial text.
+        """
+        start = time.perf_counter()
+        turn = self._begin_turn()
+        intent, prepared = self._prepare_turn(message, context)
+
+        parts = []
+        completed = False
+        late = None
+        cached = self.response_cache.get(prepared.cache_key) if prepared.cache_key else None
+        if cached is not None:
+            parts.append(cached)
+            completed = True
+            self.metrics.record_ttft(time.perf_counter() - start)
+            yield 'token', cached
+        elif prepared.prompt is not None:
+            try:
+                for text in self._generate_stream(prepared.prompt, prepared.purpose):
+                    if not parts:
+                        self.metrics.record_ttft(time.perf_counter() - start)
+                    parts.append(text)
+                    yield 'token', text
+                completed = True
+            except LLMTimeoutError:
+                late = self._missed_deadline(prepared)
+            except Exception as e:
+                logging.error(f"Gemini streaming failed for {prepared.purpose}: {e}", exc_info=True)
+
+        if completed and parts:
+            response_data = prepared.reply(''.join(parts))
+            if prepared.cache_key and cached is None:
+                self.response_cache.set(prepared.cache_key, response_data['response'])
+        elif parts:
+            self.metrics.count('stream_interrupted')
+            response_data = late or prepared.reply()
+        else:
+            self.metrics.record_ttft(time.perf_counter() - start)
+            response_data = late or prepared.reply()
+            yield 'token', response_data['response']
+        self._finish_turn(message, context, intent, response_data, start, turn)
+        yield 'done', response_data
+
+    def _render(self, prepared: 'PreparedReply') -> Dict:
+        """Turn a prepared reply into the response, falling back to its local text if Gemini fails"""
+        if prepared.prompt is None:
+            return prepared.reply()
+        try:
+            if prepared.cache_key:
+                return prepared.reply(self.response_cache.get_or_load(
+                    prepared.cache_key, lambda: self._generate_answer(prepared)
+                ))
+            return prepared.reply(self._generate(prepared.prompt, prepared.purpose))
+        except LLMTimeoutError:
+            return self._missed_deadline(prepared)
+        except Exception as e:
+            logging.error(f"Gemini API call failed for {prepared.purpose}: {e}", exc_info=True)
+            return prepared.reply()
+
+    async def _arender(self, prepared: 'PreparedReply') -> Dict:
+        if prepared.prompt is None:
+            return prepared.reply()
+        try:
+            if prepared.cache_key:
+                # Through the cache's single-flight like the sync path, so concurrent identical
+                # questions (from either path) share one Gemini call
+                return prepared.reply(await self.response_cache.aget_or_load(
+                    prepared.cache_key, lambda: self._agenerate_answer(prepared)
+                ))
+            return prepared.reply(await self._agenerate(prepared.prompt, prepared.purpose))
+        except LLMTimeoutError:
+            return self._missed_deadline(prepared)
+        except Exception as e:
+            logging.error(f"Gemini API call failed for {prepared.purpose}: {e}", exc_info=True)
+            return prepared.reply()
+
+    @staticmethod
+    def _finishes_late(prepared: 'PreparedReply') -> bool:
+        """Whether an answer that misses the deadline keeps running to fill the response cache"""
+        return LATE_ANSWERS == 'cache' and prepared.cache_key is not None and _current_turn.get() is not None
+
+    def _store_late_answer(self, prepared: 'PreparedReply', future):
+        if not future.cancelled() and future.exception() is None:
+            self.response_cache.set(prepared.cache_key, future.result())
+            self.metrics.count('late_answers_cached')
+
+    def _answer_in_background(self, prepared: 'PreparedReply') -> Future:
+        """Answer call on the late-answer pool with the client's full timeout; cached whenever it lands"""
+        def answer():
+            # A turn of its own, so a late answer is not counted against the turn that gave up on it
+            _current_turn.set(TurnState(deadline=time.monotonic() + self.llm.timeout))
+            return self._generate(prepared.prompt, prepared.purpose)
+
+        future = _late_answers.submit(Context().run, answer)
+        future.add_done_callback(lambda done: self._store_late_answer(prepared, done))
+        return future
+
+    def _aanswer_in_background(self, prepared: 'PreparedReply') -> asyncio.Task:
+        """_answer_in_background as a task on the running loop, in a fresh context of its own"""
+        async def answer():
+            _current_turn.set(TurnState(deadline=time.monotonic() + self.llm.timeout))
+            return await self._agenerate(prepared.prompt, prepared.purpose)
+
+        task = asyncio.get_running_loop().create_task(answer(), context=Context())
+        self._late_tasks.add(task)
+        task.add_done_callback(self._late_tasks.discard)
+        task.add_done_callback(lambda done: self._store_late_answer(prepared, done))
+        return task
+
+    def _generate_answer(self, prepared: 'PreparedReply') -> str:
+        """The answer for a cacheable reply, waited on no longer than the turn deadline"""
+        if not self._finishes_late(prepared):
+            return self._generate(prepared.prompt, prepared.purpose)
+        future = self._answer_in_background(prepared)
+        try:
+            return future.result(timeout=max(0.0, _current_turn.get().remaining()))
+        except FutureTimeoutError:
+            raise LLMTimeoutError(f"{prepared.purpose} missed the turn deadline") from None
+
+    async def _agenerate_answer(self, prepared: 'PreparedReply') -> str:
+        """Async _generate_answer; waiting on the answer holds no thread"""
+        if not self._finishes_late(prepared):
+            return await self._agenerate(prepared.prompt, prepared.purpose)
+        task = self._aanswer_in_background(prepared)
+        try:
+            # Shielded, so giving up on the answer leaves the task running to fill the cache
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, _current_turn.get().remaining()))
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"{prepared.purpose} missed the turn deadline") from None
+
+    def _missed_deadline(self, prepared: 'PreparedReply') -> Dict:
+        logging.warning(f"Gemini missed the turn deadline for {prepared.purpose}; answering from the local template")
+        self.metrics.count('deadline_fallbacks')
+        return prepared.reply(prepared.deadline_fallback)
+
+    def _prepare_greeting(self, context: ChatContext) -> 'PreparedReply':
         """Handle greeting messages"""
         role_specific = {
             'farmer': "Hello! I'm AgriBot, your farming assistant. I can help you with crop recommendations, fertilizer advice, and weather-based farming guidance.",
@@ -306,65 +1215,53 @@ class AgriVisionChatbot:
             'user': "Hi there! I'm AgriBot, your agricultural assistant. Ask me about crops, farming, weather, or soil management!"
         }
         greeting = role_specific.get(context.user_role, role_specific['user'])
-        response_text = f"{greeting}\n\nWhat would you like to know about today? \U0001F33E"
-
-        return {
-            'response': response_text,
-            'actions': ['greeting'],
-            'data': {},
-            'suggestions': ['Recommend a crop', 'Weather in my city', 'How to improve soil?']
-        }
+        return PreparedReply(
+            fallback=f"{greeting}\n\nWhat would you like to know about today? \U0001F33E",
+            actions=['greeting'],
+            suggestions=['Recommend a crop', 'Weather in my city', 'How to improve soil?']
+        )
 
-    def _handle_crop_recommendation(self, message: str, context: ChatContext) -> Dict:
+    def _prepare_crop_recommendation(self, message: str, context: ChatContext) -> 'PreparedReply':
         """Handle crop recommendation queries"""
         if not context.soil_data:
-            return {
-                'response': "I'd love to recommend the best crops for you! Could you share your soil details?\n\nI need:\n• Nitrogen (N) level\n• Phosphorus (P) level\n• Potassium (K) level\n• Soil pH\n• Average temperature\n• Humidity level\n• Expected rainfall\n\nExample: 'My soil has N-90, P-40, K-50, pH-6.5, temperature 25°C, humidity 80%, rainfall 200mm'",
-                'actions': ['request_soil_data'],
-                'suggestions': ['Get Soil Test', 'Enter Soil Data', 'Weather Check']
-            }
+            return PreparedReply(
+                fallback="I'd love to recommend the best crops for you! Could you share your soil details?\n\nI need:\n• Nitrogen (N) level\n• Phosphorus (P) level\n• Potassium (K) level\n• Soil pH\n• Average temperature\n• Humidity level\n• Expected rainfall\n\nExample: 'My soil has N-90, P-40, K-50, pH-6.5, temperature 25°C, humidity 80%, rainfall 200mm'",
+                actions=['request_soil_data'],
+                suggestions=['Get Soil Test', 'Enter Soil Data', 'Weather Check']
+            )
 
         # Check if we have enough data for prediction
-        required_params = ['N', 'P', 'K', 'temperature', 'humidity', 'rainfall']
-        missing_params = [p for p in required_params if p not in context.soil_data]
+        required_params = ['N', 'P', 'K', 'pH', 'temperature', 'humidity', 'rainfall']
+        present = {key.lower() for key in context.soil_data}
+        missing_params = [p for p in required_params if p.lower() not in present]
         
         if missing_params:
-            return {
-                'response': f"I need a bit more information to give you accurate recommendations.\n\nMissing: {', '.join(missing_params)}\n\nCould you provide these values?",
-                'actions': ['request_missing_data'],
-                'data': {'missing_params': missing_params}
-            }
+            return PreparedReply(
+                fallback=f"I need a bit more information to give you accurate recommendations.\n\nMissing: {', '.join(missing_params)}\n\nCould you provide these values?",
+                actions=['request_missing_data'],
+                data={'missing_params': missing_params}
+            )
 
         # Get crop recommendations
         recommendations = self.get_crop_recommendations(context.soil_data)
         context.last_crop_recommendations = recommendations
 
         if not recommendations:
-            return {
-                'response': "I'm having trouble analyzing your soil data right now. Please check your values and try again.",
-                'actions': ['retry_analysis']
-            }
+            return PreparedReply(
+                fallback="I'm having trouble analyzing your soil data right now. Please check your values and try again.",
+                actions=['retry_analysis']
+            )
 
-        # Generate detailed response using Gemini
-        detailed_prompt = self.prompt_factory.crop_recommendation(message, context, recommendations)
-        
-        try:
-            gemini_response = self.model.generate_content(detailed_prompt)
-            detailed_response = gemini_response.text
-        except Exception as e:
-            # Fallback response
-            logging.error(f"Gemini API call failed in _handle_crop_recommendation: {e}", exc_info=True)
-            crop_list = [f"{rec['crop']} ({rec['probability']}% suitable)" for rec in recommendations]
-            detailed_response = f"Based on your soil analysis, here are my top recommendations:\n\n{chr(10).join(crop_list)}\n\nThese crops match well with your soil's NPK levels and environmental conditions!"
-
-        return {
-            'response': detailed_response,
-            'actions': ['show_crop_details', 'get_fertilizer_advice'],
-            'data': {'recommendations': recommendations},
-            'suggestions': ['Fertilizer Advice', 'Weather Update', 'Soil Tips']
-        }
+        return PreparedReply(
+            prompt=self.prompt_factory.crop_recommendation(message, context, recommendations),
+            purpose='crop_recommendation',
+            fallback=LocalTemplates.crop_recommendation(context.soil_data, recommendations),
+            actions=['show_crop_details', 'get_fertilizer_advice'],
+            data={'recommendations': recommendations},
+            suggestions=['Fertilizer Advice', 'Weather Update', 'Soil Tips']
+        )
 
-    def _handle_fertilizer_advice(self, message: str, context: ChatContext) -> Dict:
+    def _prepare_fertilizer_advice(self, message: str, context: ChatContext) -> 'PreparedReply':
         """Handle fertilizer advice queries"""
         # Extract crop from message or use last recommendation
         crop = None
@@ -374,160 +1271,207 @@ class AgriVisionChatbot:
             crop = context.last_crop_recommendations[0]['crop']
 
         if not crop:
-            return {
-                'response': "Which crop would you like fertilizer advice for? You can mention the crop name or I can suggest based on your soil conditions.",
-                'actions': ['request_crop_selection'],
-                'suggestions': ['Recommend Crops First', 'Rice Fertilizer', 'Wheat Fertilizer']
-            }
+            return PreparedReply(
+                fallback="Which crop would you like fertilizer advice for? You can mention the crop name or I can suggest based on your soil conditions.",
+                actions=['request_crop_selection'],
+                suggestions=['Recommend Crops First', 'Rice Fertilizer', 'Wheat Fertilizer']
+            )
 
         if not context.soil_data or not any(k in context.soil_data for k in ['N', 'P', 'K']):
-            return {
-                'response': f"To give you the best fertilizer advice for {crop}, I need your current soil NPK levels.\n\nCould you share:\n• Nitrogen (N) level\n• Phosphorus (P) level\n• Potassium (K) level",
-                'actions': ['request_npk_data'],
-                'suggestions': ['Get Soil Test', 'Skip to General Advice']
-            }
+            return PreparedReply(
+                fallback=f"To give you the best fertilizer advice for {crop}, I need your current soil NPK levels.\n\nCould you share:\n• Nitrogen (N) level\n• Phosphorus (P) level\n• Potassium (K) level",
+                actions=['request_npk_data'],
+                suggestions=['Get Soil Test', 'Skip to General Advice']
+            )
 
         # Get fertilizer recommendations
         fertilizer_info = self.get_fertilizer_advice(crop, context.soil_data)
         context.last_fertilizer_advice = fertilizer_info
 
         if not fertilizer_info:
-            return {
-                'response': f"I'm working on fertilizer recommendations for {crop}. This feature is being enhanced!",
-                'actions': ['feature_development']
-            }
-
-        # Generate detailed fertilizer response
-        fertilizer_prompt = self.prompt_factory.fertilizer_advice(message, context, crop, fertilizer_info)
-        
-        try:
-            gemini_response = self.model.generate_content(fertilizer_prompt)
-            detailed_response = gemini_response.text
-        except Exception as e:
-            # Fallback response
-            logging.error(f"Gemini API call failed in _handle_fertilizer_advice: {e}", exc_info=True)
-            if fertilizer_info.get("type") == "balanced":
-                detailed_response = fertilizer_info.get("message", "Your soil seems balanced for this crop.")
-            else:
-                detailed_response = f"For your {crop} crop, you have a {fertilizer_info.get('type')} deficiency of {fertilizer_info.get('deficiency')} units. It is recommended to use {fertilizer_info.get('fertilizer_type')}."
+            return PreparedReply(
+                fallback=f"I'm working on fertilizer recommendations for {crop}. This feature is being enhanced!",
+                actions=['feature_development']
+            )
 
-        return {
-            'response': detailed_response,
-            'actions': ['show_fertilizer_details'],
-            'data': {'fertilizer_info': fertilizer_info},
-            'suggestions': ['Weather Check', 'Soil Improvement', 'Crop Care Tips']
-        }
+        return PreparedReply(
+            prompt=self.prompt_factory.fertilizer_advice(message, context, crop, fertilizer_info),
+            purpose='fertilizer_advice',
+            fallback=LocalTemplates.fertilizer_advice(crop, fertilizer_info),
+            actions=['show_fertilizer_details'],
+            data={'fertilizer_info': fertilizer_info},
+            suggestions=['Weather Check', 'Soil Improvement', 'Crop Care Tips']
+        )
 
-    def _handle_weather_inquiry(self, message: str, context: ChatContext) -> Dict:
+    def _prepare_weather_inquiry(self, message: str, context: ChatContext) -> 'PreparedReply':
         """Handle weather-related queries"""
         location = context.location or context.soil_data.get('location') if context.soil_data else None
         
         if not location:
-            return {
-                'response': "Which location would you like weather information for? Please mention your city or region.",
-                'actions': ['request_location'],
-                'suggestions': ['Mumbai Weather', 'Delhi Weather', 'Bangalore Weather']
-            }
+            return PreparedReply(
+                fallback="Which location would you like weather information for? Please mention your city or region.",
+                actions=['request_location'],
+                suggestions=['Mumbai Weather', 'Delhi Weather', 'Bangalore Weather']
+            )
 
         # Get weather data
         weather_data = self.get_weather_data(location)
         
         if not weather_data:
-            return {
-                'response': f"I'm having trouble getting weather data for {location} right now. Please try again in a moment.",
-                'actions': ['retry_weather']
-            }
-
-        # Generate weather-based farming advice
-        weather_prompt = self.prompt_factory.weather_inquiry(message, context, location, weather_data)
-        
-        try:
-            gemini_response = self.model.generate_content(weather_prompt)
-            detailed_response = gemini_response.text
-        except Exception as e:
-            # Fallback response
-            logging.error(f"Gemini API call failed in _handle_weather_inquiry: {e}", exc_info=True)
-            temp = weather_data.get('temperature', 'N/A')
-            humidity = weather_data.get('humidity', 'N/A')
-            detailed_response = f"Weather in {location}:\n• Temperature: {temp}°C\n• Humidity: {humidity}%\n\nThis is good weather for most farming activities. Consider irrigation if humidity is low."
+            return PreparedReply(
+                fallback=f"I'm having trouble getting weather data for {location} right now. Please try again in a moment.",
+                actions=['retry_weather']
+            )
 
-        return {
-            'response': detailed_response,
-            'actions': ['show_weather_details'],
-            'data': {'weather': weather_data},
-            'suggestions': ['Irrigation Advice', 'Crop Protection', 'Harvest Timing']
-        }
+        return PreparedReply(
+            prompt=self.prompt_factory.weather_inquiry(message, context, location, weather_data),
+            purpose='weather_inquiry',
+            fallback=LocalTemplates.weather(location, weather_data),
+            actions=['show_weather_details'],
+            data={'weather': weather_data},
+            suggestions=['Irrigation Advice', 'Crop Protection', 'Harvest Timing']
+        )
 
-    def _handle_general_query(self, message: str, context: ChatContext) -> Dict:
+    def _prepare_general_query(self, message: str, context: ChatContext) -> 'PreparedReply':
         """Handle general agricultural queries"""
-        general_prompt = self.prompt_factory.general_query(message, context)
-        
-        try:
-            gemini_response = self.model.generate_content(general_prompt)
-            response_text = gemini_response.text
-        except Exception as e:
-            logging.error(f"Gemini API call failed in _handle_general_query: {e}", exc_info=True)
-            response_text = "I'm sorry, I'm having a little trouble connecting to my knowledge base right now. Please check your API key and network connection, then try asking your question again in a moment."
-
-        return {
-            'response': response_text,
-            'actions': ['general_advice'],
-            'suggestions': ['Crop Recommendations', 'Fertilizer Advice', 'Weather Check', 'Platform Help']
-        }
+        cache_key = None
+        if depends_on_history(message, context):
+            self.metrics.count('response_cache_bypassed')
+        else:
+            normalized = normalize_question(message)
+            cache_key = f"{context.user_role}:{normalized}" if normalized else None
+        return PreparedReply(
+            prompt=self.prompt_factory.general_query(message, context),
+            purpose='general_query',
+            cache_key=cache_key,
+            fallback="I'm sorry, I'm having a little trouble connecting to my knowledge base right now. Please check your API key and network connection, then try asking your question again in a moment.",
+            deadline_fallback="That question is taking me longer than usual to answer. Please ask again in a moment, or try one of the topics below.",
+            actions=['general_advice'],
+            suggestions=['Crop Recommendations', 'Fertilizer Advice', 'Weather Check', 'Platform Help']
+        )
 
 
 # Flask integration for AgriVision
 def integrate_chatbot_with_flask(app, crop_model, features, fertilizer_db, weather_api):
     """Integrate chatbot with existing Flask app"""
     
-    # Store chatbot instance and user contexts
+    # Store chatbot instance and user contexts (bounded; shared across workers with the SQLite store)
     app.chatbot = AgriVisionChatbot(crop_model, features, fertilizer_db, weather_api)
-    app.user_contexts = {}  # Store contexts by session ID
+    app.context_store = build_context_store(ChatContext.from_json)
     
+    def request_context(data):
+        """(session id, context) for the caller, created on first use and updated with any provided data"""
+        session_id = session.get('user', 'anonymous')  # Use username for unique session
+        context = app.context_store.get(session_id)
+        if context is None:
+            context = ChatContext(user_role=session.get('role', 'user'))
+        
+        # Update context with any provided data
+        if 'soil_data' in data:
+            context.soil_data = data['soil_data']
+        if 'location' in data:
+            context.location = data['location']
+        return session_id, context
+
+    def response_payload(response_data):
+        return {
+            'success': True,
+            'response': response_data['response'],
+            'actions': response_data.get('actions', []),
+            'data': response_data.get('data', {}),
+            'suggestions': response_data.get('suggestions', []),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def begin_turn():
+        """(message, session id, context) for a /api/chatbot request, or the 400 response"""
+        data = request.get_json()
+        message = data.get('message', '').strip()
+        if not message:
+            return None, (jsonify({'error': 'No message provided'}), 400)
+        return (message, *request_context(data)), None
+
+    def finish_turn(session_id, context, response_data):
+        app.context_store.save(session_id, context)
+        return jsonify(response_payload(response_data))
+
+    def turn_failed(e):
+        logging.error(f"Error in /api/chatbot endpoint: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': 'Chatbot service temporarily unavailable',
+            'details': str(e)
+        }), 500
+
     @app.route('/api/chatbot', methods=['POST'])
     def chatbot_endpoint():
         try:
-            data = request.get_json()
-            message = data.get('message', '').strip()
-            session_id = session.get('user', 'anonymous')  # Use username for unique session
-            
-            if not message:
-                return jsonify({'error': 'No message provided'}), 400
-            
-            # Get or create user context
-            if session_id not in app.user_contexts:
-                app.user_contexts[session_id] = ChatContext(
-                    user_role=session.get('role', 'user')
-                )
-            
-            context = app.user_contexts[session_id]
-            
-            # Update context with any provided data
-            if 'soil_data' in data:
-                context.soil_data = data['soil_data']
-            if 'location' in data:
-                context.location = data['location']
-            
-            # Generate response
-            response_data = app.chatbot.generate_response(message, context)
-            
-            return jsonify({
-                'success': True,
-                'response': response_data['response'],
-                'actions': response_data.get('actions', []),
-                'data': response_data.get('data', {}),
-                'suggestions': response_data.get('suggestions', []),
-                'timestamp': datetime.now().isoformat()
-            })
-            
+            turn, error = begin_turn()
+            if error:
+                return error
+            message, session_id, context = turn
+            return finish_turn(session_id, context, app.chatbot.generate_response(message, context))
         except Exception as e:
-            logging.error(f"Error in /api/chatbot endpoint: {e}", exc_info=True)
-            return jsonify({
-                'success': False,
-                'error': 'Chatbot service temporarily unavailable',
-                'details': str(e)
-            }), 500
+            return turn_failed(e)
+
+    async def achatbot_endpoint():
+        """
+        /api/chatbot with Gemini calls awaited. The ASGI app (src/backend/asgi.py) runs it on its
+        event loop inside this app's request context, so a waiting turn holds no thread.
+        """
+        try:
+            turn, error = begin_turn()
+            if error:
+                return error
+            message, session_id, context = turn
+            return finish_turn(session_id, context, await app.chatbot.agenerate_response(message, context))
+        except Exception as e:
+            return turn_failed(e)
+
+    app.achatbot_endpoint = achatbot_endpoint
     
+    @app.route('/api/chatbot/stream', methods=['POST'])
+    def chatbot_stream():
+        """
+        /api/chatbot as server-sent events: 'token' events carry text as Gemini generates it and a
+        final 'done' event carries the same JSON body /api/chatbot returns.
+        """
+        data = request.get_json() or {}
+        message = data.get('message', '').strip()
+        if not message:
+            return jsonify({'error': 'No message provided'}), 400
+        session_id, context = request_context(data)
+
+        def events():
+            try:
+                for event, payload in app.chatbot.stream_response(message, context):
+                    if event == 'done':
+                        app.context_store.save(session_id, context)
+                    body = response_payload(payload) if event == 'done' else {'text': payload}
+                    yield f"event: {event}\ndata: {json.dumps(body)}\n\n"
+            except Exception as e:
+                logging.error(f"Error in /api/chatbot/stream endpoint: {e}", exc_info=True)
+                body = {'success': False, 'error': 'Chatbot service temporarily unavailable'}
+                yield f"event: error\ndata: {json.dumps(body)}\n\n"
+
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            # Proxies such as nginx buffer responses by default, which would hold back every token
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    @app.route('/api/chatbot/metrics', methods=['GET'])
+    def chatbot_metrics():
+        """LLM calls per turn and call latency by purpose"""
+        return jsonify({
+            'success': True,
+            'metrics': app.chatbot.metrics.snapshot(),
+            'response_cache': app.chatbot.response_cache.stats(),
+            'context_store': app.context_store.stats(),
+            'llm': app.chatbot.llm.stats()
+        })
+
     @app.route('/api/chatbot/context', methods=['GET', 'POST'])
     def chatbot_context():
         """Manage chatbot context"""
@@ -535,28 +1479,18 @@ def integrate_chatbot_with_flask(app, crop_model, features, fertilizer_db, weath
         
         if request.method == 'GET':
             # Get current context
-            context = app.user_contexts.get(session_id)
+            context = app.context_store.get(session_id)
             if context:
                 return jsonify({
                     'soil_data': context.soil_data,
                     'location': context.location,
-                    'conversation_count': len(context.conversation_history)
+                    'conversation_count': context.turn_count
                 })
             return jsonify({'message': 'No context found'})
         
         elif request.method == 'POST':
             # Update context
-            data = request.get_json()
-            if session_id not in app.user_contexts:
-                app.user_contexts[session_id] = ChatContext(
-                    user_role=session.get('role', 'user')
-                )
-            
-            context = app.user_contexts[session_id]
-            if 'soil_data' in data:
-                context.soil_data = data['soil_data']
-            if 'location' in data:
-                context.location = data['location']
+            app.context_store.save(*request_context(request.get_json()))
             
             return jsonify({'success': True, 'message': 'Context updated'})
     
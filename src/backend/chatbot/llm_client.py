@@ -0,0 +1,342 @@
+"""
+LLM clients for the chatbot.
+
+GeminiClient talks to Gemini; StubLLMClient answers offline with canned outputs after a
+configurable, seeded latency, for benchmarks and for running the app without a key. Both take a
+per-call timeout, raise LLMTimeoutError when it passes, and keep a latency histogram per purpose.
+Streams can also be given a separate, shorter deadline for their first chunk.
+"""
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+import warnings
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000)
+
+
+class LLMTimeoutError(TimeoutError):
+    """The call did not finish within its timeout or what was left of the turn's deadline"""
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        for i, bound in enumerate(self.buckets_ms):
+            if ms <= bound:
+                break
+        else:
+            i = len(self.buckets_ms)
+        self.counts[i] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def snapshot(self) -> Dict:
+        # A list rather than a dict so the buckets keep their order through jsonify; le_ms None is the overflow bucket
+        bounds = list(self.buckets_ms) + [None]
+        return {
+            'count': self.total,
+            'mean_ms': round(self.sum_ms / self.total, 1) if self.total else None,
+            'buckets': [{'le_ms': bound, 'count': count} for bound, count in zip(bounds, self.counts)]
+        }
+
+
+class LLMClient:
+    """
+    Interface shared by the clients: generate, generate_stream and agenerate, each taking the
+    prompt, a purpose label (used for the histograms and by the stub) and an optional timeout in
+    seconds. json_mode asks for a JSON object response. generate_stream also takes
+    first_chunk_timeout: the stream must start within it, then may run until its timeout.
+    """
+
+    backend = 'base'
+
+    def __init__(self, timeout: float = 15.0):
+        self.timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._outcomes = {'ok': 0, 'error': 0, 'timeout': 0}
+
+    def _timeout(self, timeout: Optional[float]) -> float:
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0:
+            raise LLMTimeoutError("no time left for an LLM call")
+        return timeout
+
+    def _first_chunk_timeout(self, first_chunk_timeout: Optional[float], timeout: float) -> float:
+        if first_chunk_timeout is None:
+            return timeout
+        if first_chunk_timeout <= 0:
+            raise LLMTimeoutError("no time left for an LLM call")
+        return min(first_chunk_timeout, timeout)
+
+    def _stream(self, open_stream: Callable[[], Iterable[str]], purpose: str, first_chunk_timeout: float) -> Iterator[str]:
+        """
+        Chunks of open_stream(), read on a thread of their own so the wait for the first one can
+        be cut off at first_chunk_timeout. Once the answer has started, only the timeout that
+        open_stream gave the transport applies, so a long answer is not aborted mid-sentence.
+        """
+        chunks = queue.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def read():
+            try:
+                for chunk in open_stream():
+                    if stop.is_set():
+                        return
+                    chunks.put(chunk)
+                chunks.put(end)
+            except BaseException as e:
+                chunks.put(e)
+
+        threading.Thread(target=read, name=f'llm-stream-{purpose}', daemon=True).start()
+        start = time.perf_counter()
+        error = None
+        try:
+            try:
+                chunk = chunks.get(timeout=first_chunk_timeout)
+            except queue.Empty:
+                raise LLMTimeoutError(f"{purpose} stream did not start within {first_chunk_timeout:.2f}s") from None
+            while chunk is not end:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+                chunk = chunks.get()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # An abandoned reader stops at its next chunk, or when the transport timeout ends the call
+            stop.set()
+            self._timed(purpose, start, error)
+
+    def _observe(self, purpose: str, seconds: float, outcome: str):
+        with self._lock:
+            self._histograms.setdefault(purpose, LatencyHistogram()).observe(seconds)
+            self._outcomes[outcome] += 1
+
+    def _timed(self, purpose: str, start: float, error: Optional[BaseException]):
+        outcome = 'ok' if error is None else 'timeout' if isinstance(error, LLMTimeoutError) else 'error'
+        self._observe(purpose, time.perf_counter() - start, outcome)
+
+    def generate(self, prompt: str, purpose: str = 'default', timeout: Optional[float] = None,
+                 json_mode: bool = False) -> str:
+        raise NotImplementedError
+
+    def generate_stream(self, prompt: str, purpose: str = 'default', timeout: Optional[float] = None,
+                        first_chunk_timeout: Optional[float] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str, purpose: str = 'default', timeout: Optional[float] = None,
+                        json_mode: bool = False) -> str:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'timeout': self.timeout,
+                'outcomes': dict(self._outcomes),
+                'latency_by_purpose': {purpose: h.snapshot() for purpose, h in sorted(self._histograms.items())}
+            }
+
+
+class GeminiClient(LLMClient):
+    """
+    Gemini via google.generativeai. The SDK is imported and configured on first use, so a missing
+    key only fails the calls (which the chatbot answers with its fallbacks), never the import.
+    The async client binds its gRPC channel to the first event loop it runs on, so agenerate is
+    meant for the ASGI app's loop, which lives as long as the worker.
+    """
+
+    backend = 'gemini'
+    JSON_CONFIG = {'response_mime_type': 'application/json'}
+
+    def __init__(self, model_name: str = 'gemini-flash-latest', api_key: Optional[str] = None, timeout: float = 15.0):
+        super().__init__(timeout)
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                api_key = self.api_key or os.environ.get('GEMINI_API_KEY')
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable not set. Please set it to your Gemini API key.")
+                # Suppress FutureWarning for google.generativeai deprecation
+                # TODO: Migrate to google.genai package in future updates
+                # See: https://github.com/google-gemini/deprecated-generative-ai-python
+                warnings.filterwarnings('ignore', category=FutureWarning, module='google.generativeai')
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def _options(self, timeout: float, json_mode: bool) -> Dict:
+        options = {'request_options': {'timeout': timeout}}
+        if json_mode:
+            options['generation_config'] = self.JSON_CONFIG
+        return options
+
+    @staticmethod
+    def _is_deadline(error: BaseException) -> bool:
+        return isinstance(error, TimeoutError) or type(error).__name__ in ('DeadlineExceeded', 'ReadTimeout', 'Timeout')
+
+    def generate(self, prompt, purpose='default', timeout=None, json_mode=False):
+        timeout = self._timeout(timeout)
+        start = time.perf_counter()
+        error = None
+        try:
+            return self._get_model().generate_content(prompt, **self._options(timeout, json_mode)).text
+        except Exception as e:
+            error = e
+            if self._is_deadline(e):
+                error = LLMTimeoutError(str(e))
+                raise error from e
+            raise
+        finally:
+            self._timed(purpose, start, error)
+
+    def generate_stream(self, prompt, purpose='default', timeout=None, first_chunk_timeout=None):
+        timeout = self._timeout(timeout)
+        first_chunk_timeout = self._first_chunk_timeout(first_chunk_timeout, timeout)
+
+        def open_stream():
+            try:
+                # generate_content blocks until the first chunk arrives, so it runs on the reader thread
+                for chunk in self._get_model().generate_content(prompt, stream=True, **self._options(timeout, False)):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. a trailing finish-reason chunk) are skipped
+                        continue
+                    if text:
+                        yield text
+            except Exception as e:
+                if self._is_deadline(e):
+                    raise LLMTimeoutError(str(e)) from e
+                raise
+
+        return self._stream(open_stream, purpose, first_chunk_timeout)
+
+    async def agenerate(self, prompt, purpose='default', timeout=None, json_mode=False):
+        timeout = self._timeout(timeout)
+        start = time.perf_counter()
+        error = None
+        try:
+            call = self._get_model().generate_content_async(prompt, **self._options(timeout, json_mode))
+            return (await asyncio.wait_for(call, timeout)).text
+        except Exception as e:
+            error = e
+            if self._is_deadline(e):
+                error = LLMTimeoutError(str(e))
+                raise error from e
+            raise
+        finally:
+            self._timed(purpose, start, error)
+
+
+class StubLLMClient(LLMClient):
+    """
+    Offline client: every call answers after a latency drawn from a seeded RNG (latency_ms plus up
+    to jitter_ms), or raises LLMTimeoutError once the timeout passes. Classification, extraction
+    and analysis get answers the chatbot can parse; everything else gets a short canned reply.
+    Purposes in fail_purposes raise instead, to exercise the fallbacks.
+    """
+
+    backend = 'stub'
+    CANNED = {
+        'analyze': json.dumps({'intent': 'GENERAL_HELP', 'parameters': {}}),
+        'classify_intent': 'GENERAL_HELP',
+        'extract_parameters': '{}',
+    }
+    DEFAULT_REPLY = "This is a canned answer from the offline assistant ({purpose})."
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 42, responses: Optional[Dict] = None,
+                 fail_purposes=(), timeout: float = 15.0):
+        super().__init__(timeout)
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.responses = {**self.CANNED, **(responses or {})}
+        self.fail_purposes = set(fail_purposes)
+        self._rng = random.Random(seed)
+
+    def _delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0.0, self.jitter_ms) if self.jitter_ms else 0.0
+        return (self.latency_ms + jitter) / 1000.0
+
+    def _answer(self, purpose: str) -> str:
+        if purpose in self.fail_purposes:
+            raise RuntimeError(f"stubbed {purpose} failure")
+        return self.responses.get(purpose, self.DEFAULT_REPLY.format(purpose=purpose))
+
+    def _respond(self, purpose: str, timeout: float) -> str:
+        delay = self._delay()
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise LLMTimeoutError(f"stub {purpose} call exceeded {timeout:.2f}s")
+        return self._answer(purpose)
+
+    def generate(self, prompt, purpose='default', timeout=None, json_mode=False):
+        timeout = self._timeout(timeout)
+        start = time.perf_counter()
+        error = None
+        try:
+            return self._respond(purpose, timeout)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._timed(purpose, start, error)
+
+    def generate_stream(self, prompt, purpose='default', timeout=None, first_chunk_timeout=None):
+        timeout = self._timeout(timeout)
+        first_chunk_timeout = self._first_chunk_timeout(first_chunk_timeout, timeout)
+
+        def open_stream():
+            for word in self._respond(purpose, timeout).split(' '):
+                yield word + ' '
+
+        return self._stream(open_stream, purpose, first_chunk_timeout)
+
+    async def agenerate(self, prompt, purpose='default', timeout=None, json_mode=False):
+        timeout = self._timeout(timeout)
+        start = time.perf_counter()
+        error = None
+        try:
+            delay = self._delay()
+            await asyncio.sleep(min(delay, timeout))
+            if delay > timeout:
+                raise LLMTimeoutError(f"stub {purpose} call exceeded {timeout:.2f}s")
+            return self._answer(purpose)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._timed(purpose, start, error)
+
+
+def build_llm_client() -> LLMClient:
+    """LLM client selected by CHATBOT_LLM_BACKEND ('gemini' or 'stub')"""
+    timeout = float(os.environ.get('CHATBOT_LLM_TIMEOUT', 15))
+    if os.environ.get('CHATBOT_LLM_BACKEND', 'gemini').lower() == 'stub':
+        return StubLLMClient(
+            latency_ms=float(os.environ.get('CHATBOT_STUB_LATENCY_MS', 0)),
+            jitter_ms=float(os.environ.get('CHATBOT_STUB_JITTER_MS', 0)),
+            timeout=timeout
+        )
+    return GeminiClient(os.environ.get('CHATBOT_GEMINI_MODEL', 'gemini-flash-latest'), timeout=timeout)
@@ -0,0 +1,106 @@
+"""
+Farming indices computed from hourly forecast series.
+
+Every function takes arrays shaped (..., days * 24) - one row per location when a batch is
+processed - and returns per-day arrays shaped (..., days), so a whole multi-location batch is
+handled by a handful of NumPy operations with no per-hour Python loops.
+"""
+import numpy as np
+
+GDD_BASE_TEMP = 10.0          # deg C, common base for cereals
+SPRAY_MAX_RAIN_PROB = 30.0    # % precipitation probability
+SPRAY_MAX_WIND = 15.0         # km/h at 10 m
+SPRAY_DAYLIGHT_HOURS = (6, 18)
+FROST_TEMP = 2.0              # deg C
+HEAT_STRESS_TEMP = 35.0       # deg C
+SOLAR_CONSTANT = 0.0820       # MJ m-2 min-1
+
+
+def to_days(hourly):
+    """Reshape (..., days * 24) hourly values to (..., days, 24), padding a partial day with NaN"""
+    hourly = np.asarray(hourly, dtype=float)
+    missing = (-hourly.shape[-1]) % 24
+    if missing:
+        pad = np.full(hourly.shape[:-1] + (missing,), np.nan)
+        hourly = np.concatenate([hourly, pad], axis=-1)
+    return hourly.reshape(hourly.shape[:-1] + (-1, 24))
+
+
+def daily_min_max(temperature):
+    days = to_days(temperature)
+    return np.nanmin(days, axis=-1), np.nanmax(days, axis=-1)
+
+
+def growing_degree_days(t_min, t_max, base=GDD_BASE_TEMP):
+    """Daily growing degree days from daily min/max temperature"""
+    return np.maximum((t_min + t_max) / 2.0 - base, 0.0)
+
+
+def extraterrestrial_radiation(latitude, day_of_year):
+    """Daily extraterrestrial radiation Ra in MJ m-2 day-1 (FAO-56 eq. 21); broadcasts its inputs"""
+    phi = np.radians(latitude)
+    angle = 2 * np.pi * np.asarray(day_of_year, dtype=float) / 365
+    inverse_distance = 1 + 0.033 * np.cos(angle)
+    declination = 0.409 * np.sin(angle - 1.39)
+    sunset_angle = np.arccos(np.clip(-np.tan(phi) * np.tan(declination), -1.0, 1.0))
+    return (24 * 60 / np.pi) * SOLAR_CONSTANT * inverse_distance * (
+        sunset_angle * np.sin(phi) * np.sin(declination)
+        + np.cos(phi) * np.cos(declination) * np.sin(sunset_angle)
+    )
+
+
+def reference_et0(t_min, t_max, latitude, day_of_year):
+    """Hargreaves reference evapotranspiration ET0 in mm/day"""
+    t_mean = (t_min + t_max) / 2.0
+    ra_mm = 0.408 * extraterrestrial_radiation(latitude, day_of_year)
+    return np.maximum(0.0023 * ra_mm * (t_mean + 17.8) * np.sqrt(np.maximum(t_max - t_min, 0.0)), 0.0)
+
+
+def spray_windows(rain_probability, wind_speed, max_rain_prob=SPRAY_MAX_RAIN_PROB,
+                  max_wind=SPRAY_MAX_WIND, daylight=SPRAY_DAYLIGHT_HOURS):
+    """
+    Longest daylight run of hours suitable for spraying on each day.
+
+    Returns (start_hour, hours) arrays; start_hour is -1 on days with no suitable hour.
+    """
+    probability, wind = to_days(rain_probability), to_days(wind_speed)
+    hour = np.arange(24)
+    suitable = (probability < max_rain_prob) & (wind < max_wind) & (hour >= daylight[0]) & (hour < daylight[1])
+
+    # Length of the suitable run ending at each hour: running count minus the count at the last gap
+    count = np.cumsum(suitable, axis=-1)
+    at_last_gap = np.maximum.accumulate(np.where(suitable, 0, count), axis=-1)
+    run = count - at_last_gap
+
+    hours = run.max(axis=-1)
+    start = np.where(hours > 0, run.argmax(axis=-1) - hours + 1, -1)
+    return start, hours
+
+
+def daily_totals(precipitation):
+    return np.nansum(to_days(precipitation), axis=-1)
+
+
+def compute_indices(hourly, latitude, day_of_year):
+    """
+    All indices for stacked hourly series.
+
+    `hourly` maps Open-Meteo field names to arrays shaped (locations, hours); `latitude` is
+    (locations,) and `day_of_year` is (locations, days). Returns a dict of (locations, days) arrays.
+    """
+    t_min, t_max = daily_min_max(hourly['temperature_2m'])
+    latitude = np.asarray(latitude, dtype=float)[:, None]
+    day_of_year = np.asarray(day_of_year, dtype=float)[:, :t_min.shape[-1]]
+    spray_start, spray_hours = spray_windows(hourly['precipitation_probability'], hourly['wind_speed_10m'])
+    return {
+        'temp_min': t_min,
+        'temp_max': t_max,
+        'gdd': growing_degree_days(t_min, t_max),
+        'et0_mm': reference_et0(t_min, t_max, latitude, day_of_year),
+        'rain_mm': daily_totals(hourly['precipitation']),
+        'max_rain_probability': np.nanmax(to_days(hourly['precipitation_probability']), axis=-1),
+        'spray_start_hour': spray_start,
+        'spray_hours': spray_hours,
+        'frost_risk': t_min <= FROST_TEMP,
+        'heat_stress': t_max >= HEAT_STRESS_TEMP
+    }
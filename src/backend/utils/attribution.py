@@ -0,0 +1,87 @@
+import numpy as np
+from scipy import sparse
+
+
+class TreePathExplainer:
+    """
+    Per-feature contributions for tree ensembles, read straight off the fitted trees.
+
+    Walking from the root to a leaf, every split moves the class distribution from the parent's
+    value to the child's; that change is credited to the feature the parent split on. Summed
+    along the path (and averaged over the forest) the contributions plus the root bias add up to
+    exactly what predict_proba returns. Path sums are precomputed per node once, so explaining a
+    batch is one model.apply() followed by a sparse matrix product.
+    """
+
+    def __init__(self, model):
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None:
+            estimators = [model]
+        if not all(hasattr(estimator, 'tree_') for estimator in estimators):
+            raise ValueError(f"{type(model).__name__} is not a tree-based classifier")
+
+        self.model = model
+        self.n_features = model.n_features_in_
+        self.n_classes = len(model.classes_)
+        self.n_trees = len(estimators)
+
+        leaf_blocks, offsets = [], [0]
+        bias = np.zeros(self.n_classes)
+        for estimator in estimators:
+            path_sums, root_value = self._leaf_path_sums(estimator.tree_)
+            leaf_blocks.append(path_sums.reshape(len(path_sums), -1))
+            offsets.append(offsets[-1] + len(path_sums))
+            bias += root_value
+
+        self.bias = bias / self.n_trees
+        self._offsets = np.array(offsets[:-1])
+        self._leaf_contributions = np.vstack(leaf_blocks) / self.n_trees
+
+    def _leaf_path_sums(self, tree):
+        """Cumulative (features, classes) contribution of the root-to-node path for every node"""
+        value = tree.value[:, 0, :]
+        value = value / value.sum(axis=1, keepdims=True)
+
+        parent = np.full(tree.node_count, -1)
+        internal = np.flatnonzero(tree.children_left >= 0)
+        parent[tree.children_left[internal]] = internal
+        parent[tree.children_right[internal]] = internal
+
+        depth = np.zeros(tree.node_count, dtype=int)
+        # sklearn numbers nodes depth-first, so a parent always precedes its children
+        for node in range(1, tree.node_count):
+            depth[node] = depth[parent[node]] + 1
+
+        path_sums = np.zeros((tree.node_count, self.n_features, self.n_classes))
+        for level in range(1, depth.max() + 1):
+            nodes = np.flatnonzero(depth == level)
+            parents = parent[nodes]
+            path_sums[nodes] = path_sums[parents]
+            path_sums[nodes, tree.feature[parents]] += value[nodes] - value[parents]
+        return path_sums, value[0]
+
+    def explain(self, X):
+        """Return contributions shaped (n_samples, n_features, n_classes) for inputs X"""
+        leaves = np.asarray(self.model.apply(X)).reshape(len(X), -1)
+        rows = np.repeat(np.arange(len(X)), leaves.shape[1])
+        columns = (leaves + self._offsets).ravel()
+        indicator = sparse.csr_matrix(
+            (np.ones(len(columns)), (rows, columns)),
+            shape=(len(X), len(self._leaf_contributions))
+        )
+        contributions = indicator @ self._leaf_contributions
+        return np.asarray(contributions).reshape(len(X), self.n_features, self.n_classes)
+
+
+def describe_contributions(contributions, feature_names, class_indices, bias):
+    """Per-class {feature: contribution} dicts for the selected classes of one sample"""
+    return [
+        {
+            'bias': round(float(bias[c]), 4),
+            'contributions': {
+                name: round(float(value), 4)
+                for name, value in zip(feature_names, contributions[:, c])
+            }
+        }
+        for c in class_indices
+    ]
@@ -0,0 +1,497 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def is_cacheable(value):
+    """Only successful results are cached; None and {'error': ...} payloads are not"""
+    return value is not None and not (isinstance(value, dict) and 'error' in value)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in flight wait for it and
+    receive a copy of its result (or its exception) instead of issuing their own upstream call.
+    `ado` is the coroutine counterpart: its callers wait on the event loop rather than in a
+    thread, and share calls with `do` for the same key.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = []  # futures of `ado` callers, woken on their own loops
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key, waiter=None):
+        """(call, leader) for key; a follower's waiter is registered before the lock is released"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+                return call, True
+            self.coalesced += 1
+            if waiter is not None:
+                call.waiters.append(waiter)
+            return call, False
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+        for waiter in call.waiters:
+            waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    @staticmethod
+    def _outcome(call):
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def do(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            return self._outcome(call)
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key, afn):
+        """do() for a coroutine function: the leader awaits afn(), followers wait without a thread"""
+        waiter = asyncio.get_running_loop().create_future()
+        call, leader = self._join(key, waiter)
+        if not leader:
+            await waiter
+            return self._outcome(call)
+
+        try:
+            call.result = await afn()
+            return call.result
+        except asyncio.CancelledError:
+            call.error = RuntimeError(f"single-flight call for '{key}' was cancelled")
+            raise
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+class MemoryBackend:
+    """Bounded in-process LRU store of (value, stored_at, source) entries, plus hit counts per source."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._source_hits = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            value, stored_at, source = entry
+        return copy.deepcopy(value), stored_at, source
+
+    def set(self, key, value, stored_at, source=None):
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(value), stored_at, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add_source_hits(self, hits):
+        with self._lock:
+            for source, count in hits.items():
+                self._source_hits[source] = self._source_hits.get(source, 0) + count
+
+    def source_hits(self):
+        with self._lock:
+            return dict(self._source_hits)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    SQLite store shared by every uvicorn worker on the host.
+
+    Entries are namespaced so several caches can share one database file; the oldest rows
+    beyond max_entries are trimmed on write. Each entry keeps the source it was written by, and
+    hits per source are summed in the database, so every worker sees the host-wide counts.
+    """
+
+    def __init__(self, path, namespace, max_entries=1024):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max(1, int(max_entries))
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    source TEXT,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            # Databases created before entries had a source
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(cache_entries)')]
+            if 'source' not in columns:
+                conn.execute('ALTER TABLE cache_entries ADD COLUMN source TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_age ON cache_entries (namespace, stored_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_source_hits (
+                    namespace TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    hits INTEGER NOT NULL,
+                    PRIMARY KEY (namespace, source)
+                )
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT value, stored_at, source FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, value, stored_at, source=None):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at, source) VALUES (?, ?, ?, ?, ?)',
+                    (self.namespace, key, json.dumps(value), stored_at, source)
+                )
+                trimmed = conn.execute('''
+                    DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                        SELECT key FROM cache_entries WHERE namespace = ?
+                        ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.namespace, self.namespace, self.max_entries)).rowcount
+                self.evictions += max(trimmed, 0)
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+        finally:
+            conn.close()
+
+    def add_source_hits(self, hits):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO cache_source_hits (namespace, source, hits) VALUES (?, ?, ?)
+                    ON CONFLICT (namespace, source) DO UPDATE SET hits = hits + excluded.hits
+                ''', [(self.namespace, source, count) for source, count in hits.items()])
+        finally:
+            conn.close()
+
+    def source_hits(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT source, hits FROM cache_source_hits WHERE namespace = ?', (self.namespace,)).fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+        finally:
+            conn.close()
+
+
+class TTLCache:
+    """
+    Time-to-live cache with stale-while-revalidate.
+
+    Entries younger than `ttl` are served as-is. Entries up to `ttl + stale_ttl` old are still
+    served, but trigger one background refresh per key. Anything older is loaded synchronously.
+    Loads and refreshes for the same key share one in-flight upstream call. If a load fails while
+    an expired entry is still stored, that last-known value is returned marked 'stale'.
+
+    Entries written with a `source` (e.g. 'prefetch') keep it in the backend until the key is
+    next written without one, and reads served from them are counted under `hits_by_source`.
+    Those counts are added to the backend every `SOURCE_HITS_FLUSH_INTERVAL` seconds, so with
+    SQLite they cover every worker sharing the database.
+    """
+
+    SOURCE_HITS_FLUSH_INTERVAL = 10.0
+
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=1024, db_path=None):
+        self.name = name
+        self.ttl = float(ttl)
+        self.stale_ttl = float(stale_ttl)
+        if db_path:
+            self.backend = SQLiteBackend(db_path, namespace=name, max_entries=max_entries)
+        else:
+            self.backend = MemoryBackend(max_entries=max_entries)
+        self._refreshing = set()
+        self._refresh_tasks = set()  # background refreshes started by aget_or_load, kept until done
+        self._source_hits = {}  # hits per source not yet added to the backend
+        self._source_hits_flushed_at = time.monotonic()
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0, 'served_last_known': 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, key, max_age=None):
+        """Return the cached value if it is at most max_age (default ttl) seconds old"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, stored_at, source = entry
+        if time.time() - stored_at > (self.ttl if max_age is None else max_age):
+            return None
+        self._count_source_hit(source)
+        return value
+
+    def entry_age(self, key):
+        """Seconds since the key was stored, or None if it is not cached"""
+        entry = self.backend.get(key)
+        return None if entry is None else time.time() - entry[1]
+
+    def set(self, key, value, source=None):
+        self.backend.set(key, value, time.time(), source=source)
+
+    def _count_source_hit(self, source):
+        if not source:
+            return
+        with self._lock:
+            self._source_hits[source] = self._source_hits.get(source, 0) + 1
+            due = time.monotonic() - self._source_hits_flushed_at >= self.SOURCE_HITS_FLUSH_INTERVAL
+        if due:
+            self._flush_source_hits()
+
+    def _flush_source_hits(self):
+        with self._lock:
+            hits, self._source_hits = self._source_hits, {}
+            self._source_hits_flushed_at = time.monotonic()
+        if not hits:
+            return
+        try:
+            self.backend.add_source_hits(hits)
+        except Exception:
+            logging.error(f"Could not record source hits for {self.name} cache", exc_info=True)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def _freshness(self, entry):
+        """'fresh' or 'stale' for an entry that can be served (counting the hit), else None"""
+        if entry is None:
+            return None
+        _, stored_at, source = entry
+        age = time.time() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            return None
+        freshness = 'fresh' if age <= self.ttl else 'stale'
+        self._count('hits' if freshness == 'fresh' else 'stale_hits')
+        self._count_source_hit(source)
+        return freshness
+
+    def _loaded(self, key, value, entry, error):
+        """What a miss serves once its load finished with value, or failed with error"""
+        if error is not None:
+            if entry is None:
+                raise error
+            logging.warning(f"Load failed for {self.name} cache key '{key}'; serving last-known value", exc_info=error)
+            value = None
+        if not is_cacheable(value) and entry is not None:
+            self._count('served_last_known')
+            return self._mark_stale(entry[0])
+        return value
+
+    def get_or_load(self, key, loader):
+        """Serve key from the cache, refreshing stale entries in the background and loading misses"""
+        entry = self.backend.get(key)
+        freshness = self._freshness(entry)
+        if freshness == 'stale':
+            self._refresh_in_background(key, loader)
+        if freshness:
+            return entry[0]
+
+        self._count('misses')
+        value, error = None, None
+        try:
+            value = self._flight.do(key, lambda: self._load(key, loader))
+        except Exception as e:
+            error = e
+        return self._loaded(key, value, entry, error)
+
+    async def aget_or_load(self, key, aloader):
+        """
+        get_or_load for a coroutine function: loads and stale refreshes are awaited on the running
+        event loop instead of holding a thread, and share in-flight loads with get_or_load.
+        """
+        entry = self.backend.get(key)
+        freshness = self._freshness(entry)
+        if freshness == 'stale':
+            self._arefresh_in_background(key, aloader)
+        if freshness:
+            return entry[0]
+
+        self._count('misses')
+        value, error = None, None
+        try:
+            value = await self._flight.ado(key, lambda: self._aload(key, aloader))
+        except Exception as e:
+            error = e
+        return self._loaded(key, value, entry, error)
+
+    def last_known(self, key):
+        """The stored value regardless of age, marked 'stale', or None"""
+        entry = self.backend.get(key)
+        return self._mark_stale(entry[0]) if entry is not None else None
+
+    @staticmethod
+    def _mark_stale(value):
+        return {**value, 'stale': True} if isinstance(value, dict) else value
+
+    def refresh(self, key, loader, source=None):
+        """Load key now and store the result tagged with `source`; shares any in-flight load"""
+        return self._flight.do(key, lambda: self._load(key, loader, source))
+
+    def _load(self, key, loader, source=None):
+        value = loader()
+        if is_cacheable(value):
+            self.set(key, value, source=source)
+        return value
+
+    async def _aload(self, key, aloader):
+        value = await aloader()
+        if is_cacheable(value):
+            self.set(key, value)
+        return value
+
+    def _start_refresh(self, key):
+        """Claim the background refresh of key; False if one is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _end_refresh(self, key, value, error):
+        if error is None and is_cacheable(value):
+            self._count('refreshes')
+        else:
+            self._count('refresh_failures')
+            if error is not None:
+                logging.error(f"Background refresh failed for {self.name} cache key '{key}'", exc_info=error)
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, loader):
+        if not self._start_refresh(key):
+            return
+
+        def refresh():
+            value, error = None, None
+            try:
+                value = self._flight.do(key, lambda: self._load(key, loader))
+            except Exception as e:
+                error = e
+            self._end_refresh(key, value, error)
+
+        threading.Thread(target=refresh, name=f"{self.name}-refresh", daemon=True).start()
+
+    def _arefresh_in_background(self, key, aloader):
+        if not self._start_refresh(key):
+            return
+
+        async def refresh():
+            value, error = None, None
+            try:
+                value = await self._flight.ado(key, lambda: self._aload(key, aloader))
+            except Exception as e:
+                error = e
+            self._end_refresh(key, value, error)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def stats(self):
+        self._flush_source_hits()
+        with self._lock:
+            stats = dict(self._stats)
+            refreshing = len(self._refreshing)
+        return {
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'backend': 'sqlite' if isinstance(self.backend, SQLiteBackend) else 'memory',
+            'size': len(self.backend),
+            'max_entries': self.backend.max_entries,
+            'evictions': self.backend.evictions,
+            'refreshing': refreshing,
+            'single_flight': self._flight.stats(),
+            'hits_by_source': self.backend.source_hits(),
+            **stats
+        }
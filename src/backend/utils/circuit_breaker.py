@@ -0,0 +1,96 @@
+import threading
+import time
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    Closed: calls pass through; `failure_threshold` consecutive failures or calls slower than
+    `slow_call_seconds` open the circuit. Open: calls are rejected immediately for
+    `open_seconds`. Half-open: up to `half_open_max_calls` trial calls are let through; if they
+    all succeed the circuit closes, any failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, slow_call_seconds=3.0, open_seconds=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.open_seconds = float(open_seconds)
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_calls = 0
+        self._trial_successes = 0
+        self._stats = {'times_opened': 0, 'rejected': 0, 'slow_calls': 0}
+
+    def allow(self):
+        """Whether a call may go upstream now; moves an expired open circuit to half-open"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_calls = 0
+                self._trial_successes = 0
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._trial_calls < self.half_open_max_calls:
+                self._trial_calls += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record(self, success, seconds):
+        """
+        Record the outcome of an allowed call; calls over the latency SLO count as failures.
+        Every call that allow() let through must be recorded, however it ended, or a half-open
+        trial slot is never released.
+        """
+        with self._lock:
+            slow = seconds > self.slow_call_seconds
+            if slow:
+                self._stats['slow_calls'] += 1
+            failed = not success or slow
+
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_max_calls:
+                        self._state = self.CLOSED
+                        self._consecutive_failures = 0
+            elif failed:
+                self._consecutive_failures += 1
+                if self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self._consecutive_failures = 0
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._stats['times_opened'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'retry_in_seconds': retry_in,
+                **self._stats
+            }
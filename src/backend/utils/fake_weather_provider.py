@@ -0,0 +1,225 @@
+"""
+Local stand-in for the weather providers used by weather_api, for offline benchmarks and load tests.
+
+Serves the three upstream endpoints with deterministic synthetic data:
+  GET /data/2.5/weather   OpenWeatherMap current weather
+  GET /v1/search          Open-Meteo geocoding
+  GET /v1/forecast        Open-Meteo forecast (single and multi-coordinate, daily + hourly)
+
+Latency, error and timeout behaviour is configurable per run (and at runtime via POST /_control),
+and drawn from a seeded RNG so a load test reproduces the same provider slowness every time.
+Point weather_api at it with WEATHER_PROVIDER_URL=http://127.0.0.1:8099.
+
+Usage:
+    python -m src.backend.utils.fake_weather_provider --port 8099 --latency-ms 300 \
+        --latency-dist lognormal --error-rate 0.05 --timeout-rate 0.01
+"""
+import argparse
+import hashlib
+import math
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from flask import Flask, request, jsonify
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+class FaultConfig:
+    """Latency distribution, error rate and timeout rate for one endpoint group."""
+
+    def __init__(self, latency_ms=50.0, latency_dist='fixed', jitter_ms=0.0, error_rate=0.0,
+                 timeout_rate=0.0, hang_seconds=30.0):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_dist must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency_ms = float(latency_ms)
+        self.latency_dist = latency_dist
+        self.jitter_ms = float(jitter_ms)
+        self.error_rate = float(error_rate)
+        self.timeout_rate = float(timeout_rate)
+        self.hang_seconds = float(hang_seconds)
+
+    def update(self, **changes):
+        for name, value in changes.items():
+            if name == 'latency_dist':
+                if value not in LATENCY_DISTRIBUTIONS:
+                    raise ValueError(f"latency_dist must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+                self.latency_dist = value
+            elif hasattr(self, name):
+                setattr(self, name, float(value))
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class FaultInjector:
+    """Draws the delay and failure mode for each request from a seeded RNG."""
+
+    def __init__(self, config, seed=42):
+        self.config = config
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'timeouts': 0}
+
+    def draw(self):
+        """Return (delay_seconds, outcome) where outcome is 'ok', 'error' or 'timeout'"""
+        c = self.config
+        with self._lock:
+            self.counts['requests'] += 1
+            roll = self._rng.random()
+            if c.latency_dist == 'uniform':
+                delay_ms = self._rng.uniform(max(0.0, c.latency_ms - c.jitter_ms), c.latency_ms + c.jitter_ms)
+            elif c.latency_dist == 'lognormal':
+                # latency_ms is the median; jitter_ms / latency_ms sets the spread of the tail
+                sigma = c.jitter_ms / c.latency_ms if c.latency_ms and c.jitter_ms else 0.5
+                delay_ms = c.latency_ms * math.exp(self._rng.gauss(0.0, sigma))
+            else:
+                delay_ms = c.latency_ms
+            if roll < c.timeout_rate:
+                self.counts['timeouts'] += 1
+                return c.hang_seconds, 'timeout'
+            if roll < c.timeout_rate + c.error_rate:
+                self.counts['errors'] += 1
+                return delay_ms / 1000.0, 'error'
+        return delay_ms / 1000.0, 'ok'
+
+
+def _unit(*parts):
+    """Deterministic value in [0, 1) derived from the inputs"""
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) / 0x100000000
+
+
+def fake_coordinates(name):
+    """Stable coordinates within India for any place name"""
+    key = name.strip().casefold()
+    return round(8.0 + 27.0 * _unit('lat', key), 4), round(69.0 + 28.0 * _unit('lon', key), 4)
+
+
+def fake_daily_and_hourly(lat, lon, days=7):
+    base = 32.0 - 0.4 * abs(lat - 15.0)
+    start = date.today()
+    daily = {'time': [], 'temperature_2m_max': [], 'temperature_2m_min': [],
+             'relative_humidity_2m_mean': [], 'weather_code': []}
+    hourly = {'time': [], 'temperature_2m': [], 'relative_humidity_2m': [],
+              'precipitation_probability': [], 'precipitation': [], 'wind_speed_10m': []}
+    for d in range(days):
+        day = start + timedelta(days=d)
+        swing = 4.0 + 4.0 * _unit('swing', lat, lon, d)
+        rain_bias = _unit('rain', lat, lon, d)
+        daily['time'].append(day.isoformat())
+        daily['temperature_2m_max'].append(round(base + swing, 1))
+        daily['temperature_2m_min'].append(round(base - swing, 1))
+        daily['relative_humidity_2m_mean'].append(round(45 + 40 * rain_bias))
+        daily['weather_code'].append(61 if rain_bias > 0.7 else 3 if rain_bias > 0.4 else 0)
+        for h in range(24):
+            diurnal = math.sin((h - 9) / 24 * 2 * math.pi)
+            hourly['time'].append(f"{day.isoformat()}T{h:02d}:00")
+            hourly['temperature_2m'].append(round(base + swing * diurnal, 1))
+            hourly['relative_humidity_2m'].append(round(60 - 20 * diurnal))
+            probability = max(0, min(100, round(100 * rain_bias - 20 + 30 * _unit('p', lat, lon, d, h))))
+            hourly['precipitation_probability'].append(probability)
+            hourly['precipitation'].append(round(probability / 100 * 1.5, 2) if probability > 60 else 0.0)
+            hourly['wind_speed_10m'].append(round(5 + 20 * _unit('w', lat, lon, d, h), 1))
+    return daily, hourly
+
+
+def create_app(config=None, seed=42):
+    """Build the fake provider Flask app"""
+    app = Flask(__name__)
+    injector = FaultInjector(config or FaultConfig(), seed=seed)
+    app.injector = injector
+
+    def faulty(handler):
+        def wrapped(*args, **kwargs):
+            delay, outcome = injector.draw()
+            time.sleep(delay)
+            if outcome == 'error':
+                return jsonify({'error': 'injected failure'}), 503
+            return handler(*args, **kwargs)
+        wrapped.__name__ = handler.__name__
+        return wrapped
+
+    @app.route('/data/2.5/weather')
+    @faulty
+    def current_weather():
+        city = request.args.get('q', '')
+        if not city.strip():
+            return jsonify({'cod': '404', 'message': 'city not found'}), 404
+        lat, lon = fake_coordinates(city)
+        daily, _ = fake_daily_and_hourly(lat, lon, days=1)
+        return jsonify({
+            'main': {
+                'temp': round((daily['temperature_2m_max'][0] + daily['temperature_2m_min'][0]) / 2, 1),
+                'humidity': daily['relative_humidity_2m_mean'][0]
+            },
+            'weather': [{'description': 'light rain' if daily['weather_code'][0] == 61 else 'clear sky'}],
+            'name': city.strip().title(),
+            'sys': {'country': 'IN'}
+        })
+
+    @app.route('/v1/search')
+    @faulty
+    def geocode():
+        name = request.args.get('name', '')
+        if not name.strip():
+            return jsonify({'generationtime_ms': 0.1})
+        lat, lon = fake_coordinates(name)
+        return jsonify({'results': [{'latitude': lat, 'longitude': lon, 'name': name.strip().title(), 'country': 'India'}]})
+
+    @app.route('/v1/forecast')
+    @faulty
+    def forecast():
+        try:
+            lats = [float(v) for v in request.args.get('latitude', '').split(',')]
+            lons = [float(v) for v in request.args.get('longitude', '').split(',')]
+        except ValueError:
+            return jsonify({'error': True, 'reason': 'Invalid coordinates'}), 400
+        if len(lats) != len(lons):
+            return jsonify({'error': True, 'reason': 'Latitude and longitude lists differ in length'}), 400
+        results = []
+        for lat, lon in zip(lats, lons):
+            daily, hourly = fake_daily_and_hourly(lat, lon)
+            result = {'latitude': lat, 'longitude': lon, 'daily': daily}
+            if request.args.get('hourly'):
+                result['hourly'] = hourly
+            results.append(result)
+        return jsonify(results if len(results) > 1 else results[0])
+
+    @app.route('/_control', methods=['GET', 'POST'])
+    def control():
+        """Inspect or change the fault configuration mid-test"""
+        if request.method == 'POST':
+            try:
+                injector.config.update(**(request.get_json(silent=True) or {}))
+            except (TypeError, ValueError) as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'config': injector.config.to_dict(), 'counts': dict(injector.counts)})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake weather provider with latency and fault injection")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="fixed latency, uniform centre or lognormal median")
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='fixed')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="uniform half-width or lognormal spread")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="fraction of requests that hang")
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help="how long a 'timeout' request hangs")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config = FaultConfig(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds
+    )
+    create_app(config, seed=args.seed).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
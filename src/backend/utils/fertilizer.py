@@ -0,0 +1,133 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+# Nutrient order used for every (..., 3) array in this module
+NUTRIENTS = ('Nitrogen', 'Phosphorus', 'Potassium')
+FERTILIZER_TYPES = ('Urea or Ammonium Nitrate', 'DAP or Superphosphate', 'Potash or MOP')
+UNKNOWN_CROP_ERROR = "Crop not found in fertilizer database"
+
+
+class FertilizerTable:
+    """Recommended NPK levels from fertilizer.csv laid out as arrays for batched lookups."""
+
+    def __init__(self, fertilizer_df, optimizer=None):
+        table = fertilizer_df.drop_duplicates(subset='Crop', keep='first')
+        self.crops = pd.Index(table['Crop'].astype(str))
+        self.requirements = table[['N', 'P', 'K']].to_numpy(dtype=float)
+        self.optimizer = optimizer
+
+    def lookup(self, crops):
+        """Map crop names to table rows, -1 where the crop is unknown"""
+        return self.crops.get_indexer(pd.Index(crops, dtype=object))
+
+    def deficiencies(self, rows, npk):
+        """Per-nutrient deficits (n, 3) for table rows against soil readings (n, 3); NaN for unknown rows"""
+        rows = np.asarray(rows)
+        deficits = np.maximum(self.requirements[np.where(rows >= 0, rows, 0)] - npk, 0.0)
+        deficits[rows < 0] = np.nan
+        return deficits
+
+    def recommend_batch(self, crops, npk):
+        """Recommend fertilizer for many (crop, N, P, K) readings at once"""
+        rows = self.lookup(crops)
+        deficits = self.deficiencies(rows, np.asarray(npk, dtype=float).reshape(-1, 3))
+        results = format_recommendations(deficits, rows >= 0)
+        if self.optimizer is not None:
+            blends = self.optimizer.describe(*self.optimizer.solve(deficits))
+            for result, blend in zip(results, blends):
+                if 'deficiency' in result:
+                    result['blend'] = blend
+        return results
+
+
+class BlendOptimizer:
+    """
+    Cheapest blend of catalogue products covering N/P/K deficits, solved for many plots at once.
+
+    Each plot is the LP  min cost @ x  s.t.  fractions @ x >= deficit, x >= 0. With only three
+    constraints an optimum always sits on a basis of three columns taken from the products and
+    the three surplus variables. Which bases are dual feasible depends only on the catalogue, so
+    they are enumerated once here; solving a batch is then a single einsum over those bases,
+    keeping for each plot the first one whose primal solution is non-negative.
+    """
+
+    def __init__(self, products_df):
+        self.products = products_df['product'].astype(str).tolist()
+        self.fractions = products_df[['N', 'P', 'K']].to_numpy(dtype=float).T
+        self.costs = products_df['cost_per_kg'].to_numpy(dtype=float)
+        if not (self.fractions > 0).any(axis=1).all():
+            raise ValueError("Fertilizer catalogue must supply each of N, P and K")
+        if (self.costs < 0).any():
+            raise ValueError("Fertilizer product costs must be non-negative")
+
+        columns = np.hstack([self.fractions, -np.eye(3)])
+        column_costs = np.concatenate([self.costs, np.zeros(3)])
+        inverses, bases = [], []
+        for basis in itertools.combinations(range(columns.shape[1]), 3):
+            matrix = columns[:, basis]
+            if abs(np.linalg.det(matrix)) < 1e-9:
+                continue
+            inverse = np.linalg.inv(matrix)
+            duals = column_costs[list(basis)] @ inverse
+            if (column_costs - duals @ columns >= -1e-9).all():
+                inverses.append(inverse)
+                bases.append(basis)
+        self._inverses = np.array(inverses)
+        self._bases = np.array(bases)
+
+    def solve(self, deficits):
+        """Return (kg of each product (n, m), blend cost (n,)) for deficits (n, 3); NaN rows stay NaN"""
+        deficits = np.asarray(deficits, dtype=float).reshape(-1, 3)
+        missing = np.isnan(deficits).any(axis=1)
+        demand = np.where(missing[:, None], 0.0, np.maximum(deficits, 0.0))
+
+        solutions = np.einsum('vij,nj->nvi', self._inverses, demand)
+        feasible = (solutions >= -1e-9).all(axis=2)
+        choice = np.argmax(feasible, axis=1)
+        rows = np.arange(len(demand))
+
+        amounts = np.zeros((len(demand), len(self.products) + 3))
+        amounts[rows[:, None], self._bases[choice]] = np.maximum(solutions[rows, choice], 0.0)
+        amounts = amounts[:, :len(self.products)]
+        amounts[missing | ~feasible.any(axis=1)] = np.nan
+        return amounts, amounts @ self.costs
+
+    def describe(self, amounts, costs):
+        """Format solved blends as JSON-friendly dicts, None where a plot had no solution"""
+        blends = []
+        for row, cost in zip(np.round(amounts, 2).tolist(), np.round(costs, 2).tolist()):
+            if np.isnan(cost):
+                blends.append(None)
+                continue
+            blends.append({
+                "products": [
+                    {"product": product, "kg": kg}
+                    for product, kg in zip(self.products, row) if kg > 0
+                ],
+                "cost": cost
+            })
+        return blends
+
+
+def format_recommendations(deficits, known):
+    """Turn a (n, 3) deficit array into recommend_fertilizer-style result dicts"""
+    # argmax keeps the first maximum, so ties resolve N before P before K
+    most_deficient = np.argmax(np.nan_to_num(deficits, nan=0.0), axis=1)
+    max_deficit = deficits[np.arange(len(deficits)), most_deficient]
+    rounded = np.round(max_deficit, 2)
+
+    results = []
+    for is_known, nutrient, raw, amount in zip(known, most_deficient.tolist(), max_deficit.tolist(), rounded.tolist()):
+        if not is_known:
+            results.append({"error": UNKNOWN_CROP_ERROR})
+        elif raw == 0:
+            results.append({"message": "Soil nutrients are adequate for this crop", "type": "balanced"})
+        else:
+            results.append({
+                "type": NUTRIENTS[nutrient],
+                "deficiency": amount,
+                "recommendation": f"Add {amount} units of {NUTRIENTS[nutrient]} fertilizer",
+                "fertilizer_type": FERTILIZER_TYPES[nutrient]
+            })
+    return results
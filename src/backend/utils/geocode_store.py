@@ -0,0 +1,140 @@
+import csv
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+def normalize_place(name):
+    """Lookup key for a place name: accents stripped, case-folded and single-spaced"""
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.replace(',', ' ').split()).casefold()
+
+
+class GeocodeStore:
+    """
+    Persistent SQLite store of place name -> coordinates.
+
+    City coordinates never change, so every successful geocode is kept indefinitely. The store
+    can be pre-seeded from a CSV (name, aliases, state, latitude, longitude, country) so common
+    towns never need a geocoding request at all. Seeding happens on first use rather than on
+    construction, since the store is built when weather_api is imported.
+    """
+
+    def __init__(self, db_path, seed_csv=None):
+        self.db_path = db_path
+        self.seed_csv = seed_csv
+        self._seeded = False
+        self._seed_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'saved': 0}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS places (
+                        key TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        lat REAL NOT NULL,
+                        lon REAL NOT NULL,
+                        country TEXT NOT NULL DEFAULT '',
+                        source TEXT NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _ensure_seeded(self):
+        if self._seeded:
+            return
+        with self._seed_lock:
+            if not self._seeded:
+                if self.seed_csv and os.path.exists(self.seed_csv):
+                    self.seed_from_csv(self.seed_csv)
+                self._seeded = True
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def seed_from_csv(self, path):
+        """Load bundled places; rows already in the store are left untouched"""
+        rows = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                names = [record['name']] + [a for a in (record.get('aliases') or '').split(';') if a.strip()]
+                for name in names:
+                    rows.append((
+                        normalize_place(name), record['name'], float(record['latitude']),
+                        float(record['longitude']), record.get('country', ''), 'seed'
+                    ))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO places (key, name, lat, lon, country, source) VALUES (?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+        finally:
+            conn.close()
+        logger.info(f"Geocode store seeded with {len(rows)} place names from {path}")
+
+    def lookup(self, name):
+        """Coordinates dict for a place name, or None when it has never been geocoded"""
+        return self.lookup_many([name]).get(normalize_place(name))
+
+    def lookup_many(self, names):
+        """Resolve many place names in one query; returns {normalized name: coordinates}"""
+        keys = list({normalize_place(name) for name in names})
+        if not keys:
+            return {}
+        self._ensure_seeded()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT key, name, lat, lon, country FROM places WHERE key IN ({','.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+        finally:
+            conn.close()
+        found = {key: {"lat": lat, "lon": lon, "name": name, "country": country} for key, name, lat, lon, country in rows}
+        self._count('hits', len(found))
+        self._count('misses', len(keys) - len(found))
+        return found
+
+    def save(self, name, coords, source='api'):
+        """Remember a geocoding result under the requested name and the name the API returned"""
+        keys = {normalize_place(name)}
+        if coords.get('name'):
+            keys.add(normalize_place(coords['name']))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO places (key, name, lat, lon, country, source) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(key, coords.get('name') or name, coords['lat'], coords['lon'], coords.get('country', ''), source) for key in keys]
+                )
+        finally:
+            conn.close()
+        self._count('saved')
+
+    def stats(self):
+        self._ensure_seeded()
+        conn = self._connect()
+        try:
+            size = conn.execute('SELECT COUNT(*) FROM places').fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            return {'size': size, **self._stats}
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Separate connect/read timeouts: a dead host fails fast, a slow response still gets a bounded read
+CONNECT_TIMEOUT = float(os.environ.get('WEATHER_CONNECT_TIMEOUT', 2.0))
+READ_TIMEOUT = float(os.environ.get('WEATHER_READ_TIMEOUT', 4.0))
+MAX_RETRIES = int(os.environ.get('WEATHER_RETRIES', 1))
+BACKOFF_FACTOR = float(os.environ.get('WEATHER_BACKOFF', 0.2))
+BACKOFF_JITTER = float(os.environ.get('WEATHER_BACKOFF_JITTER', 0.2))
+POOL_SIZE = int(os.environ.get('WEATHER_POOL_SIZE', 10))
+
+# Circuit breaker: consecutive failures (or calls slower than the SLO) before a provider is
+# skipped for WEATHER_BREAKER_OPEN_SECONDS
+BREAKER_FAILURES = int(os.environ.get('WEATHER_BREAKER_FAILURES', 5))
+BREAKER_SLOW_SECONDS = float(os.environ.get('WEATHER_BREAKER_SLOW_SECONDS', 3.0))
+BREAKER_OPEN_SECONDS = float(os.environ.get('WEATHER_BREAKER_OPEN_SECONDS', 30.0))
+
+
+def build_session(pool_size=POOL_SIZE, retries=MAX_RETRIES):
+    """Keep-alive session with bounded connection pools and jittered retries for idempotent GETs"""
+    retry_options = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    try:
+        retry = Retry(backoff_jitter=BACKOFF_JITTER, **retry_options)
+    except TypeError:
+        # urllib3 < 2 has no backoff_jitter; fall back to plain exponential backoff
+        retry = Retry(**retry_options)
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ProviderMetrics:
+    """Request counts, error counts and latency percentiles per upstream provider."""
+
+    def __init__(self, window=512):
+        self.window = window
+        self._lock = threading.Lock()
+        self._providers = {}
+
+    def record(self, provider, seconds, ok, error=None):
+        with self._lock:
+            stats = self._providers.setdefault(provider, {
+                'requests': 0, 'errors': 0, 'last_error': None, 'latencies': deque(maxlen=self.window)
+            })
+            stats['requests'] += 1
+            stats['latencies'].append(seconds)
+            if not ok:
+                stats['errors'] += 1
+                stats['last_error'] = error
+
+    def snapshot(self):
+        with self._lock:
+            providers = {name: (dict(stats), sorted(stats['latencies'])) for name, stats in self._providers.items()}
+        summary = {}
+        for name, (stats, latencies) in providers.items():
+            def percentile(p):
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+            summary[name] = {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'last_error': stats['last_error'],
+                'p50_ms': percentile(0.50),
+                'p95_ms': percentile(0.95),
+                'max_ms': round(latencies[-1] * 1000, 1) if latencies else None
+            }
+        return summary
+
+
+session = build_session()
+provider_metrics = ProviderMetrics()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=BREAKER_FAILURES,
+                slow_call_seconds=BREAKER_SLOW_SECONDS,
+                open_seconds=BREAKER_OPEN_SECONDS
+            )
+        return _breakers[provider]
+
+
+def breaker_states():
+    """Circuit breaker state per provider for the health endpoint"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+def provider_get(provider, url, params=None):
+    """
+    GET through the pooled session, recording latency and outcome under the provider's name.
+
+    Raises CircuitOpenError without touching the network while the provider's circuit is open.
+    """
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{provider} is temporarily unavailable (circuit open)")
+
+    start = time.perf_counter()
+    try:
+        response = session.get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except Exception as e:
+        # Any exception counts, not only RequestException: an unrecorded half-open trial call
+        # would hold its slot forever and leave the circuit rejecting every later call
+        elapsed = time.perf_counter() - start
+        breaker.record(False, elapsed)
+        provider_metrics.record(provider, elapsed, ok=False, error=type(e).__name__)
+        raise
+    elapsed = time.perf_counter() - start
+    ok = response.status_code < 500 and response.status_code != 429
+    breaker.record(ok, elapsed)
+    provider_metrics.record(provider, elapsed, ok=ok, error=None if ok else f"HTTP {response.status_code}")
+    return response
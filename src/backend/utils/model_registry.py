@@ -0,0 +1,170 @@
+import os
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import joblib
+
+from src.backend.utils.attribution import TreePathExplainer
+
+DEFAULT_REGION = 'default'
+_REGION_PATTERN = re.compile(r'^[a-z0-9_-]{1,32}$')
+# How long the list of model files is trusted before the directory is listed again
+REGION_SCAN_INTERVAL = 30.0
+
+
+class LoadedModel:
+    """A resident crop model together with its lazily built attribution explainer."""
+
+    def __init__(self, region, model):
+        self.region = region
+        self.model = model
+        self._explainer = None
+        self._explainer_error = None
+
+    @property
+    def explainer(self):
+        """TreePathExplainer for this model, or None if the model is not a tree ensemble"""
+        if self._explainer is None and self._explainer_error is None:
+            try:
+                self._explainer = TreePathExplainer(self.model)
+            except ValueError as e:
+                self._explainer_error = str(e)
+                logging.warning(f"Feature attributions disabled for region '{self.region}': {e}")
+        return self._explainer
+
+    def warm(self):
+        """Build the explainer now so the first explained request does not pay for it"""
+        self.explainer
+        return self
+
+
+class CropModelRegistry:
+    """
+    Resolves a region code to its crop model, loading <model_dir>/<region>.joblib on first use.
+
+    Only the `capacity` most recently used region models stay resident; the default model is
+    always available and never evicted. Regions without a model file fall back to the default;
+    the model directory is listed at most every REGION_SCAN_INTERVAL seconds, so unknown region
+    codes from clients cost neither a filesystem check nor a loading lock.
+    """
+
+    def __init__(self, default_model, model_dir, capacity=4):
+        self.model_dir = model_dir
+        self.capacity = max(1, int(capacity))
+        self.default = LoadedModel(DEFAULT_REGION, default_model)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks = {}  # region -> [lock, threads using it]; removed once loading finishes
+        self._known_regions = frozenset()
+        self._scanned_at = None
+        self._load_seconds = {}
+        self._stats = {'hits': 0, 'misses': 0, 'fallbacks': 0, 'evictions': 0, 'load_failures': 0}
+
+    @staticmethod
+    def normalize_region(region):
+        """Lower-case a region code, returning None for empty or malformed codes"""
+        if not region:
+            return None
+        region = str(region).strip().lower()
+        return region if _REGION_PATTERN.match(region) else None
+
+    def model_path(self, region):
+        return os.path.join(self.model_dir, f"{region}.joblib")
+
+    def resolve(self, region=None):
+        """Return the LoadedModel for a region, falling back to the default model"""
+        region = self.normalize_region(region)
+        if region is None or region == DEFAULT_REGION:
+            return self.default
+
+        with self._lock:
+            if region in self._models:
+                self._models.move_to_end(region)
+                self._stats['hits'] += 1
+                return self._models[region]
+
+        if region not in self.known_regions():
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            return self.default
+
+        with self._lock:
+            entry = self._loading_locks.setdefault(region, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            # Load outside the registry lock so one slow region does not block the others
+            with entry[0]:
+                return self._load(region)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._loading_locks[region]
+
+    def _load(self, region):
+        with self._lock:
+            if region in self._models:
+                self._models.move_to_end(region)
+                self._stats['hits'] += 1
+                return self._models[region]
+
+        path = self.model_path(region)
+        if not os.path.exists(path):
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            return self.default
+
+        start = time.perf_counter()
+        try:
+            model = joblib.load(path)
+        except Exception as e:
+            logging.error(f"Failed to load crop model for region '{region}' from {path}: {e}", exc_info=True)
+            with self._lock:
+                self._stats['load_failures'] += 1
+                self._stats['fallbacks'] += 1
+            return self.default
+        elapsed = time.perf_counter() - start
+
+        loaded = LoadedModel(region, model)
+        with self._lock:
+            self._stats['misses'] += 1
+            self._load_seconds[region] = round(elapsed, 4)
+            self._models[region] = loaded
+            while len(self._models) > self.capacity:
+                evicted, _ = self._models.popitem(last=False)
+                self._stats['evictions'] += 1
+                logging.info(f"Evicted crop model for region '{evicted}' from the model cache")
+        logging.info(f"Loaded crop model for region '{region}' in {elapsed:.3f}s")
+        return loaded
+
+    def available_regions(self):
+        """Region codes that have a model file in the model directory"""
+        if not os.path.isdir(self.model_dir):
+            return []
+        return sorted(
+            name[:-len('.joblib')] for name in os.listdir(self.model_dir)
+            if name.endswith('.joblib') and self.normalize_region(name[:-len('.joblib')])
+        )
+
+    def known_regions(self):
+        """available_regions(), cached for REGION_SCAN_INTERVAL seconds"""
+        now = time.monotonic()
+        if self._scanned_at is None or now - self._scanned_at > REGION_SCAN_INTERVAL:
+            self._known_regions = frozenset(self.available_regions())
+            self._scanned_at = now
+        return self._known_regions
+
+    def stats(self):
+        """Cache residency, counters and load latencies for the health endpoint"""
+        available = self.available_regions()
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'resident': list(self._models.keys()),
+                'available': available,
+                'load_seconds': dict(self._load_seconds),
+                **self._stats
+            }
@@ -0,0 +1,303 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every process prefetches
+    fcntl = None
+
+from src.backend.utils.cache import is_cacheable
+
+
+class TokenBucket:
+    """Allows `rate` operations per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = max(float(rate), 1e-6)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class Prefetcher:
+    """
+    Keeps the most requested cache keys warm.
+
+    Each cache is registered once with a function that loads a key, and every request calls
+    `track` with the cache and key it used. Request counts decay with a half-life, so the hot set
+    follows current traffic. A background thread wakes every
+    `interval` seconds and reloads the `top_n` hottest keys whose entries are missing or within
+    `lead_seconds` of expiring, at most `rate` provider calls per second. Reloaded entries are
+    tagged 'prefetch' in their cache, which counts the requests they later serve. A key whose
+    reload fails is skipped for `interval` seconds, doubling per consecutive failure up to
+    `max_backoff`.
+
+    `rate` is a budget for the whole host. When the caches are shared between processes, pass
+    `lock_path` to `start` so only one process prefetches, and `db_path` so the request counts are
+    shared too: each process counts in memory and merges its counts into SQLite every
+    `flush_interval` seconds, and the hot set is read from there. With per-process caches every
+    process prefetches its own cache, so pass the process count as `processes` to split the budget.
+    """
+
+    SOURCE = 'prefetch'
+
+    def __init__(self, name, top_n=50, interval=60.0, lead_seconds=300.0, rate=0.5, burst=5,
+                 half_life=6 * 3600.0, max_tracked=1000, processes=1, max_backoff=3600.0, db_path=None,
+                 flush_interval=10.0):
+        self.name = name
+        self.top_n = max(1, int(top_n))
+        self.interval = float(interval)
+        self.lead_seconds = float(lead_seconds)
+        self.half_life = float(half_life)
+        self.max_tracked = max(self.top_n, int(max_tracked))
+        self.processes = max(1, int(processes))
+        self.bucket = TokenBucket(float(rate) / self.processes, burst)
+        self.max_backoff = float(max_backoff)
+        self.db_path = db_path
+        self.flush_interval = float(flush_interval)
+        self._lock = threading.Lock()
+        self._caches = {}  # cache name -> (cache, load(key))
+        # (cache name, key) -> (score, scored_at); with db_path only the counts not yet merged
+        self._tracked = {}
+        self._flushed_at = time.time()
+        self._backoff = {}  # (cache name, key) -> (consecutive failures, retry after)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._stats = {'rounds': 0, 'prefetched': 0, 'failures': 0, 'backed_off': 0, 'last_round_at': None}
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS prefetch_requests (
+                            prefetcher TEXT NOT NULL,
+                            cache TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            score REAL NOT NULL,
+                            scored_at REAL NOT NULL,
+                            PRIMARY KEY (prefetcher, cache, key)
+                        )
+                    ''')
+            finally:
+                conn.close()
+
+    def _connect(self):
+        # Autocommit, so _merge can take the write lock before it reads
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def _decayed(self, score, scored_at, now):
+        return score * math.pow(0.5, (now - scored_at) / self.half_life)
+
+    def register(self, cache, load):
+        """Prefetch keys of cache with load(key), which returns the value to store"""
+        with self._lock:
+            self._caches[cache.name] = (cache, load)
+
+    def track(self, cache, key):
+        """Count one request for key of a registered cache"""
+        now = time.time()
+        with self._lock:
+            entry = self._tracked.get((cache.name, key))
+            score = 1.0 if entry is None else self._decayed(entry[0], entry[1], now) + 1.0
+            self._tracked[(cache.name, key)] = (score, now)
+            if self.db_path:
+                due = now - self._flushed_at >= self.flush_interval
+            elif len(self._tracked) > self.max_tracked:
+                self._trim(self._tracked, now)
+        if self.db_path and due:
+            self._merge(now)
+
+    def _coldest(self, scores, now):
+        # The coldest tenth, so trimming runs once per many new keys, not on every request
+        ranked = sorted(scores, key=lambda k: self._decayed(*scores[k], now))
+        return ranked[:max(1, len(ranked) // 10)]
+
+    def _trim(self, scores, now):
+        for k in self._coldest(scores, now):
+            del scores[k]
+            self._backoff.pop(k, None)
+
+    def _merge(self, now):
+        """Add this process's counts to the shared ones in SQLite"""
+        with self._lock:
+            pending, self._tracked = self._tracked, {}
+            self._flushed_at = now
+        if not pending:
+            return
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                shared = {(cache, key): (score, at) for cache, key, score, at in conn.execute(
+                    'SELECT cache, key, score, scored_at FROM prefetch_requests WHERE prefetcher = ?', (self.name,)
+                )}
+                for k, (score, at) in pending.items():
+                    old = shared.get(k)
+                    shared[k] = (self._decayed(score, at, now) + (self._decayed(*old, now) if old else 0.0), now)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO prefetch_requests (prefetcher, cache, key, score, scored_at) VALUES (?, ?, ?, ?, ?)',
+                    [(self.name, cache, key, *shared[(cache, key)]) for cache, key in pending]
+                )
+                if len(shared) > self.max_tracked:
+                    conn.executemany(
+                        'DELETE FROM prefetch_requests WHERE prefetcher = ? AND cache = ? AND key = ?',
+                        [(self.name, cache, key) for cache, key in self._coldest(shared, now)]
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception:
+            logging.error(f"Could not merge {self.name} prefetch request counts; keeping them for the next merge", exc_info=True)
+            with self._lock:
+                now = time.time()
+                for k, (score, at) in pending.items():
+                    entry = self._tracked.get(k)
+                    self._tracked[k] = (self._decayed(score, at, now) + (self._decayed(*entry, now) if entry else 0.0), now)
+        finally:
+            conn.close()
+
+    def _scores(self):
+        """Decayed request count per (cache name, key), from SQLite when it is shared"""
+        if not self.db_path:
+            with self._lock:
+                return dict(self._tracked)
+        self._merge(time.time())
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT cache, key, score, scored_at FROM prefetch_requests WHERE prefetcher = ?',
+                                (self.name,)).fetchall()
+        finally:
+            conn.close()
+        return {(cache, key): (score, at) for cache, key, score, at in rows}
+
+    def hot(self):
+        """The top_n keys of registered caches by decayed request count as (score, cache, key), hottest first"""
+        return self._rank(self._scores())
+
+    def _rank(self, scores):
+        now = time.time()
+        with self._lock:
+            caches = dict(self._caches)
+        scored = [(self._decayed(score, at, now), caches[name][0], key)
+                  for (name, key), (score, at) in scores.items() if name in caches]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:self.top_n]
+
+    def run_once(self):
+        """Refresh every hot key that is missing or about to expire; returns the number refreshed"""
+        refreshed = 0
+        hot = self.hot()
+        with self._lock:
+            # Keys that left the hot set keep their backoff only while it is running
+            hot_keys = {(cache.name, key) for _, cache, key in hot}
+            self._backoff = {k: v for k, v in self._backoff.items() if k in hot_keys or time.time() < v[1]}
+        for _, cache, key in hot:
+            if self._stop.is_set():
+                break
+            age = cache.entry_age(key)
+            if age is not None and age < cache.ttl - self.lead_seconds:
+                continue
+            with self._lock:
+                backoff = self._backoff.get((cache.name, key))
+                if backoff and time.time() < backoff[1]:
+                    self._stats['backed_off'] += 1
+                    continue
+            if self._stop.wait(self.bucket.reserve()):
+                break
+            load = self._caches[cache.name][1]
+            try:
+                value = cache.refresh(key, lambda: load(key), source=self.SOURCE)
+            except Exception:
+                value = None
+                logging.error(f"Prefetch failed for {cache.name} key '{key}'", exc_info=True)
+            with self._lock:
+                if is_cacheable(value):
+                    self._stats['prefetched'] += 1
+                    self._backoff.pop((cache.name, key), None)
+                    refreshed += 1
+                else:
+                    self._stats['failures'] += 1
+                    failures = self._backoff.get((cache.name, key), (0, 0))[0] + 1
+                    delay = min(self.max_backoff, self.interval * 2 ** (failures - 1))
+                    self._backoff[(cache.name, key)] = (failures, time.time() + delay)
+        with self._lock:
+            self._stats['rounds'] += 1
+            self._stats['last_round_at'] = round(time.time(), 1)
+        return refreshed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logging.error(f"{self.name} prefetch round failed", exc_info=True)
+
+    def _acquire_leadership(self, lock_path):
+        """Take the host-wide prefetch lock without blocking; False if another process holds it"""
+        if fcntl is None or self._lock_file is not None:
+            return True
+        directory = os.path.dirname(lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held until the process exits, when the OS releases it for another process to take over
+        self._lock_file = lock_file
+        return True
+
+    def start(self, lock_path=None):
+        """Start the background thread; with lock_path, only if no other process holds that lock"""
+        if lock_path and not self._acquire_leadership(lock_path):
+            logging.info(f"{self.name} prefetch runs in another process; not starting it here")
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-prefetch", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        scores = self._scores()
+        hot = self._rank(scores)
+        with self._lock:
+            stats = dict(self._stats)
+            backing_off = len(self._backoff)
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'shared': bool(self.db_path),
+            'tracked': len(scores),
+            'top_n': self.top_n,
+            'interval': self.interval,
+            'lead_seconds': self.lead_seconds,
+            'rate_per_second': self.bucket.rate,
+            'processes': self.processes,
+            'keys_backing_off': backing_off,
+            'hot': [f"{cache.name}:{key}" for _, cache, key in hot[:10]],
+            **stats
+        }
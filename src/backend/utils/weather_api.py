@@ -1,15 +1,197 @@
+import math
 import os
+from datetime import date
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from src.backend.utils.cache import TTLCache, SingleFlight
+from src.backend.utils.agro_indices import compute_indices
+from src.backend.utils.geocode_store import GeocodeStore, normalize_place
+from src.backend.utils.http_client import provider_get, provider_metrics, breaker_states
+from src.backend.utils.prefetch import Prefetcher
+
+# Set WEATHER_PROVIDER_URL (e.g. http://127.0.0.1:8099) to send every provider call to the local
+# fake in src/backend/utils/fake_weather_provider.py for offline benchmarks and load tests
+WEATHER_PROVIDER_URL = (os.environ.get('WEATHER_PROVIDER_URL') or '').rstrip('/') or None
+if WEATHER_PROVIDER_URL:
+    OPENWEATHER_URL = f"{WEATHER_PROVIDER_URL}/data/2.5/weather"
+    GEOCODING_URL = f"{WEATHER_PROVIDER_URL}/v1/search"
+    FORECAST_URL = f"{WEATHER_PROVIDER_URL}/v1/forecast"
+else:
+    OPENWEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+    GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+    FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+DAILY_FIELDS = "temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,weather_code"
+# Hourly series requested by the extended forecast for the farming indices
+HOURLY_FIELDS = ('temperature_2m', 'relative_humidity_2m', 'precipitation_probability', 'precipitation', 'wind_speed_10m')
+
+# Open-Meteo accepts comma-separated coordinate lists; larger batches are split into chunks
+FORECAST_CHUNK_SIZE = int(os.environ.get('WEATHER_FORECAST_CHUNK_SIZE', 50))
+WEATHER_BATCH_WORKERS = int(os.environ.get('WEATHER_BATCH_WORKERS', 8))
+
+# Farm coordinates are snapped to square cells of this many degrees (0.1 deg is roughly 11 km);
+# every farm in a cell shares one cached forecast
+WEATHER_GRID_DEG = float(os.environ.get('WEATHER_GRID_DEG', 0.1))
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+
+# ----------------------------
+# Weather caches
+# ----------------------------
+# Current conditions change within minutes, forecasts within hours; both are served stale for
+# WEATHER_STALE_TTL seconds while a background refresh runs. Set WEATHER_CACHE_DB to share the
+# caches across uvicorn workers through SQLite.
+WEATHER_CACHE_DB = os.environ.get('WEATHER_CACHE_DB') or None
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 1024))
+WEATHER_STALE_TTL = float(os.environ.get('WEATHER_STALE_TTL', 1800))
+
+current_weather_cache = TTLCache(
+    'weather_current',
+    ttl=float(os.environ.get('WEATHER_CURRENT_TTL', 600)),
+    stale_ttl=WEATHER_STALE_TTL,
+    max_entries=WEATHER_CACHE_SIZE,
+    db_path=WEATHER_CACHE_DB
+)
+forecast_cache = TTLCache(
+    'weather_forecast',
+    ttl=float(os.environ.get('WEATHER_FORECAST_TTL', 3600)),
+    stale_ttl=WEATHER_STALE_TTL,
+    max_entries=WEATHER_CACHE_SIZE,
+    db_path=WEATHER_CACHE_DB
+)
+extended_forecast_cache = TTLCache(
+    'weather_forecast_extended',
+    ttl=float(os.environ.get('WEATHER_FORECAST_TTL', 3600)),
+    stale_ttl=WEATHER_STALE_TTL,
+    max_entries=WEATHER_CACHE_SIZE,
+    db_path=WEATHER_CACHE_DB
+)
+
+# Persistent city -> coordinates store, pre-seeded with Indian districts and towns
+geocode_store = GeocodeStore(
+    db_path=os.environ.get('WEATHER_GEOCODE_DB', os.path.join(DATA_DIR, 'geocode.db')),
+    seed_csv=os.path.join(DATA_DIR, 'india_places.csv')
+)
+
+# Concurrent geocoding requests for the same unknown place share one upstream call
+geocode_flight = SingleFlight()
+
+# Keeps the most requested cities and grid cells warm; started by the app when WEATHER_PREFETCH is on
+weather_prefetcher = Prefetcher(
+    'weather',
+    top_n=int(os.environ.get('WEATHER_PREFETCH_TOP_N', 50)),
+    interval=float(os.environ.get('WEATHER_PREFETCH_INTERVAL', 60)),
+    lead_seconds=float(os.environ.get('WEATHER_PREFETCH_LEAD', 300)),
+    rate=float(os.environ.get('WEATHER_PREFETCH_RATE', 0.5)),
+    half_life=float(os.environ.get('WEATHER_PREFETCH_HALF_LIFE', 6 * 3600)),
+    # With per-process caches each uvicorn worker prefetches for itself, on its share of the rate
+    processes=1 if WEATHER_CACHE_DB else int(os.environ.get('WEB_CONCURRENCY', 1)),
+    # With a shared cache the request counts are shared too, so the hot set covers every worker
+    db_path=WEATHER_CACHE_DB
+)
+# Keys are reloaded from the key alone, since the prefetching process may not have seen the request
+weather_prefetcher.register(current_weather_cache, lambda key: fetch_weather_data(key))
+weather_prefetcher.register(forecast_cache, lambda key: load_forecast(key))
+weather_prefetcher.register(extended_forecast_cache, lambda key: load_forecast(key, extended=True))
+# With a shared cache one process prefetches for all of them
+WEATHER_PREFETCH_LOCK = os.path.join(DATA_DIR, 'weather_prefetch.lock') if WEATHER_CACHE_DB else None
+
+def normalize_city(city):
+    """Cache key for a city name: trimmed, single-spaced and case-folded"""
+    return " ".join(str(city).split()).casefold()
 
 def get_weather_data(city):
+    """Get current weather data, served from the cache while fresh"""
+    key = normalize_city(city)
+    weather_prefetcher.track(current_weather_cache, key)
+    return current_weather_cache.get_or_load(key, lambda: fetch_weather_data(city))
+
+def _forecast_cache(extended):
+    return extended_forecast_cache if extended else forecast_cache
+
+def get_weather_forecast(city: str, extended=False):
+    """Get the 7-day forecast (with farming indices when extended), served from the cache while fresh"""
+    cache, key = _forecast_cache(extended), normalize_city(city)
+    weather_prefetcher.track(cache, key)
+    return cache.get_or_load(key, lambda: fetch_weather_forecast(city, extended))
+
+def snap_to_grid(lat, lon, cell=None):
+    """Return (cache key, cell centre) for the grid cell containing a coordinate"""
+    cell = cell or WEATHER_GRID_DEG
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Latitude must be within [-90, 90] and longitude within [-180, 180]")
+    # The epsilon keeps values on a cell boundary (18.5 / 0.1 == 184.99999999999997) in the upper cell
+    row, col = math.floor(lat / cell + 1e-9), math.floor(lon / cell + 1e-9)
+    return f"grid:{cell:g}:{row}:{col}", _cell_centre(row, col, cell)
+
+def _cell_centre(row, col, cell):
+    return {"lat": round((row + 0.5) * cell, 6), "lon": round((col + 0.5) * cell, 6)}
+
+def grid_centre(key):
+    """Cell centre for a grid cache key made by snap_to_grid"""
+    _, cell, row, col = key.split(":")
+    return _cell_centre(int(row), int(col), float(cell))
+
+def load_forecast(key, extended=False):
+    """Fetch the forecast for a forecast cache key: a grid cell key or a normalized city name"""
+    if key.startswith("grid:"):
+        return fetch_cell_forecast(grid_centre(key), extended)
+    return fetch_weather_forecast(key, extended)
+
+def get_forecast_by_coordinates(lat, lon, extended=False):
+    """Get the 7-day forecast for a farm location, shared by every farm in its grid cell"""
+    key, centre = snap_to_grid(lat, lon)
+    cache = _forecast_cache(extended)
+    weather_prefetcher.track(cache, key)
+    forecast = cache.get_or_load(key, lambda: fetch_cell_forecast(centre, extended))
+    return {**forecast, "location": {"lat": float(lat), "lon": float(lon)}}
+
+def fetch_cell_forecast(centre, extended=False):
+    """Fetch the forecast for a grid cell centre"""
+    try:
+        days = fetch_forecast_for_coordinates([centre], extended)[0]
+        return _cell_forecast(centre, days)
+    except requests.exceptions.RequestException as e:
+        print(f"Forecast API error for cell {centre}: {e}")
+        return {"error": "Failed to fetch forecast"}
+
+def _cell_forecast(centre, days):
+    return {"success": True, "cell": {**centre, "size_deg": WEATHER_GRID_DEG}, "days": days}
+
+def weather_cache_stats():
+    """Cache statistics for the weather health endpoint"""
+    return {
+        'current': current_weather_cache.stats(),
+        'forecast': forecast_cache.stats(),
+        'forecast_extended': extended_forecast_cache.stats(),
+        'geocode': {**geocode_store.stats(), 'single_flight': geocode_flight.stats()}
+    }
+
+def weather_prefetch_stats():
+    """Prefetcher state and how many requests were served from prefetched entries"""
+    served = sum(cache.stats()['hits_by_source'].get(Prefetcher.SOURCE, 0)
+                 for cache in (current_weather_cache, forecast_cache, extended_forecast_cache))
+    return {**weather_prefetcher.stats(), 'served_from_prefetch': served}
+
+def weather_provider_stats():
+    """Per-provider request counts, errors and latency percentiles"""
+    return provider_metrics.snapshot()
+
+def weather_breaker_states():
+    """Circuit breaker state per provider"""
+    return breaker_states()
+
+def fetch_weather_data(city):
     """Get current weather data from OpenWeatherMap API"""
-    api_key = os.environ.get("OPENWEATHER_API_KEY")
-    base_url = "http://api.openweathermap.org/data/2.5/weather"
+    # The fake provider ignores the key, so none needs to be configured when it is in use
+    api_key = os.environ.get("OPENWEATHER_API_KEY") or ('fake' if WEATHER_PROVIDER_URL else None)
+    base_url = OPENWEATHER_URL
     if not api_key:
         return {"error": "Weather service is not configured. Please set the OPENWEATHER_API_KEY environment variable."}
     try:
         params = {'q': city, 'appid': api_key, 'units': 'metric'}
-        response = requests.get(base_url, params=params, timeout=10)
+        response = provider_get('openweathermap', base_url, params=params)
         data = response.json()
         if response.status_code == 200:
             return {
@@ -25,11 +207,24 @@ def get_weather_data(city):
         return {"error": f"Failed to fetch weather data: {str(e)}"}
 
 def get_coordinates(city: str):
+    """Resolve a city to coordinates from the local geocode store, geocoding only unknown places"""
+    coords = geocode_store.lookup(city)
+    if coords:
+        return coords
+    return geocode_flight.do(normalize_place(city), lambda: _geocode_and_store(city))
+
+def _geocode_and_store(city):
+    coords = fetch_coordinates(city)
+    if coords and coords.get('lat') is not None and coords.get('lon') is not None:
+        geocode_store.save(city, coords)
+    return coords
+
+def fetch_coordinates(city: str):
     """Geocode a city name to latitude and longitude using Open-Meteo Geocoding API (no key)"""
-    url = "https://geocoding-api.open-meteo.com/v1/search"
+    url = GEOCODING_URL
     params = {"name": city, "count": 1}
     try:
-        r = requests.get(url, params=params, timeout=10)
+        r = provider_get('open_meteo_geocoding', url, params=params)
         r.raise_for_status() # Raise an exception for bad status codes
         results = r.json().get('results') or []
         if not results:
@@ -40,38 +235,168 @@ def get_coordinates(city: str):
         print(f"Geocoding API error for {city}: {e}")
         return None
 
-def get_weather_forecast(city: str):
+def _format_daily(d):
+    """Convert an Open-Meteo 'daily' block into the 7-day list served to the frontend"""
+    days = []
+    for i, dt in enumerate(d.get('time', [])[:7]):
+        days.append({
+            "dt": dt,
+            "temp_min": d.get('temperature_2m_min', [None])[i],
+            "temp_max": d.get('temperature_2m_max', [None])[i],
+            "humidity": d.get('relative_humidity_2m_mean', [None])[i],
+            "weather_code": d.get('weather_code', [None])[i]
+        })
+    return days
+
+def fetch_forecast_for_coordinates(points, extended=False):
+    """
+    Fetch daily forecasts for many coordinates in one Open-Meteo request; returns one day list per point.
+
+    With extended=True the hourly series are requested too and each day gains an 'agro' block of
+    farming indices, computed for all points at once.
+    """
+    params = {
+        "latitude": ",".join(str(p["lat"]) for p in points),
+        "longitude": ",".join(str(p["lon"]) for p in points),
+        "daily": DAILY_FIELDS,
+        "timezone": "auto"
+    }
+    if extended:
+        params["hourly"] = ",".join(HOURLY_FIELDS)
+    r = provider_get('open_meteo_forecast', FORECAST_URL, params=params)
+    r.raise_for_status()
+    payload = r.json()
+    # A single coordinate returns an object, several return a list in request order
+    results = payload if isinstance(payload, list) else [payload]
+    forecasts = [_format_daily(result.get('daily', {})) for result in results]
+    if extended:
+        _add_agro_indices(results, forecasts, points)
+    return forecasts
+
+def _add_agro_indices(results, forecasts, points):
+    """Attach per-day farming indices computed over the stacked hourly series of every point"""
+    n_hours = max(len(result.get('hourly', {}).get('time', [])) for result in results)
+    n_days = max(len(days) for days in forecasts)
+    if not n_hours or not n_days:
+        return
+
+    hourly = {field: np.full((len(results), n_hours), np.nan) for field in HOURLY_FIELDS}
+    day_of_year = np.ones((len(results), n_days))
+    for i, (result, days) in enumerate(zip(results, forecasts)):
+        for field in HOURLY_FIELDS:
+            values = result.get('hourly', {}).get(field) or []
+            hourly[field][i, :len(values)] = np.array(values, dtype=float)
+        day_of_year[i, :len(days)] = [date.fromisoformat(day['dt']).timetuple().tm_yday for day in days]
+    latitude = [result.get('latitude', point['lat']) for result, point in zip(results, points)]
+
+    indices = compute_indices(hourly, latitude, day_of_year)
+    rounded = {name: _json_values(values) for name, values in indices.items()}
+    for i, days in enumerate(forecasts):
+        for d, day in enumerate(days[:len(rounded['gdd'][i])]):
+            start, hours = rounded['spray_start_hour'][i][d], rounded['spray_hours'][i][d]
+            day['agro'] = {
+                "gdd": rounded['gdd'][i][d],
+                "et0_mm": rounded['et0_mm'][i][d],
+                "rain_mm": rounded['rain_mm'][i][d],
+                "max_rain_probability": rounded['max_rain_probability'][i][d],
+                "spray_window": {"start_hour": int(start), "hours": int(hours)} if hours > 0 else None,
+                "frost_risk": bool(rounded['frost_risk'][i][d]),
+                "heat_stress": bool(rounded['heat_stress'][i][d])
+            }
+
+def _json_values(values):
+    """Round float arrays to 2 decimals for JSON, with NaN (missing hours) as None"""
+    if values.dtype.kind != 'f':
+        return values.tolist()
+    return np.where(np.isnan(values), None, np.round(values, 2)).tolist()
+
+def fetch_weather_forecast(city: str, extended=False):
     """Get 7-day daily weather forecast using Open-Meteo (no key)"""
     coords = get_coordinates(city)
     if not coords:
         return {"error": f"Could not find location for '{city}'"}
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": coords["lat"],
-        "longitude": coords["lon"],
-        "daily": "temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,weather_code",
-        "timezone": "auto"
-    }
     try:
-        r = requests.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        d = r.json().get('daily', {})
-        days = []
-        for i, dt in enumerate(d.get('time', [])[:7]):
-            days.append({
-                "dt": dt,
-                "temp_min": d.get('temperature_2m_min', [None])[i],
-                "temp_max": d.get('temperature_2m_max', [None])[i],
-                "humidity": d.get('relative_humidity_2m_mean', [None])[i],
-                "weather_code": d.get('weather_code', [None])[i]
-            })
+        days = fetch_forecast_for_coordinates([coords], extended)[0]
         return {"success": True, "city": coords["name"], "country": coords.get("country", ""), "days": days}
     except requests.exceptions.RequestException as e:
         print(f"Forecast API error for {city}: {e}")
         return {"error": "Failed to fetch forecast"}
 
+def get_weather_forecasts(locations, extended=False):
+    """
+    Forecasts for many locations at once, in input order, with per-location errors.
+
+    A location is a city name or a {"lat": .., "lon": ..} farm coordinate; coordinates are snapped
+    to grid cells so nearby farms share one entry. Cached entries are served directly. Uncached
+    cities are resolved against the geocode store in one query and unknown places are geocoded
+    concurrently. Forecasts are then fetched with one multi-coordinate Open-Meteo request per
+    chunk, chunks running concurrently.
+    """
+    cache = _forecast_cache(extended)
+    keys, names, coords, results = [], {}, {}, {}
+    for location in locations:
+        if isinstance(location, dict):
+            try:
+                key, centre = snap_to_grid(location.get("lat"), location.get("lon"))
+                coords[key] = centre
+            except (TypeError, ValueError):
+                key = f"invalid:{len(keys)}"
+                results[key] = {"error": "Invalid coordinates"}
+        else:
+            key = normalize_city(location)
+            names.setdefault(key, location)
+        keys.append(key)
+
+    for key in list(names) + list(coords):
+        weather_prefetcher.track(cache, key)
+
+    for key in set(names) | set(coords):
+        cached = cache.get(key)
+        if cached is not None:
+            results[key] = cached
+    names = {key: city for key, city in names.items() if key not in results}
+    coords = {key: centre for key, centre in coords.items() if key not in results}
+
+    if names:
+        known = geocode_store.lookup_many(names.values())
+        for key, city in names.items():
+            coords[key] = known.get(normalize_place(city))
+
+    unresolved = [key for key in names if not coords.get(key)]
+    if unresolved or coords:
+        with ThreadPoolExecutor(max_workers=WEATHER_BATCH_WORKERS) as pool:
+            for key, point in zip(unresolved, pool.map(lambda key: get_coordinates(names[key]), unresolved)):
+                coords[key] = point
+                if not point:
+                    results[key] = {"error": f"Could not find location for '{names[key]}'"}
+
+            pending = [key for key, point in coords.items() if point]
+            chunks = [pending[i:i + FORECAST_CHUNK_SIZE] for i in range(0, len(pending), FORECAST_CHUNK_SIZE)]
+
+            def fetch_chunk(chunk):
+                try:
+                    return fetch_forecast_for_coordinates([coords[key] for key in chunk], extended)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    print(f"Forecast API error for batch of {len(chunk)} locations: {e}")
+                    return None
+
+            for chunk, forecasts in zip(chunks, pool.map(fetch_chunk, chunks)):
+                for i, key in enumerate(chunk):
+                    if forecasts is None or i >= len(forecasts):
+                        results[key] = cache.last_known(key) or {"error": "Failed to fetch forecast"}
+                        continue
+                    if key in names:
+                        forecast = {"success": True, "city": coords[key]["name"], "country": coords[key].get("country", ""), "days": forecasts[i]}
+                    else:
+                        forecast = _cell_forecast(coords[key], forecasts[i])
+                    cache.set(key, forecast)
+                    results[key] = forecast
+
+    return [{"location": location, **results[key]} for location, key in zip(locations, keys)]
+
 class WeatherAPIWrapper:
     """Wrapper to provide a consistent interface for weather data to the chatbot."""
     def get_current_weather(self, city):
-        # This uses the OpenWeatherMap API for current conditions
+        # Same cached, single-flight path as /api/weather, so chatbot turns and page requests
+        # for one town share a single OpenWeatherMap call
         return get_weather_data(city)
\ No newline at end of file
@@ -144,23 +144,19 @@ class AgriChatbot {
         this.showTypingIndicator();
 
         try {
-            // Send to backend
-            const response = await fetch('/api/chatbot', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ message })
-            });
-
-            const data = await response.json();
+            // Send to backend; the reply streams into its bubble as it is generated
+            const { data, textDiv } = await this.requestReply(message);
 
             // Remove typing indicator
             this.removeTypingIndicator();
 
-            if (data.success) {
-                // Add bot response
-                this.addMessage(data.response, 'bot');
+            if (data && data.success) {
+                // Add bot response (replacing the streamed text with the final version)
+                if (textDiv) {
+                    textDiv.innerHTML = this.formatMessage(data.response);
+                } else {
+                    this.addMessage(data.response, 'bot');
+                }
 
                 // Show suggestions if available
                 if (data.suggestions && data.suggestions.length > 0) {
@@ -170,6 +166,9 @@ class AgriChatbot {
                 // Save to history
                 this.saveToHistory(message, data.response);
             } else {
+                if (textDiv) {
+                    textDiv.closest('.chatbot-message').remove();
+                }
                 this.addMessage('Sorry, I encountered an error. Please try again.', 'bot', true);
             }
         } catch (error) {
@@ -179,6 +178,65 @@ class AgriChatbot {
         }
     }
 
+    async requestReply(message) {
+        const request = {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ message })
+        };
+
+        // Browsers without streamed fetch bodies use the plain JSON endpoint
+        if (!window.ReadableStream || !window.TextDecoder) {
+            const response = await fetch('/api/chatbot', request);
+            return { data: await response.json(), textDiv: null };
+        }
+
+        const response = await fetch('/api/chatbot/stream', request);
+        if (!response.ok || !response.body) {
+            return { data: await response.json(), textDiv: null };
+        }
+
+        // Server-sent events: "event: token" frames carry text, the final "done" frame the full reply
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let textDiv = null;
+        let data = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const eventLine = frame.split('\n').find(line => line.startsWith('event:'));
+                const dataLine = frame.split('\n').find(line => line.startsWith('data:'));
+                if (!eventLine || !dataLine) continue;
+
+                const event = eventLine.slice(6).trim();
+                const payload = JSON.parse(dataLine.slice(5));
+                if (event === 'token') {
+                    if (!textDiv) {
+                        this.removeTypingIndicator();
+                        textDiv = this.addMessage('', 'bot');
+                    }
+                    text += payload.text;
+                    textDiv.innerHTML = this.formatMessage(text);
+                    this.scrollToBottom();
+                } else {
+                    data = payload;
+                }
+            }
+        }
+        return { data, textDiv };
+    }
+
     addMessage(text, sender, isError = false) {
         const messagesContainer = document.getElementById('chatbot-messages');
         const messageDiv = document.createElement('div');
@@ -204,6 +262,7 @@ class AgriChatbot {
 
         messagesContainer.appendChild(messageDiv);
         this.scrollToBottom();
+        return messageDiv.querySelector('.message-text');
     }
 
     formatMessage(text) {
@@ -3,6 +3,7 @@
 // Global variables
 let currentUser = null;
 let currentCropData = null;
+let currentFertilizerPlan = {}; // Fertilizer analysis per crop from /api/plan
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function () {
@@ -102,8 +103,8 @@ async function handleCropRecommendation(e) {
             rainfall: parseFloat(formData.get('rainfall'))
         };
 
-        // Make API request
-        const response = await fetch('/api/predict/crop', {
+        // Crops and their fertilizer analysis arrive in a single round-trip
+        const response = await fetch('/api/plan', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -116,6 +117,10 @@ async function handleCropRecommendation(e) {
         if (result.success) {
             displayCropResults(result);
             currentCropData = data; // Store for fertilizer recommendation
+            currentFertilizerPlan = {};
+            result.predictions.forEach(prediction => {
+                currentFertilizerPlan[prediction.crop] = prediction.fertilizer;
+            });
         } else {
             showError('Crop Recommendation', result.error);
         }
@@ -176,6 +181,11 @@ async function getFertilizerRecommendation(crop) {
         return;
     }
 
+    if (currentFertilizerPlan[crop]) {
+        displayFertilizerResults(crop, currentFertilizerPlan[crop]);
+        return;
+    }
+
     try {
         const data = {
             crop: crop,
@@ -239,6 +249,17 @@ function displayFertilizerResults(crop, data) {
                 </div>
             </div>
         `;
+
+        if (data.blend && data.blend.products.length) {
+            const items = data.blend.products
+                .map(item => `<li>${item.product}: ${item.kg} kg</li>`)
+                .join('');
+            html += `
+                <h6 class="mt-3">Cheapest Blend</h6>
+                <ul class="mb-2">${items}</ul>
+                <p class="mb-0"><strong>Estimated cost:</strong> ₹${data.blend.cost}</p>
+            `;
+        }
     }
 
     html += `
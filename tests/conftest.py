@@ -0,0 +1,30 @@
+"""
+Shared fixtures for the unit tests (run from the repository root: python -m pytest tests)
+"""
+import pytest
+
+from src.backend.utils import cache, circuit_breaker, prefetch
+
+
+class FakeClock:
+    """Stands in for the time module: time(), monotonic() and perf_counter() only move on advance()"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    monotonic = perf_counter = time
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A FakeClock installed as `time` in the breaker, cache and prefetch modules"""
+    fake = FakeClock()
+    for module in (circuit_breaker, cache, prefetch):
+        monkeypatch.setattr(module, 'time', fake)
+    return fake
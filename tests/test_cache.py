@@ -0,0 +1,245 @@
+"""
+Unit tests for TTLCache (fresh, stale-while-revalidate and last-known paths) and SingleFlight,
+with a fake clock and fake loaders
+"""
+import asyncio
+import threading
+
+import pytest
+
+from src.backend.utils.cache import SingleFlight, TTLCache
+
+
+class FakeLoader:
+    """Returns the queued values in order (raising any that are exceptions) and counts its calls"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    async def acall(self):
+        return self()
+
+
+def wait_for_refresh(cache):
+    for _ in range(200):
+        if cache.stats()['refreshing'] == 0:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("background refresh did not finish")
+
+
+def test_miss_loads_once_then_hits(clock):
+    cache = TTLCache('test', ttl=60)
+    loader = FakeLoader({'v': 1})
+    assert cache.get_or_load('k', loader) == {'v': 1}
+    clock.advance(59)
+    assert cache.get_or_load('k', loader) == {'v': 1}
+    assert loader.calls == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_stale_entry_is_served_while_one_background_refresh_runs(clock):
+    cache = TTLCache('test', ttl=60, stale_ttl=30)
+    release = threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        release.wait(5)
+        return {'v': 2}
+
+    cache.set('k', {'v': 1})
+    clock.advance(70)
+    assert cache.get_or_load('k', slow_loader) == {'v': 1}
+    assert cache.get_or_load('k', slow_loader) == {'v': 1}
+    release.set()
+    wait_for_refresh(cache)
+    assert len(calls) == 1
+    assert cache.get_or_load('k', slow_loader) == {'v': 2}
+    stats = cache.stats()
+    assert stats['stale_hits'] == 2
+    assert stats['refreshes'] == 1
+
+
+def test_failed_background_refresh_is_counted(clock):
+    cache = TTLCache('test', ttl=60, stale_ttl=30)
+    cache.set('k', {'v': 1})
+    clock.advance(70)
+    assert cache.get_or_load('k', FakeLoader(RuntimeError("upstream down"))) == {'v': 1}
+    wait_for_refresh(cache)
+    assert cache.stats()['refresh_failures'] == 1
+
+
+def test_entry_past_the_stale_window_loads_synchronously(clock):
+    cache = TTLCache('test', ttl=60, stale_ttl=30)
+    cache.set('k', {'v': 1})
+    clock.advance(91)
+    assert cache.get_or_load('k', FakeLoader({'v': 2})) == {'v': 2}
+
+
+def test_failed_load_serves_the_last_known_value_marked_stale(clock):
+    cache = TTLCache('test', ttl=60)
+    cache.set('k', {'v': 1})
+    clock.advance(61)
+    assert cache.get_or_load('k', FakeLoader(RuntimeError("upstream down"))) == {'v': 1, 'stale': True}
+    assert cache.get_or_load('k', FakeLoader({'error': 'not found'})) == {'v': 1, 'stale': True}
+    assert cache.stats()['served_last_known'] == 2
+
+
+def test_failed_load_without_an_entry_raises(clock):
+    cache = TTLCache('test', ttl=60)
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('k', FakeLoader(RuntimeError("upstream down")))
+
+
+def test_error_payloads_are_returned_but_not_cached(clock):
+    cache = TTLCache('test', ttl=60)
+    loader = FakeLoader({'error': 'not found'}, {'v': 1})
+    assert cache.get_or_load('k', loader) == {'error': 'not found'}
+    assert cache.get_or_load('k', loader) == {'v': 1}
+
+
+def test_hits_are_counted_by_source_until_rewritten(clock):
+    cache = TTLCache('test', ttl=60)
+    cache.refresh('k', FakeLoader({'v': 1}), source='prefetch')
+    cache.get('k')
+    cache.get_or_load('k', FakeLoader())
+    cache.set('k', {'v': 2})
+    cache.get('k')
+    assert cache.stats()['hits_by_source'] == {'prefetch': 2}
+
+
+def test_sqlite_caches_share_entries_sources_and_hit_counts(clock, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = TTLCache('shared', ttl=60, db_path=path), TTLCache('shared', ttl=60, db_path=path)
+    first.refresh('k', FakeLoader({'v': 1}), source='prefetch')
+    assert second.get_or_load('k', FakeLoader()) == {'v': 1}
+    second.get('k')
+    assert first.stats()['hits_by_source'] == {}
+    second.stats()  # flushes the second cache's counts
+    assert first.stats()['hits_by_source'] == {'prefetch': 2}
+
+
+def test_aget_or_load_follows_the_same_paths(clock):
+    cache = TTLCache('test', ttl=60, stale_ttl=30)
+    loader = FakeLoader({'v': 1}, {'v': 2})
+
+    async def scenario():
+        assert await cache.aget_or_load('k', loader.acall) == {'v': 1}
+        assert await cache.aget_or_load('k', loader.acall) == {'v': 1}
+        clock.advance(70)
+        assert await cache.aget_or_load('k', loader.acall) == {'v': 1}
+        while cache.stats()['refreshing']:
+            await asyncio.sleep(0)  # let the background refresh task run
+        assert await cache.aget_or_load('k', loader.acall) == {'v': 2}
+
+    asyncio.run(scenario())
+    assert loader.calls == 2
+    assert cache.stats()['refreshes'] == 1
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start `callers` threads on flight.do(key, fn); returns (results, errors) once all finish"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def wait_for_followers(flight, count):
+    for _ in range(500):
+        if flight.stats()['coalesced'] >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("followers did not join the call")
+
+
+def test_single_flight_runs_one_call_for_concurrent_callers():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {'items': [1]}
+
+    threads, results, errors = run_concurrently(flight, 'k', fn, 5)
+    wait_for_followers(flight, 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'items': [1]}] * 5 and not errors
+    assert flight.stats() == {'executed': 1, 'coalesced': 4, 'in_flight': 0}
+    # Followers get copies, so one caller mutating its result cannot affect another
+    results[0]['items'].append(2)
+    assert [r['items'] for r in results].count([1]) == 4
+
+
+def test_single_flight_propagates_the_leaders_error_to_every_caller():
+    flight, release = SingleFlight(), threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    threads, results, errors = run_concurrently(flight, 'k', fn, 3)
+    wait_for_followers(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert not results
+    assert len(errors) == 3 and all(isinstance(e, RuntimeError) for e in errors)
+    # The failed call is forgotten, so the next caller runs again
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+def test_async_callers_share_calls_with_each_other_and_with_threads():
+    flight, calls = SingleFlight(), []
+
+    async def afn():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return 'answer'
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        leader = asyncio.ensure_future(flight.ado('k', afn))
+        await asyncio.sleep(0)
+        thread_follower = loop.run_in_executor(None, flight.do, 'k', lambda: 'not called')
+        results = await asyncio.gather(leader, *[flight.ado('k', afn) for _ in range(3)], thread_follower)
+        return results
+
+    assert asyncio.run(scenario()) == ['answer'] * 5
+    assert len(calls) == 1
+
+
+def test_async_followers_get_the_leaders_error():
+    flight = SingleFlight()
+
+    async def afn():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        return await asyncio.gather(*[flight.ado('k', afn) for _ in range(3)], return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert flight.stats()['executed'] == 1
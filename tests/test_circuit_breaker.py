@@ -0,0 +1,135 @@
+"""
+Unit tests for CircuitBreaker state transitions and provider_get's bookkeeping (no network)
+"""
+import pytest
+
+from src.backend.utils import http_client
+from src.backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(**options):
+    return CircuitBreaker('test', **{'failure_threshold': 3, 'slow_call_seconds': 1.0, 'open_seconds': 30.0, **options})
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = make_breaker()
+    fail(breaker, 2)
+    assert breaker.snapshot()['state'] == 'closed'
+    fail(breaker)
+    snapshot = breaker.snapshot()
+    assert snapshot['state'] == 'open'
+    assert snapshot['times_opened'] == 1
+    assert snapshot['retry_in_seconds'] == 30.0
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = make_breaker()
+    fail(breaker, 2)
+    breaker.allow()
+    breaker.record(True, 0.1)
+    fail(breaker, 2)
+    assert breaker.snapshot()['state'] == 'closed'
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(True, 2.0)
+    snapshot = breaker.snapshot()
+    assert snapshot['state'] == 'open'
+    assert snapshot['slow_calls'] == 3
+
+
+def test_open_circuit_rejects_until_open_seconds_pass(clock):
+    breaker = make_breaker()
+    fail(breaker, 3)
+    clock.advance(29.9)
+    assert not breaker.allow()
+    assert breaker.snapshot()['rejected'] == 1
+    clock.advance(0.1)
+    assert breaker.allow()
+    assert breaker.snapshot()['state'] == 'half_open'
+
+
+def test_half_open_lets_through_only_the_trial_calls(clock):
+    breaker = make_breaker(half_open_max_calls=2)
+    fail(breaker, 3)
+    clock.advance(30)
+    assert breaker.allow()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_trials_close_the_circuit(clock):
+    breaker = make_breaker(half_open_max_calls=2)
+    fail(breaker, 3)
+    clock.advance(30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(True, 0.1)
+    snapshot = breaker.snapshot()
+    assert snapshot['state'] == 'closed'
+    assert snapshot['consecutive_failures'] == 0
+
+
+def test_failed_trial_reopens_for_a_full_period(clock):
+    breaker = make_breaker()
+    fail(breaker, 3)
+    clock.advance(30)
+    fail(breaker)
+    assert breaker.snapshot()['state'] == 'open'
+    assert breaker.snapshot()['times_opened'] == 2
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """A fresh breaker registry, so provider_get builds its breaker with test settings"""
+    monkeypatch.setattr(http_client, '_breakers', {})
+    monkeypatch.setattr(http_client, 'BREAKER_FAILURES', 1)
+    monkeypatch.setattr(http_client, 'BREAKER_OPEN_SECONDS', 30.0)
+    return 'test-provider'
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_provider_get_records_unexpected_exceptions(clock, monkeypatch, provider):
+    def broken_get(*args, **kwargs):
+        raise ValueError("not a RequestException")
+
+    monkeypatch.setattr(http_client.session, 'get', broken_get)
+    with pytest.raises(ValueError):
+        http_client.provider_get(provider, 'http://provider.invalid')
+    assert http_client.get_breaker(provider).snapshot()['state'] == 'open'
+
+    # The half-open trial fails the same way: the slot is released and the circuit re-opens
+    clock.advance(30)
+    with pytest.raises(ValueError):
+        http_client.provider_get(provider, 'http://provider.invalid')
+    assert http_client.get_breaker(provider).snapshot()['state'] == 'open'
+    with pytest.raises(CircuitOpenError):
+        http_client.provider_get(provider, 'http://provider.invalid')
+
+    clock.advance(30)
+    monkeypatch.setattr(http_client.session, 'get', lambda *args, **kwargs: FakeResponse(200))
+    assert http_client.provider_get(provider, 'http://provider.invalid').status_code == 200
+    assert http_client.get_breaker(provider).snapshot()['state'] == 'closed'
+
+
+def test_provider_get_counts_server_errors_as_failures(clock, monkeypatch, provider):
+    monkeypatch.setattr(http_client.session, 'get', lambda *args, **kwargs: FakeResponse(503))
+    assert http_client.provider_get(provider, 'http://provider.invalid').status_code == 503
+    assert http_client.get_breaker(provider).snapshot()['state'] == 'open'
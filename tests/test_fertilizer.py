@@ -0,0 +1,86 @@
+"""
+Unit tests for BlendOptimizer, cross-checked against scipy.optimize.linprog
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import linprog
+
+from src.backend.utils.fertilizer import BlendOptimizer
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'fertilizer_products.csv')
+
+
+@pytest.fixture
+def optimizer():
+    return BlendOptimizer(pd.read_csv(PRODUCTS_PATH))
+
+
+def catalogue(fractions, costs):
+    fractions = np.asarray(fractions, dtype=float)
+    return pd.DataFrame({
+        'product': [f"product {i}" for i in range(len(fractions))],
+        'N': fractions[:, 0], 'P': fractions[:, 1], 'K': fractions[:, 2],
+        'cost_per_kg': costs
+    })
+
+
+def random_deficits(rng, n):
+    deficits = rng.uniform(0, 150, (n, 3))
+    deficits[rng.random((n, 3)) < 0.2] = 0.0  # plots already covered for some nutrients
+    return deficits
+
+
+def assert_matches_linprog(optimizer, deficits):
+    amounts, costs = optimizer.solve(deficits)
+    for deficit, amount, cost in zip(deficits, amounts, costs):
+        expected = linprog(optimizer.costs, A_ub=-optimizer.fractions, b_ub=-deficit, bounds=(0, None), method='highs')
+        assert expected.status == 0
+        assert cost == pytest.approx(expected.fun, rel=1e-12, abs=1e-12)
+        assert (amount >= 0).all()
+        assert (optimizer.fractions @ amount >= deficit - 1e-9).all()
+        assert amount @ optimizer.costs == pytest.approx(cost, rel=1e-12, abs=1e-12)
+
+
+def test_matches_linprog_on_the_shipped_catalogue(optimizer):
+    assert_matches_linprog(optimizer, random_deficits(np.random.default_rng(0), 500))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_linprog_on_random_catalogues(seed):
+    rng = np.random.default_rng(seed)
+    products = int(rng.integers(3, 9))
+    fractions = rng.uniform(0, 0.6, (products, 3)) * (rng.random((products, 3)) < 0.6)
+    fractions[:3] += np.eye(3) * 0.3  # every nutrient supplied by at least one product
+    optimizer = BlendOptimizer(catalogue(fractions, rng.uniform(1, 40, products)))
+    assert_matches_linprog(optimizer, random_deficits(rng, 50))
+
+
+def test_zero_and_negative_deficits_need_nothing(optimizer):
+    amounts, costs = optimizer.solve([[0, 0, 0], [-10, -5, 0]])
+    assert (amounts == 0).all()
+    assert (costs == 0).all()
+    assert optimizer.describe(amounts, costs) == [{"products": [], "cost": 0.0}] * 2
+
+
+def test_nan_rows_stay_nan_without_affecting_other_rows(optimizer):
+    deficits = np.array([[40.0, 20.0, 10.0], [np.nan, np.nan, np.nan], [40.0, np.nan, 10.0]])
+    amounts, costs = optimizer.solve(deficits)
+    assert np.isnan(amounts[1:]).all()
+    assert np.isnan(costs[1:]).all()
+    single_amounts, single_costs = optimizer.solve(deficits[:1])
+    np.testing.assert_array_equal(amounts[:1], single_amounts)
+    assert costs[0] == single_costs[0]
+    assert optimizer.describe(amounts, costs)[1:] == [None, None]
+
+
+def test_catalogue_missing_a_nutrient_is_rejected():
+    with pytest.raises(ValueError, match="must supply each of N, P and K"):
+        BlendOptimizer(catalogue([[0.46, 0, 0], [0.18, 0.46, 0]], [5.9, 27.0]))
+
+
+def test_negative_costs_are_rejected():
+    with pytest.raises(ValueError, match="non-negative"):
+        BlendOptimizer(catalogue([[0.46, 0, 0], [0, 0.16, 0], [0, 0, 0.6]], [5.9, -1.0, 34.0]))
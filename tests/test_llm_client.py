@@ -0,0 +1,65 @@
+"""
+Unit tests for the streaming deadline of the LLM clients (no network, no Gemini key)
+"""
+import time
+
+import pytest
+
+from src.backend.chatbot.llm_client import LLMTimeoutError, StubLLMClient
+
+
+class SlowStreamClient(StubLLMClient):
+    """Stub whose stream starts after first_delay and then sends one word every chunk_delay"""
+
+    def __init__(self, first_delay, chunk_delay, words=('one', 'two', 'three', 'four'), timeout=5.0):
+        super().__init__(timeout=timeout)
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.words = words
+
+    def generate_stream(self, prompt, purpose='default', timeout=None, first_chunk_timeout=None):
+        timeout = self._timeout(timeout)
+
+        def open_stream():
+            time.sleep(self.first_delay)
+            for word in self.words:
+                yield word
+                time.sleep(self.chunk_delay)
+
+        return self._stream(open_stream, purpose, self._first_chunk_timeout(first_chunk_timeout, timeout))
+
+
+def test_started_stream_runs_past_first_chunk_deadline():
+    client = SlowStreamClient(first_delay=0.01, chunk_delay=0.05)
+    start = time.monotonic()
+    chunks = list(client.generate_stream('prompt', 'general_query', first_chunk_timeout=0.1))
+    assert chunks == ['one', 'two', 'three', 'four']
+    assert time.monotonic() - start > 0.1
+    assert client.stats()['outcomes'] == {'ok': 1, 'error': 0, 'timeout': 0}
+
+
+def test_stream_that_does_not_start_times_out():
+    client = SlowStreamClient(first_delay=0.5, chunk_delay=0.0)
+    start = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        list(client.generate_stream('prompt', 'general_query', first_chunk_timeout=0.05))
+    assert time.monotonic() - start < 0.4
+    assert client.stats()['outcomes']['timeout'] == 1
+
+
+def test_no_time_left_fails_before_calling():
+    with pytest.raises(LLMTimeoutError):
+        StubLLMClient().generate_stream('prompt', first_chunk_timeout=0)
+
+
+def test_errors_inside_the_stream_reach_the_caller():
+    client = StubLLMClient(fail_purposes={'general_query'})
+    with pytest.raises(RuntimeError):
+        list(client.generate_stream('prompt', 'general_query'))
+    assert client.stats()['outcomes']['error'] == 1
+
+
+def test_stub_stream_reassembles_its_canned_reply():
+    client = StubLLMClient()
+    text = ''.join(client.generate_stream('prompt', 'general_query', first_chunk_timeout=1.0))
+    assert text.strip() == client.generate('prompt', 'general_query')
@@ -0,0 +1,169 @@
+"""
+Unit tests for TokenBucket and Prefetcher (hot ranking, refresh rounds, backoff, shared counts, leadership)
+with a fake clock and fake loaders
+"""
+import pytest
+
+from src.backend.utils import prefetch
+from src.backend.utils.cache import TTLCache
+from src.backend.utils.prefetch import Prefetcher, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_spaces_calls(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_up_to_the_burst(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.reserve()
+    clock.advance(60)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+class FakeLoader:
+    """Loads `{'key': key}`, or raises for keys in `failing`; records the keys it loaded"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.loaded = []
+
+    def __call__(self, key):
+        self.loaded.append(key)
+        if key in self.failing:
+            raise RuntimeError("upstream down")
+        return {'key': key}
+
+
+def make_prefetcher(cache, loader, **options):
+    # A large bucket, so run_once never waits on the real clock
+    prefetcher = Prefetcher('test', **{'interval': 60.0, 'lead_seconds': 30.0, 'rate': 1000, 'burst': 1000,
+                                       'half_life': 3600.0, **options})
+    prefetcher.register(cache, loader)
+    return prefetcher
+
+
+def test_hot_ranks_by_decayed_request_count(clock):
+    cache = TTLCache('test', ttl=600)
+    prefetcher = make_prefetcher(cache, FakeLoader(), top_n=2)
+    for _ in range(4):
+        prefetcher.track(cache, 'old')
+    clock.advance(2 * 3600)  # two half-lives: 'old' now counts as 1
+    for _ in range(2):
+        prefetcher.track(cache, 'new')
+    prefetcher.track(cache, 'once')
+    hot = prefetcher.hot()
+    assert [key for _, _, key in hot] == ['new', 'old']
+    assert [score for score, _, _ in hot] == [pytest.approx(2.0), pytest.approx(1.0)]
+
+
+def test_untracked_caches_are_not_ranked(clock):
+    cache, other = TTLCache('test', ttl=600), TTLCache('other', ttl=600)
+    prefetcher = make_prefetcher(cache, FakeLoader())
+    prefetcher.track(other, 'k')
+    assert prefetcher.hot() == []
+
+
+def test_run_once_refreshes_missing_and_expiring_keys_only(clock):
+    cache = TTLCache('test', ttl=600)
+    loader = FakeLoader()
+    prefetcher = make_prefetcher(cache, loader)
+    cache.set('fresh', {'key': 'fresh'})
+    cache.set('expiring', {'key': 'expiring'})
+    clock.advance(580)
+    cache.set('fresh', {'key': 'fresh'})
+    for key in ('fresh', 'expiring', 'missing'):
+        prefetcher.track(cache, key)
+    assert prefetcher.run_once() == 2
+    assert sorted(loader.loaded) == ['expiring', 'missing']
+    assert cache.entry_age('missing') == 0
+    cache.get('missing')
+    assert cache.stats()['hits_by_source'] == {Prefetcher.SOURCE: 1}
+    assert prefetcher.stats()['prefetched'] == 2
+
+
+def test_failing_key_backs_off_doubling_up_to_the_cap(clock):
+    cache = TTLCache('test', ttl=600)
+    loader = FakeLoader(failing={'k'})
+    prefetcher = make_prefetcher(cache, loader, max_backoff=200.0)
+    prefetcher.track(cache, 'k')
+
+    for delay in (60.0, 120.0, 200.0, 200.0):
+        prefetcher.run_once()
+        calls = len(loader.loaded)
+        clock.advance(delay - 1)
+        prefetcher.run_once()
+        assert len(loader.loaded) == calls  # still backing off
+        clock.advance(1)
+
+    stats = prefetcher.stats()
+    assert stats['failures'] == 4
+    assert stats['backed_off'] == 4
+    assert stats['keys_backing_off'] == 1
+
+
+def test_success_clears_the_backoff(clock):
+    cache = TTLCache('test', ttl=600)
+    loader = FakeLoader(failing={'k'})
+    prefetcher = make_prefetcher(cache, loader)
+    prefetcher.track(cache, 'k')
+    prefetcher.run_once()
+    clock.advance(60)
+    loader.failing.clear()
+    assert prefetcher.run_once() == 1
+    assert prefetcher.stats()['keys_backing_off'] == 0
+
+
+def test_prefetchers_sharing_a_db_merge_their_counts(clock, tmp_path):
+    path = str(tmp_path / 'prefetch.db')
+    cache = TTLCache('test', ttl=600)
+    first = make_prefetcher(cache, FakeLoader(), top_n=2, db_path=path, flush_interval=0)
+    second = make_prefetcher(cache, FakeLoader(), top_n=2, db_path=path, flush_interval=0)
+    first.track(cache, 'a')
+    first.track(cache, 'b')
+    second.track(cache, 'b')
+    second.track(cache, 'c')
+    second.track(cache, 'c')
+    second.track(cache, 'c')
+    for prefetcher in (first, second):
+        hot = prefetcher.hot()
+        assert [key for _, _, key in hot] == ['c', 'b']
+        assert [score for score, _, _ in hot] == [pytest.approx(3.0), pytest.approx(2.0)]
+    assert first.stats()['tracked'] == 3
+
+
+def test_counts_wait_for_the_flush_interval(clock, tmp_path):
+    path = str(tmp_path / 'prefetch.db')
+    cache = TTLCache('test', ttl=600)
+    first = make_prefetcher(cache, FakeLoader(), db_path=path, flush_interval=10.0)
+    second = make_prefetcher(cache, FakeLoader(), db_path=path, flush_interval=10.0)
+    first.track(cache, 'a')
+    assert second.hot() == []
+    clock.advance(10)
+    first.track(cache, 'a')
+    [(score, _, key)] = second.hot()
+    assert key == 'a' and score == pytest.approx(2.0, rel=1e-2)
+
+
+@pytest.mark.skipif(prefetch.fcntl is None, reason="advisory locks need fcntl")
+def test_only_one_prefetcher_takes_the_lock(tmp_path):
+    path = str(tmp_path / 'locks' / 'prefetch.lock')
+    first, second = Prefetcher('test'), Prefetcher('test')
+    assert first._acquire_leadership(path)
+    assert first._acquire_leadership(path)  # already the leader
+    assert not second._acquire_leadership(path)
+    assert not second.start(lock_path=path)
+    first._lock_file.close()  # what the OS does when the leader's process exits
+    assert second._acquire_leadership(path)
+    second._lock_file.close()
+
+
+def test_without_fcntl_every_process_prefetches(monkeypatch, tmp_path):
+    monkeypatch.setattr(prefetch, 'fcntl', None)
+    path = str(tmp_path / 'prefetch.lock')
+    assert Prefetcher('test')._acquire_leadership(path)
+    assert Prefetcher('test')._acquire_leadership(path)